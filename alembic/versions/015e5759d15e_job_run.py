@@ -0,0 +1,48 @@
+"""job run checkpoints
+
+Revision ID: 015e5759d15e
+Revises: ab2a6f94e9a1
+Create Date: 2025-06-30 10:27:03.558142
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '015e5759d15e'
+down_revision: Union[str, None] = 'ab2a6f94e9a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Progress of chunked batch jobs, so an interrupted run can resume."""
+    op.create_table(
+        'job_run',
+        sa.Column('run_id', sa.Integer(), nullable=False),
+        sa.Column('job_name', sa.String(), nullable=False),
+        sa.Column('params', postgresql.JSONB(), nullable=False),
+        sa.Column('status', sa.String(), server_default='running', nullable=False),
+        sa.Column('last_key', sa.BigInteger(), nullable=True),
+        sa.Column('processed', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('started_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('run_id'),
+    )
+    op.create_index(
+        'ix_job_run_job_name_running',
+        'job_run',
+        ['job_name', 'run_id'],
+        postgresql_where=sa.text("status = 'running'"),
+    )
+
+
+def downgrade() -> None:
+    """Drop job run checkpoints."""
+    op.drop_index('ix_job_run_job_name_running', table_name='job_run')
+    op.drop_table('job_run')
@@ -0,0 +1,46 @@
+"""idempotency key
+
+Revision ID: 0c3d5785e880
+Revises: a9a2a47da13e
+Create Date: 2025-06-28 09:42:17.305614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c3d5785e880'
+down_revision: Union[str, None] = 'a9a2a47da13e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Stored responses for money-moving requests, unique per (scope, key)."""
+    op.create_table(
+        'idempotency_key',
+        sa.Column('scope', sa.String(), nullable=False),
+        sa.Column('idempotency_key', sa.String(), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('response', postgresql.JSONB(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('scope', 'idempotency_key'),
+    )
+    # Only client-supplied keys expire; Razorpay payment ids are kept for good
+    op.create_index(
+        'ix_idempotency_key_expires_at',
+        'idempotency_key',
+        ['expires_at'],
+        postgresql_where=sa.text('expires_at IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Drop the idempotency key store."""
+    op.drop_index('ix_idempotency_key_expires_at', table_name='idempotency_key')
+    op.drop_table('idempotency_key')
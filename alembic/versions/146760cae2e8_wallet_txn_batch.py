@@ -0,0 +1,89 @@
+"""wallet txn batch
+
+Revision ID: 146760cae2e8
+Revises: 9070852a9c55
+Create Date: 2025-06-17 09:41:05.772301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '146760cae2e8'
+down_revision: Union[str, None] = '9070852a9c55'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add process_wallet_transaction_batch."""
+    op.execute("DROP FUNCTION IF EXISTS process_wallet_transaction_batch(JSONB);")
+
+    # p_items is a JSON array of
+    # {wallet_id, transaction_type, amount, source, remark, additional_info}.
+    # Items are applied in array order; any failure aborts the whole call and
+    # the error message is prefixed with the zero-based index of the bad item.
+    op.execute("""
+    CREATE OR REPLACE FUNCTION process_wallet_transaction_batch(p_items JSONB)
+    RETURNS TABLE(
+        item_index INTEGER,
+        transaction_id INTEGER,
+        wallet_id INTEGER,
+        transaction_type VARCHAR,
+        amount FLOAT,
+        previous_balance FLOAT,
+        current_balance FLOAT,
+        wallet_monthly_balance FLOAT,
+        wallet_fixed_balance FLOAT,
+        source VARCHAR,
+        remark VARCHAR,
+        additional_info VARCHAR,
+        updated_at TIMESTAMP
+    ) AS $$
+    #variable_conflict use_column
+    DECLARE
+        v_item RECORD;
+        v_index INTEGER;
+    BEGIN
+        -- Lock every wallet touched by the batch up front, in wallet_id order,
+        -- so concurrent batches over overlapping wallets cannot deadlock
+        PERFORM 1
+        FROM wallet w
+        WHERE w.wallet_id IN (
+            SELECT (e->>'wallet_id')::INTEGER FROM jsonb_array_elements(p_items) e
+        )
+        ORDER BY w.wallet_id
+        FOR UPDATE;
+
+        FOR v_item IN
+            SELECT (t.ord - 1)::INTEGER AS idx, t.item
+            FROM jsonb_array_elements(p_items) WITH ORDINALITY AS t(item, ord)
+            ORDER BY t.ord
+        LOOP
+            v_index := v_item.idx;
+
+            -- Row locks are already held, so this does not wait
+            RETURN QUERY
+            SELECT v_index, f.*
+            FROM process_wallet_transaction_full(
+                (v_item.item->>'wallet_id')::INTEGER,
+                v_item.item->>'transaction_type',
+                (v_item.item->>'amount')::FLOAT,
+                v_item.item->>'source',
+                v_item.item->>'remark',
+                v_item.item->>'additional_info'
+            ) f;
+        END LOOP;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE EXCEPTION 'batch item %: %', v_index, SQLERRM USING ERRCODE = SQLSTATE;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+def downgrade() -> None:
+    """Drop process_wallet_transaction_batch."""
+    op.execute("DROP FUNCTION IF EXISTS process_wallet_transaction_batch(JSONB);")
@@ -0,0 +1,47 @@
+"""plan catalog notify
+
+Revision ID: 1587728e38aa
+Revises: 185e34be7a8e
+Create Date: 2025-07-04 09:36:47.129580
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1587728e38aa'
+down_revision: Union[str, None] = '185e34be7a8e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """NOTIFY plan_catalog whenever plan or plan_feature changes."""
+    # Statement-level and sent on commit; Postgres folds identical payloads
+    # within a transaction, so a bulk edit wakes listeners once per table
+    op.execute("""
+    CREATE OR REPLACE FUNCTION notify_plan_catalog()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        PERFORM pg_notify('plan_catalog', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    for table in ("plan", "plan_feature"):
+        op.execute(f"""
+        CREATE TRIGGER {table}_notify_plan_catalog
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_plan_catalog();
+        """)
+
+
+def downgrade() -> None:
+    """Drop the plan catalog triggers."""
+    for table in ("plan", "plan_feature"):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_plan_catalog ON {table};")
+    op.execute("DROP FUNCTION IF EXISTS notify_plan_catalog();")
@@ -0,0 +1,223 @@
+"""one active subscription
+
+Revision ID: 185e34be7a8e
+Revises: e37feff85517
+Create Date: 2025-07-03 14:05:22.816430
+
+"""
+import importlib.util
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '185e34be7a8e'
+down_revision: Union[str, None] = 'e37feff85517'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SUBSCRIBE_TO_PLAN = """
+CREATE OR REPLACE FUNCTION subscribe_to_plan(p_wallet_id INT, p_plan_id INT)
+RETURNS TABLE(
+    subscription_id INT,
+    wallet_id INT,
+    plan_id INT,
+    status TEXT,
+    start_time TIMESTAMP,
+    end_time TIMESTAMP,
+    message TEXT
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_plan_amount BIGINT;
+    v_duration INT;
+    v_start TIMESTAMP := NOW();
+    v_end TIMESTAMP;
+    v_subscription_id INT;
+BEGIN
+    -- Validate plan
+    SELECT p.plan_amount, p.duration_in_days INTO v_plan_amount, v_duration
+    FROM plan p
+    WHERE p.plan_id = p_plan_id AND p.is_active = TRUE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Invalid or inactive plan';
+    END IF;
+
+    v_end := v_start + make_interval(days => v_duration);
+
+    -- Credit and lock the wallet in one step; concurrent subscribes, renewals
+    -- and cancels on this wallet queue here
+    UPDATE wallet w
+    SET monthly_balance = w.monthly_balance + v_plan_amount,
+        updated_at = NOW()
+    WHERE w.wallet_id = p_wallet_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Wallet not found';
+    END IF;
+
+    -- Replace the active subscription; created reads deactivated's count so
+    -- the old row is inactive before the new one reaches the unique index
+    WITH deactivated AS (
+        UPDATE subscription s
+        SET is_active = FALSE
+        WHERE s.wallet_id = p_wallet_id AND s.is_active
+        RETURNING s.subscription_id, s.plan_id
+    ),
+    created AS (
+        INSERT INTO subscription (wallet_id, plan_id, is_active, start_time, end_time, is_billed)
+        SELECT p_wallet_id, p_plan_id, TRUE, v_start, v_end, TRUE
+        FROM (SELECT count(*) FROM deactivated) d
+        RETURNING subscription.subscription_id
+    ),
+    logged AS (
+        INSERT INTO subscription_history (subscription_id, wallet_id, plan_id, status, comment)
+        SELECT d.subscription_id, p_wallet_id, d.plan_id, 'cancelled', 'Auto-cancelled before new subscription'
+        FROM deactivated d
+        UNION ALL
+        SELECT c.subscription_id, p_wallet_id, p_plan_id, 'activated', 'Subscribed to new plan'
+        FROM created c
+    )
+    SELECT c.subscription_id INTO v_subscription_id
+    FROM created c;
+
+    RETURN QUERY SELECT
+        v_subscription_id,
+        p_wallet_id,
+        p_plan_id,
+        'active'::TEXT,
+        v_start,
+        v_end,
+        'Subscription successful'::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+COMPLETE_SUBSCRIPTION = """
+CREATE OR REPLACE PROCEDURE complete_subscription(p_subscription_id INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_wallet_id INT;
+    v_plan_id INT;
+    v_amount BIGINT;
+    v_duration INT;
+    v_now TIMESTAMP := NOW();
+BEGIN
+    -- Get wallet_id and plan_id from subscription
+    SELECT wallet_id, plan_id INTO v_wallet_id, v_plan_id
+    FROM subscription
+    WHERE subscription_id = p_subscription_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Subscription not found';
+    END IF;
+
+    -- Get plan details
+    SELECT plan_amount, duration_in_days INTO v_amount, v_duration
+    FROM plan
+    WHERE plan_id = v_plan_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Plan not found';
+    END IF;
+
+    -- Wallet before its subscriptions, as subscribe_to_plan locks them
+    PERFORM 1 FROM wallet WHERE wallet_id = v_wallet_id FOR UPDATE;
+
+    -- Call existing wallet transaction processor
+    PERFORM process_wallet_transaction(
+        v_wallet_id,
+        'credit',
+        v_amount,
+        'Subscription',
+        CONCAT('Subscription for plan ', v_plan_id),
+        CONCAT('subscription_id=', p_subscription_id)
+    );
+
+    -- This subscription replaces the wallet's active one
+    WITH deactivated AS (
+        UPDATE subscription s
+        SET is_active = FALSE
+        WHERE s.wallet_id = v_wallet_id AND s.is_active AND s.subscription_id <> p_subscription_id
+        RETURNING s.subscription_id, s.plan_id
+    )
+    INSERT INTO subscription_history (subscription_id, wallet_id, plan_id, status, comment)
+    SELECT d.subscription_id, v_wallet_id, d.plan_id, 'cancelled', 'Auto-cancelled before new subscription'
+    FROM deactivated d;
+
+    UPDATE subscription
+    SET
+        is_billed = TRUE,
+        is_active = TRUE,
+        start_time = v_now,
+        end_time = v_now + make_interval(days => v_duration)
+    WHERE subscription_id = p_subscription_id;
+
+END;
+$$;
+"""
+
+# All but the newest active subscription per wallet, which the unique index would reject
+DEACTIVATE_DUPLICATES = """
+WITH duplicates AS (
+    UPDATE subscription s
+    SET is_active = FALSE
+    FROM (
+        SELECT wallet_id, max(subscription_id) AS keep_id
+        FROM subscription
+        WHERE is_active
+        GROUP BY wallet_id
+        HAVING count(*) > 1
+    ) k
+    WHERE s.wallet_id = k.wallet_id AND s.is_active AND s.subscription_id <> k.keep_id
+    RETURNING s.subscription_id, s.wallet_id, s.plan_id
+)
+INSERT INTO subscription_history (subscription_id, wallet_id, plan_id, status, comment)
+SELECT subscription_id, wallet_id, plan_id, 'cancelled', 'Auto-cancelled duplicate active subscription'
+FROM duplicates;
+"""
+
+
+def _money_in_paise():
+    """The b369fdc51172 migration module, whose function bodies downgrade restores."""
+    path = os.path.join(os.path.dirname(__file__), "b369fdc51172_money_in_paise.py")
+    spec = importlib.util.spec_from_file_location("money_in_paise", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upgrade() -> None:
+    """At most one active subscription per wallet, and a locked single-pass subscribe_to_plan."""
+    op.execute(SUBSCRIBE_TO_PLAN)
+    op.execute(COMPLETE_SUBSCRIPTION)
+    op.execute(DEACTIVATE_DUPLICATES)
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block; the
+    # unique index replaces the plain one on the same rows
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_subscription_wallet_id_active "
+            "ON subscription (wallet_id) WHERE is_active;"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_subscription_wallet_id_active;")
+
+
+def downgrade() -> None:
+    """Restore the plain index and the previous function bodies."""
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_subscription_wallet_id_active "
+            "ON subscription (wallet_id) WHERE is_active;"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_subscription_wallet_id_active;")
+
+    previous = _money_in_paise()
+    op.execute(previous.SUBSCRIBE_TO_PLAN.format(money="BIGINT"))
+    op.execute(previous.COMPLETE_SUBSCRIPTION.format(money="BIGINT"))
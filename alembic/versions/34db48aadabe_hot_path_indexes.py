@@ -0,0 +1,49 @@
+"""hot path indexes
+
+Revision ID: 34db48aadabe
+Revises: 146760cae2e8
+Create Date: 2025-06-18 11:05:52.190634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '34db48aadabe'
+down_revision: Union[str, None] = '146760cae2e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, definition) - built without blocking writes on live tables
+INDEXES = [
+    # History endpoint keyset order and the per-wallet ledger scans
+    ("ix_wallet_transaction_wallet_id_updated_at", "wallet_transaction (wallet_id, updated_at, transaction_id)"),
+    # Active-subscription lookups in subscribe/renew/cancel
+    ("ix_subscription_wallet_id_active", "subscription (wallet_id) WHERE is_active"),
+    ("ix_plan_plan_id_active", "plan (plan_id) WHERE is_active"),
+    ("ix_partner_partner_email", "partner (partner_email)"),
+    ("ix_partner_transaction_partner_id", "partner_transaction (partner_id)"),
+    ("ix_partner_transaction_transaction_id", "partner_transaction (transaction_id)"),
+    ("ix_settlement_partner_id_status", "settlement (partner_id, settlement_status)"),
+    ("ix_plan_feature_plan_id", "plan_feature (plan_id)"),
+    ("ix_subscription_history_wallet_id", "subscription_history (wallet_id)"),
+]
+
+
+def upgrade() -> None:
+    """Index the foreign keys and predicates used by the API and procedures."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition};")
+
+
+def downgrade() -> None:
+    """Drop the hot path indexes."""
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
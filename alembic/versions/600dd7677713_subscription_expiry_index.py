@@ -0,0 +1,34 @@
+"""subscription expiry index
+
+Revision ID: 600dd7677713
+Revises: 015e5759d15e
+Create Date: 2025-07-01 08:48:31.902746
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '600dd7677713'
+down_revision: Union[str, None] = '015e5759d15e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Due-queue for app.jobs.expiry_sweeper: active subscriptions by end_time."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_subscription_end_time_active "
+            "ON subscription (end_time) WHERE is_active;"
+        )
+
+
+def downgrade() -> None:
+    """Drop the expiry index."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_subscription_end_time_active;")
@@ -0,0 +1,107 @@
+"""complete subscription wallet lock
+
+Revision ID: 83be5b842b23
+Revises: bcc581162d9d
+Create Date: 2025-07-07 09:40:31.552906
+
+"""
+import importlib.util
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '83be5b842b23'
+down_revision: Union[str, None] = 'bcc581162d9d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COMPLETE_SUBSCRIPTION = """
+CREATE OR REPLACE PROCEDURE complete_subscription(p_subscription_id INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_wallet_id INT;
+    v_plan_id INT;
+    v_amount BIGINT;
+    v_duration INT;
+    v_now TIMESTAMP := NOW();
+BEGIN
+    -- Get wallet_id and plan_id from subscription
+    SELECT wallet_id, plan_id INTO v_wallet_id, v_plan_id
+    FROM subscription
+    WHERE subscription_id = p_subscription_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Subscription not found';
+    END IF;
+
+    -- Get plan details
+    SELECT plan_amount, duration_in_days INTO v_amount, v_duration
+    FROM plan
+    WHERE plan_id = v_plan_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Plan not found';
+    END IF;
+
+    -- Wallet before its subscriptions, as subscribe_to_plan locks them. NO
+    -- KEY UPDATE, like every wallet lock taken ahead of its balance slots, so
+    -- a sharded credit holding a slot can still take KEY SHARE on the wallet
+    PERFORM 1 FROM wallet WHERE wallet_id = v_wallet_id FOR NO KEY UPDATE;
+
+    -- Call existing wallet transaction processor
+    PERFORM process_wallet_transaction(
+        v_wallet_id,
+        'credit',
+        v_amount,
+        'Subscription',
+        CONCAT('Subscription for plan ', v_plan_id),
+        CONCAT('subscription_id=', p_subscription_id)
+    );
+
+    -- This subscription replaces the wallet's active one
+    WITH deactivated AS (
+        UPDATE subscription s
+        SET is_active = FALSE
+        WHERE s.wallet_id = v_wallet_id AND s.is_active AND s.subscription_id <> p_subscription_id
+        RETURNING s.subscription_id, s.plan_id
+    )
+    INSERT INTO subscription_history (subscription_id, wallet_id, plan_id, status, comment)
+    SELECT d.subscription_id, v_wallet_id, d.plan_id, 'cancelled', 'Auto-cancelled before new subscription'
+    FROM deactivated d;
+
+    UPDATE subscription
+    SET
+        is_billed = TRUE,
+        is_active = TRUE,
+        start_time = v_now,
+        end_time = v_now + make_interval(days => v_duration)
+    WHERE subscription_id = p_subscription_id;
+
+END;
+$$;
+"""
+
+
+def _migration(filename: str):
+    """A previous migration module, whose function bodies downgrade restores."""
+    path = os.path.join(os.path.dirname(__file__), filename)
+    spec = importlib.util.spec_from_file_location(filename[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upgrade() -> None:
+    """Lock the wallet FOR NO KEY UPDATE in complete_subscription, as 1683e9db6a13 does elsewhere."""
+    op.execute(COMPLETE_SUBSCRIPTION)
+
+
+def downgrade() -> None:
+    """Restore the FOR UPDATE body."""
+    op.execute(_migration("185e34be7a8e_one_active_subscription.py").COMPLETE_SUBSCRIPTION)
@@ -0,0 +1,49 @@
+"""wallet balance checkpoint
+
+Revision ID: 86111e18de94
+Revises: b19dd9bd5ccb
+Create Date: 2025-06-25 09:30:18.247715
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '86111e18de94'
+down_revision: Union[str, None] = 'b19dd9bd5ccb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add wallet_balance_checkpoint and the ledger index used to replay from it."""
+    op.create_table(
+        'wallet_balance_checkpoint',
+        sa.Column('checkpoint_id', sa.Integer(), nullable=False),
+        sa.Column('wallet_id', sa.Integer(), nullable=False),
+        sa.Column('checkpoint_at', sa.DateTime(), nullable=False),
+        sa.Column('last_transaction_id', sa.Integer(), nullable=True),
+        sa.Column('monthly_balance', sa.BigInteger(), nullable=False),
+        sa.Column('fixed_balance', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['wallet_id'], ['wallet.wallet_id']),
+        sa.PrimaryKeyConstraint('checkpoint_id'),
+    )
+    op.create_index(
+        'ix_wallet_balance_checkpoint_wallet_id_checkpoint_at',
+        'wallet_balance_checkpoint',
+        ['wallet_id', 'checkpoint_at'],
+    )
+    # Delta rows after a checkpoint are found by transaction_id: the
+    # checkpoint job holds the wallet's slots while it reads the max, so no
+    # lower id commits after it (updated_at is not commit-ordered)
+    op.execute("CREATE INDEX ix_wallet_transaction_wallet_id_transaction_id ON wallet_transaction (wallet_id, transaction_id);")
+
+
+def downgrade() -> None:
+    """Drop balance checkpoints."""
+    op.execute("DROP INDEX IF EXISTS ix_wallet_transaction_wallet_id_transaction_id;")
+    op.drop_index('ix_wallet_balance_checkpoint_wallet_id_checkpoint_at', table_name='wallet_balance_checkpoint')
+    op.drop_table('wallet_balance_checkpoint')
@@ -0,0 +1,329 @@
+"""wallet txn sharded credit flag
+
+Revision ID: 8c86a6d9b37f
+Revises: 1683e9db6a13
+Create Date: 2025-07-06 12:15:07.918342
+
+"""
+import importlib.util
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c86a6d9b37f'
+down_revision: Union[str, None] = '1683e9db6a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+DROP_FUNCTIONS = """
+DROP FUNCTION IF EXISTS process_wallet_transaction_batch(JSONB);
+DROP FUNCTION IF EXISTS process_wallet_transaction_full(INTEGER, VARCHAR, BIGINT, VARCHAR, VARCHAR, VARCHAR);
+"""
+
+PROCESS_WALLET_TRANSACTION_FULL = """
+CREATE OR REPLACE FUNCTION process_wallet_transaction_full(
+    p_wallet_id INTEGER,
+    p_transaction_type VARCHAR,
+    p_amount BIGINT,
+    p_source VARCHAR DEFAULT NULL,
+    p_remark VARCHAR DEFAULT NULL,
+    p_additional_info VARCHAR DEFAULT NULL
+)
+RETURNS TABLE(
+    transaction_id INTEGER,
+    wallet_id INTEGER,
+    transaction_type VARCHAR,
+    amount BIGINT,
+    previous_balance BIGINT,
+    current_balance BIGINT,
+    wallet_monthly_balance BIGINT,
+    wallet_fixed_balance BIGINT,
+    source VARCHAR,
+    remark VARCHAR,
+    additional_info VARCHAR,
+    updated_at TIMESTAMP,
+    sharded_credit BOOLEAN
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_shards INTEGER;
+    v_slot INTEGER;
+    v_sharded_credit BOOLEAN := FALSE;
+    v_monthly_balance BIGINT;
+    v_fixed_balance BIGINT;
+    v_wallet_fixed_balance BIGINT;
+    v_shard_fixed_balance BIGINT := 0;
+    v_previous_balance BIGINT;
+    v_new_monthly_balance BIGINT;
+    v_new_fixed_balance BIGINT;
+    v_new_current_balance BIGINT;
+    v_remaining_amount BIGINT;
+    v_from_shards BIGINT;
+    v_take BIGINT;
+    v_shard RECORD;
+    v_transaction_id INTEGER;
+    v_updated_at TIMESTAMP;
+    v_now TIMESTAMP;
+BEGIN
+    SELECT w.balance_shards INTO v_shards
+    FROM wallet w
+    WHERE w.wallet_id = p_wallet_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Wallet with ID % not found', p_wallet_id;
+    END IF;
+
+    IF v_shards > 0 AND LOWER(p_transaction_type) = 'credit' THEN
+        -- Sharded credit: lock one random slot instead of the wallet row so
+        -- concurrent credits to a hot wallet do not queue behind each other
+        v_slot := floor(random() * v_shards)::INTEGER;
+
+        UPDATE wallet_balance_shard s
+        SET fixed_balance = s.fixed_balance + p_amount,
+            updated_at = NOW()
+        WHERE s.wallet_id = p_wallet_id AND s.slot = v_slot;
+
+        -- The slot is gone if the shard count was lowered meanwhile; fall
+        -- back to the locked path below
+        v_sharded_credit := FOUND;
+    END IF;
+
+    IF v_sharded_credit THEN
+        -- Balances as seen by this transaction; credits to other slots may
+        -- commit concurrently, so previous_balance is not serialised here
+        SELECT w.monthly_balance,
+               w.fixed_balance + COALESCE((
+                   SELECT SUM(s.fixed_balance) FROM wallet_balance_shard s WHERE s.wallet_id = w.wallet_id
+               ), 0)
+        INTO v_new_monthly_balance, v_new_fixed_balance
+        FROM wallet w
+        WHERE w.wallet_id = p_wallet_id;
+
+        v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+        v_previous_balance := v_new_current_balance - p_amount;
+    ELSE
+        -- Get current wallet balances with row-level lock. NO KEY UPDATE
+        -- still serialises writers but not the KEY SHARE a sharded credit's
+        -- ledger insert takes on the wallet while holding its slot
+        SELECT w.monthly_balance, w.fixed_balance, w.balance_shards
+        INTO v_monthly_balance, v_wallet_fixed_balance, v_shards
+        FROM wallet w
+        WHERE w.wallet_id = p_wallet_id
+        FOR NO KEY UPDATE;
+
+        IF v_shards > 0 THEN
+            -- Lock every slot, in slot order like compaction, for a stable total
+            PERFORM 1
+            FROM wallet_balance_shard s
+            WHERE s.wallet_id = p_wallet_id
+            ORDER BY s.slot
+            FOR UPDATE;
+
+            SELECT COALESCE(SUM(s.fixed_balance), 0) INTO v_shard_fixed_balance
+            FROM wallet_balance_shard s
+            WHERE s.wallet_id = p_wallet_id;
+        END IF;
+
+        v_fixed_balance := v_wallet_fixed_balance + v_shard_fixed_balance;
+
+        -- Read under the wallet lock, unlike NOW() (transaction start), so a
+        -- wallet's updated_at, the balance cache version, follows commit order
+        v_now := clock_timestamp();
+
+        -- Calculate previous total balance
+        v_previous_balance := v_monthly_balance + v_fixed_balance;
+
+        -- Process based on transaction type
+        IF LOWER(p_transaction_type) = 'credit' THEN
+            -- For credit, add to fixed balance
+            v_new_monthly_balance := v_monthly_balance;
+            v_new_fixed_balance := v_fixed_balance + p_amount;
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSIF LOWER(p_transaction_type) = 'debit' THEN
+            -- Check if sufficient balance exists
+            IF v_previous_balance < p_amount THEN
+                RAISE EXCEPTION 'Insufficient balance. Available: %, Required: %', v_previous_balance, p_amount;
+            END IF;
+
+            -- Deduct from monthly balance first, then fixed balance
+            v_remaining_amount := p_amount;
+
+            IF v_monthly_balance >= v_remaining_amount THEN
+                v_new_monthly_balance := v_monthly_balance - v_remaining_amount;
+                v_new_fixed_balance := v_fixed_balance;
+            ELSE
+                v_remaining_amount := v_remaining_amount - v_monthly_balance;
+                v_new_monthly_balance := 0;
+                v_new_fixed_balance := v_fixed_balance - v_remaining_amount;
+            END IF;
+
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSE
+            RAISE EXCEPTION 'Invalid transaction type. Must be either credit or debit, got: %', p_transaction_type;
+        END IF;
+
+        -- Fixed balance is drawn from the wallet row first, then the slots
+        v_from_shards := GREATEST(v_fixed_balance - v_new_fixed_balance - v_wallet_fixed_balance, 0);
+        v_remaining_amount := v_from_shards;
+
+        IF v_from_shards > 0 THEN
+            FOR v_shard IN
+                SELECT s.slot, s.fixed_balance
+                FROM wallet_balance_shard s
+                WHERE s.wallet_id = p_wallet_id AND s.fixed_balance > 0
+                ORDER BY s.slot
+            LOOP
+                EXIT WHEN v_remaining_amount = 0;
+                v_take := LEAST(v_shard.fixed_balance, v_remaining_amount);
+
+                UPDATE wallet_balance_shard s
+                SET fixed_balance = s.fixed_balance - v_take,
+                    updated_at = v_now
+                WHERE s.wallet_id = p_wallet_id AND s.slot = v_shard.slot;
+
+                v_remaining_amount := v_remaining_amount - v_take;
+            END LOOP;
+        END IF;
+
+        -- Update wallet balances
+        UPDATE wallet w
+        SET
+            monthly_balance = v_new_monthly_balance,
+            fixed_balance = v_new_fixed_balance - v_shard_fixed_balance + v_from_shards,
+            updated_at = v_now
+        WHERE w.wallet_id = p_wallet_id;
+    END IF;
+
+    -- Insert wallet transaction record
+    INSERT INTO wallet_transaction (
+        wallet_id,
+        transaction_type,
+        amount,
+        previous_balance,
+        current_balance,
+        updated_at,
+        source,
+        remark,
+        additional_info
+    ) VALUES (
+        p_wallet_id,
+        LOWER(p_transaction_type),
+        p_amount,
+        v_previous_balance,
+        v_new_current_balance,
+        -- Same stamp as the wallet on the locked path
+        COALESCE(v_now, NOW()),
+        p_source,
+        p_remark,
+        p_additional_info
+    ) RETURNING wallet_transaction.transaction_id, wallet_transaction.updated_at
+    INTO v_transaction_id, v_updated_at;
+
+    RETURN QUERY SELECT
+        v_transaction_id,
+        p_wallet_id,
+        LOWER(p_transaction_type)::VARCHAR,
+        p_amount,
+        v_previous_balance,
+        v_new_current_balance,
+        v_new_monthly_balance,
+        v_new_fixed_balance,
+        p_source,
+        p_remark,
+        p_additional_info,
+        v_updated_at,
+        -- TRUE when the balances above are a snapshot, not a wallet version
+        v_sharded_credit;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PROCESS_WALLET_TRANSACTION_BATCH = """
+CREATE OR REPLACE FUNCTION process_wallet_transaction_batch(p_items JSONB)
+RETURNS TABLE(
+    item_index INTEGER,
+    transaction_id INTEGER,
+    wallet_id INTEGER,
+    transaction_type VARCHAR,
+    amount BIGINT,
+    previous_balance BIGINT,
+    current_balance BIGINT,
+    wallet_monthly_balance BIGINT,
+    wallet_fixed_balance BIGINT,
+    source VARCHAR,
+    remark VARCHAR,
+    additional_info VARCHAR,
+    updated_at TIMESTAMP,
+    sharded_credit BOOLEAN
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_item RECORD;
+    v_index INTEGER;
+BEGIN
+    -- Lock every wallet touched by the batch up front, in wallet_id order,
+    -- so concurrent batches over overlapping wallets cannot deadlock
+    PERFORM 1
+    FROM wallet w
+    WHERE w.wallet_id IN (
+        SELECT (e->>'wallet_id')::INTEGER FROM jsonb_array_elements(p_items) e
+    )
+    ORDER BY w.wallet_id
+    FOR NO KEY UPDATE;
+
+    FOR v_item IN
+        SELECT (t.ord - 1)::INTEGER AS idx, t.item
+        FROM jsonb_array_elements(p_items) WITH ORDINALITY AS t(item, ord)
+        ORDER BY t.ord
+    LOOP
+        v_index := v_item.idx;
+
+        -- Row locks are already held, so this does not wait
+        RETURN QUERY
+        SELECT v_index, f.*
+        FROM process_wallet_transaction_full(
+            (v_item.item->>'wallet_id')::INTEGER,
+            v_item.item->>'transaction_type',
+            (v_item.item->>'amount')::BIGINT,
+            v_item.item->>'source',
+            v_item.item->>'remark',
+            v_item.item->>'additional_info'
+        ) f;
+    END LOOP;
+EXCEPTION WHEN OTHERS THEN
+    RAISE EXCEPTION 'batch item %: %', v_index, SQLERRM USING ERRCODE = SQLSTATE;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _migration(filename: str):
+    """A previous migration module, whose function bodies downgrade restores."""
+    path = os.path.join(os.path.dirname(__file__), filename)
+    spec = importlib.util.spec_from_file_location(filename[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upgrade() -> None:
+    """Return sharded_credit, so callers know the balances are not a cacheable wallet version."""
+    # The return type changes, which CREATE OR REPLACE cannot do
+    op.execute(DROP_FUNCTIONS)
+    op.execute(PROCESS_WALLET_TRANSACTION_FULL)
+    op.execute(PROCESS_WALLET_TRANSACTION_BATCH)
+
+
+def downgrade() -> None:
+    """Restore the bodies without sharded_credit."""
+    previous = _migration("1683e9db6a13_wallet_lock_before_slots.py")
+    op.execute(DROP_FUNCTIONS)
+    op.execute(previous.PROCESS_WALLET_TRANSACTION_FULL)
+    op.execute(previous.PROCESS_WALLET_TRANSACTION_BATCH)
@@ -0,0 +1,275 @@
+"""wallet txn returning
+
+Revision ID: 9070852a9c55
+Revises: 6d169775c3e0
+Create Date: 2025-06-16 10:12:41.308115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9070852a9c55'
+down_revision: Union[str, None] = '6d169775c3e0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add process_wallet_transaction_full returning the ledger row and wallet balances."""
+    op.execute("DROP FUNCTION IF EXISTS process_wallet_transaction_full(INTEGER, VARCHAR, FLOAT, VARCHAR, VARCHAR, VARCHAR);")
+
+    # Same logic as process_wallet_transaction, but returns everything the API
+    # needs so the caller does not have to re-read wallet and wallet_transaction.
+    op.execute("""
+    CREATE OR REPLACE FUNCTION process_wallet_transaction_full(
+        p_wallet_id INTEGER,
+        p_transaction_type VARCHAR,
+        p_amount FLOAT,
+        p_source VARCHAR DEFAULT NULL,
+        p_remark VARCHAR DEFAULT NULL,
+        p_additional_info VARCHAR DEFAULT NULL
+    )
+    RETURNS TABLE(
+        transaction_id INTEGER,
+        wallet_id INTEGER,
+        transaction_type VARCHAR,
+        amount FLOAT,
+        previous_balance FLOAT,
+        current_balance FLOAT,
+        wallet_monthly_balance FLOAT,
+        wallet_fixed_balance FLOAT,
+        source VARCHAR,
+        remark VARCHAR,
+        additional_info VARCHAR,
+        updated_at TIMESTAMP
+    ) AS $$
+    #variable_conflict use_column
+    DECLARE
+        v_monthly_balance FLOAT;
+        v_fixed_balance FLOAT;
+        v_previous_balance FLOAT;
+        v_new_monthly_balance FLOAT;
+        v_new_fixed_balance FLOAT;
+        v_new_current_balance FLOAT;
+        v_remaining_amount FLOAT;
+        v_transaction_id INTEGER;
+        v_updated_at TIMESTAMP;
+    BEGIN
+        -- Get current wallet balances with row-level lock
+        SELECT w.monthly_balance, w.fixed_balance
+        INTO v_monthly_balance, v_fixed_balance
+        FROM wallet w
+        WHERE w.wallet_id = p_wallet_id
+        FOR UPDATE;
+
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Wallet with ID % not found', p_wallet_id;
+        END IF;
+
+        -- Calculate previous total balance
+        v_previous_balance := v_monthly_balance + v_fixed_balance;
+
+        -- Process based on transaction type
+        IF LOWER(p_transaction_type) = 'credit' THEN
+            -- For credit, add to fixed balance
+            v_new_monthly_balance := v_monthly_balance;
+            v_new_fixed_balance := v_fixed_balance + p_amount;
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSIF LOWER(p_transaction_type) = 'debit' THEN
+            -- Check if sufficient balance exists
+            IF v_previous_balance < p_amount THEN
+                RAISE EXCEPTION 'Insufficient balance. Available: %, Required: %', v_previous_balance, p_amount;
+            END IF;
+
+            -- Deduct from monthly balance first, then fixed balance
+            v_remaining_amount := p_amount;
+
+            IF v_monthly_balance >= v_remaining_amount THEN
+                v_new_monthly_balance := v_monthly_balance - v_remaining_amount;
+                v_new_fixed_balance := v_fixed_balance;
+            ELSE
+                v_remaining_amount := v_remaining_amount - v_monthly_balance;
+                v_new_monthly_balance := 0;
+                v_new_fixed_balance := v_fixed_balance - v_remaining_amount;
+            END IF;
+
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSE
+            RAISE EXCEPTION 'Invalid transaction type. Must be either credit or debit, got: %', p_transaction_type;
+        END IF;
+
+        -- Update wallet balances
+        UPDATE wallet w
+        SET
+            monthly_balance = v_new_monthly_balance,
+            fixed_balance = v_new_fixed_balance,
+            updated_at = NOW()
+        WHERE w.wallet_id = p_wallet_id;
+
+        -- Insert wallet transaction record
+        INSERT INTO wallet_transaction (
+            wallet_id,
+            transaction_type,
+            amount,
+            previous_balance,
+            current_balance,
+            updated_at,
+            source,
+            remark,
+            additional_info
+        ) VALUES (
+            p_wallet_id,
+            LOWER(p_transaction_type),
+            p_amount,
+            v_previous_balance,
+            v_new_current_balance,
+            NOW(),
+            p_source,
+            p_remark,
+            p_additional_info
+        ) RETURNING wallet_transaction.transaction_id, wallet_transaction.updated_at
+        INTO v_transaction_id, v_updated_at;
+
+        RETURN QUERY SELECT
+            v_transaction_id,
+            p_wallet_id,
+            LOWER(p_transaction_type)::VARCHAR,
+            p_amount,
+            v_previous_balance,
+            v_new_current_balance,
+            v_new_monthly_balance,
+            v_new_fixed_balance,
+            p_source,
+            p_remark,
+            p_additional_info,
+            v_updated_at;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    # Keep the scalar entry point (used by complete_subscription) on the same code path
+    op.execute("""
+    CREATE OR REPLACE FUNCTION process_wallet_transaction(
+        p_wallet_id INTEGER,
+        p_transaction_type VARCHAR,
+        p_amount FLOAT,
+        p_source VARCHAR DEFAULT NULL,
+        p_remark VARCHAR DEFAULT NULL,
+        p_additional_info VARCHAR DEFAULT NULL
+    )
+    RETURNS INTEGER AS $$
+    DECLARE
+        v_transaction_id INTEGER;
+    BEGIN
+        SELECT t.transaction_id INTO v_transaction_id
+        FROM process_wallet_transaction_full(
+            p_wallet_id, p_transaction_type, p_amount, p_source, p_remark, p_additional_info
+        ) t;
+
+        RETURN v_transaction_id;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+def downgrade() -> None:
+    """Restore the standalone process_wallet_transaction and drop the returning variant."""
+    op.execute("""
+    CREATE OR REPLACE FUNCTION process_wallet_transaction(
+        p_wallet_id INTEGER,
+        p_transaction_type VARCHAR,
+        p_amount FLOAT,
+        p_source VARCHAR DEFAULT NULL,
+        p_remark VARCHAR DEFAULT NULL,
+        p_additional_info VARCHAR DEFAULT NULL
+    )
+    RETURNS INTEGER AS $$
+    DECLARE
+        v_monthly_balance FLOAT;
+        v_fixed_balance FLOAT;
+        v_previous_balance FLOAT;
+        v_new_monthly_balance FLOAT;
+        v_new_fixed_balance FLOAT;
+        v_new_current_balance FLOAT;
+        v_remaining_amount FLOAT;
+        v_transaction_id INTEGER;
+    BEGIN
+        SELECT monthly_balance, fixed_balance
+        INTO v_monthly_balance, v_fixed_balance
+        FROM wallet
+        WHERE wallet_id = p_wallet_id
+        FOR UPDATE;
+
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Wallet with ID % not found', p_wallet_id;
+        END IF;
+
+        v_previous_balance := v_monthly_balance + v_fixed_balance;
+
+        IF LOWER(p_transaction_type) = 'credit' THEN
+            v_new_monthly_balance := v_monthly_balance;
+            v_new_fixed_balance := v_fixed_balance + p_amount;
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSIF LOWER(p_transaction_type) = 'debit' THEN
+            IF v_previous_balance < p_amount THEN
+                RAISE EXCEPTION 'Insufficient balance. Available: %, Required: %', v_previous_balance, p_amount;
+            END IF;
+
+            v_remaining_amount := p_amount;
+
+            IF v_monthly_balance >= v_remaining_amount THEN
+                v_new_monthly_balance := v_monthly_balance - v_remaining_amount;
+                v_new_fixed_balance := v_fixed_balance;
+            ELSE
+                v_remaining_amount := v_remaining_amount - v_monthly_balance;
+                v_new_monthly_balance := 0;
+                v_new_fixed_balance := v_fixed_balance - v_remaining_amount;
+            END IF;
+
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSE
+            RAISE EXCEPTION 'Invalid transaction type. Must be either credit or debit, got: %', p_transaction_type;
+        END IF;
+
+        UPDATE wallet
+        SET
+            monthly_balance = v_new_monthly_balance,
+            fixed_balance = v_new_fixed_balance,
+            updated_at = NOW()
+        WHERE wallet_id = p_wallet_id;
+
+        INSERT INTO wallet_transaction (
+            wallet_id,
+            transaction_type,
+            amount,
+            previous_balance,
+            current_balance,
+            updated_at,
+            source,
+            remark,
+            additional_info
+        ) VALUES (
+            p_wallet_id,
+            LOWER(p_transaction_type),
+            p_amount,
+            v_previous_balance,
+            v_new_current_balance,
+            NOW(),
+            p_source,
+            p_remark,
+            p_additional_info
+        ) RETURNING transaction_id INTO v_transaction_id;
+
+        RETURN v_transaction_id;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    op.execute("DROP FUNCTION IF EXISTS process_wallet_transaction_full(INTEGER, VARCHAR, FLOAT, VARCHAR, VARCHAR, VARCHAR);")
@@ -0,0 +1,58 @@
+"""wallet transaction queue
+
+Revision ID: a12024756154
+Revises: 86111e18de94
+Create Date: 2025-06-26 14:03:51.884210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a12024756154'
+down_revision: Union[str, None] = '86111e18de94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Durable queue for asynchronously ingested wallet transactions."""
+    op.create_table(
+        'wallet_transaction_queue',
+        sa.Column('ticket_id', sa.BigInteger(), nullable=False),
+        sa.Column('wallet_id', sa.Integer(), nullable=False),
+        sa.Column('transaction_type', sa.String(), nullable=False),
+        sa.Column('amount', sa.BigInteger(), nullable=False),
+        sa.Column('source', sa.String(), nullable=True),
+        sa.Column('remark', sa.String(), nullable=True),
+        sa.Column('additional_info', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), server_default='pending', nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('ticket_id'),
+    )
+    # Workers only ever scan pending rows, in ticket order
+    op.create_index(
+        'ix_wallet_transaction_queue_pending',
+        'wallet_transaction_queue',
+        ['ticket_id'],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    op.create_index(
+        'ix_wallet_transaction_queue_wallet_pending',
+        'wallet_transaction_queue',
+        ['wallet_id', 'ticket_id'],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    """Drop the ingestion queue."""
+    op.drop_index('ix_wallet_transaction_queue_wallet_pending', table_name='wallet_transaction_queue')
+    op.drop_index('ix_wallet_transaction_queue_pending', table_name='wallet_transaction_queue')
+    op.drop_table('wallet_transaction_queue')
@@ -0,0 +1,377 @@
+"""wallet balance shards
+
+Revision ID: a9a2a47da13e
+Revises: a12024756154
+Create Date: 2025-06-27 11:20:36.472918
+
+"""
+import importlib.util
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9a2a47da13e'
+down_revision: Union[str, None] = 'a12024756154'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PROCESS_WALLET_TRANSACTION_FULL = """
+CREATE OR REPLACE FUNCTION process_wallet_transaction_full(
+    p_wallet_id INTEGER,
+    p_transaction_type VARCHAR,
+    p_amount BIGINT,
+    p_source VARCHAR DEFAULT NULL,
+    p_remark VARCHAR DEFAULT NULL,
+    p_additional_info VARCHAR DEFAULT NULL
+)
+RETURNS TABLE(
+    transaction_id INTEGER,
+    wallet_id INTEGER,
+    transaction_type VARCHAR,
+    amount BIGINT,
+    previous_balance BIGINT,
+    current_balance BIGINT,
+    wallet_monthly_balance BIGINT,
+    wallet_fixed_balance BIGINT,
+    source VARCHAR,
+    remark VARCHAR,
+    additional_info VARCHAR,
+    updated_at TIMESTAMP
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_shards INTEGER;
+    v_slot INTEGER;
+    v_sharded_credit BOOLEAN := FALSE;
+    v_monthly_balance BIGINT;
+    v_fixed_balance BIGINT;
+    v_wallet_fixed_balance BIGINT;
+    v_shard_fixed_balance BIGINT := 0;
+    v_previous_balance BIGINT;
+    v_new_monthly_balance BIGINT;
+    v_new_fixed_balance BIGINT;
+    v_new_current_balance BIGINT;
+    v_remaining_amount BIGINT;
+    v_from_shards BIGINT;
+    v_take BIGINT;
+    v_shard RECORD;
+    v_transaction_id INTEGER;
+    v_updated_at TIMESTAMP;
+BEGIN
+    SELECT w.balance_shards INTO v_shards
+    FROM wallet w
+    WHERE w.wallet_id = p_wallet_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Wallet with ID % not found', p_wallet_id;
+    END IF;
+
+    IF v_shards > 0 AND LOWER(p_transaction_type) = 'credit' THEN
+        -- Sharded credit: lock one random slot instead of the wallet row so
+        -- concurrent credits to a hot wallet do not queue behind each other
+        v_slot := floor(random() * v_shards)::INTEGER;
+
+        UPDATE wallet_balance_shard s
+        SET fixed_balance = s.fixed_balance + p_amount,
+            updated_at = NOW()
+        WHERE s.wallet_id = p_wallet_id AND s.slot = v_slot;
+
+        -- The slot is gone if the shard count was lowered meanwhile; fall
+        -- back to the locked path below
+        v_sharded_credit := FOUND;
+    END IF;
+
+    IF v_sharded_credit THEN
+        -- Balances as seen by this transaction; credits to other slots may
+        -- commit concurrently, so previous_balance is not serialised here
+        SELECT w.monthly_balance,
+               w.fixed_balance + COALESCE((
+                   SELECT SUM(s.fixed_balance) FROM wallet_balance_shard s WHERE s.wallet_id = w.wallet_id
+               ), 0)
+        INTO v_new_monthly_balance, v_new_fixed_balance
+        FROM wallet w
+        WHERE w.wallet_id = p_wallet_id;
+
+        v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+        v_previous_balance := v_new_current_balance - p_amount;
+    ELSE
+        -- Get current wallet balances with row-level lock
+        SELECT w.monthly_balance, w.fixed_balance, w.balance_shards
+        INTO v_monthly_balance, v_wallet_fixed_balance, v_shards
+        FROM wallet w
+        WHERE w.wallet_id = p_wallet_id
+        FOR UPDATE;
+
+        IF v_shards > 0 THEN
+            -- Lock every slot, in slot order like compaction, for a stable total
+            PERFORM 1
+            FROM wallet_balance_shard s
+            WHERE s.wallet_id = p_wallet_id
+            ORDER BY s.slot
+            FOR UPDATE;
+
+            SELECT COALESCE(SUM(s.fixed_balance), 0) INTO v_shard_fixed_balance
+            FROM wallet_balance_shard s
+            WHERE s.wallet_id = p_wallet_id;
+        END IF;
+
+        v_fixed_balance := v_wallet_fixed_balance + v_shard_fixed_balance;
+
+        -- Calculate previous total balance
+        v_previous_balance := v_monthly_balance + v_fixed_balance;
+
+        -- Process based on transaction type
+        IF LOWER(p_transaction_type) = 'credit' THEN
+            -- For credit, add to fixed balance
+            v_new_monthly_balance := v_monthly_balance;
+            v_new_fixed_balance := v_fixed_balance + p_amount;
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSIF LOWER(p_transaction_type) = 'debit' THEN
+            -- Check if sufficient balance exists
+            IF v_previous_balance < p_amount THEN
+                RAISE EXCEPTION 'Insufficient balance. Available: %, Required: %', v_previous_balance, p_amount;
+            END IF;
+
+            -- Deduct from monthly balance first, then fixed balance
+            v_remaining_amount := p_amount;
+
+            IF v_monthly_balance >= v_remaining_amount THEN
+                v_new_monthly_balance := v_monthly_balance - v_remaining_amount;
+                v_new_fixed_balance := v_fixed_balance;
+            ELSE
+                v_remaining_amount := v_remaining_amount - v_monthly_balance;
+                v_new_monthly_balance := 0;
+                v_new_fixed_balance := v_fixed_balance - v_remaining_amount;
+            END IF;
+
+            v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+        ELSE
+            RAISE EXCEPTION 'Invalid transaction type. Must be either credit or debit, got: %', p_transaction_type;
+        END IF;
+
+        -- Fixed balance is drawn from the wallet row first, then the slots
+        v_from_shards := GREATEST(v_fixed_balance - v_new_fixed_balance - v_wallet_fixed_balance, 0);
+        v_remaining_amount := v_from_shards;
+
+        IF v_from_shards > 0 THEN
+            FOR v_shard IN
+                SELECT s.slot, s.fixed_balance
+                FROM wallet_balance_shard s
+                WHERE s.wallet_id = p_wallet_id AND s.fixed_balance > 0
+                ORDER BY s.slot
+            LOOP
+                EXIT WHEN v_remaining_amount = 0;
+                v_take := LEAST(v_shard.fixed_balance, v_remaining_amount);
+
+                UPDATE wallet_balance_shard s
+                SET fixed_balance = s.fixed_balance - v_take,
+                    updated_at = NOW()
+                WHERE s.wallet_id = p_wallet_id AND s.slot = v_shard.slot;
+
+                v_remaining_amount := v_remaining_amount - v_take;
+            END LOOP;
+        END IF;
+
+        -- Update wallet balances
+        UPDATE wallet w
+        SET
+            monthly_balance = v_new_monthly_balance,
+            fixed_balance = v_new_fixed_balance - v_shard_fixed_balance + v_from_shards,
+            updated_at = NOW()
+        WHERE w.wallet_id = p_wallet_id;
+    END IF;
+
+    -- Insert wallet transaction record
+    INSERT INTO wallet_transaction (
+        wallet_id,
+        transaction_type,
+        amount,
+        previous_balance,
+        current_balance,
+        updated_at,
+        source,
+        remark,
+        additional_info
+    ) VALUES (
+        p_wallet_id,
+        LOWER(p_transaction_type),
+        p_amount,
+        v_previous_balance,
+        v_new_current_balance,
+        NOW(),
+        p_source,
+        p_remark,
+        p_additional_info
+    ) RETURNING wallet_transaction.transaction_id, wallet_transaction.updated_at
+    INTO v_transaction_id, v_updated_at;
+
+    RETURN QUERY SELECT
+        v_transaction_id,
+        p_wallet_id,
+        LOWER(p_transaction_type)::VARCHAR,
+        p_amount,
+        v_previous_balance,
+        v_new_current_balance,
+        v_new_monthly_balance,
+        v_new_fixed_balance,
+        p_source,
+        p_remark,
+        p_additional_info,
+        v_updated_at;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+GET_WALLET_BALANCE = """
+CREATE OR REPLACE FUNCTION get_wallet_balance(p_wallet_id INTEGER)
+RETURNS TABLE(
+    wallet_id INTEGER,
+    monthly_balance BIGINT,
+    fixed_balance BIGINT,
+    total_balance BIGINT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        w.wallet_id,
+        w.monthly_balance,
+        w.fixed_balance + COALESCE(sh.fixed_balance, 0),
+        (w.monthly_balance + w.fixed_balance + COALESCE(sh.fixed_balance, 0)) as total_balance
+    FROM wallet w
+    LEFT JOIN LATERAL (
+        SELECT SUM(s.fixed_balance)::BIGINT AS fixed_balance
+        FROM wallet_balance_shard s
+        WHERE s.wallet_id = w.wallet_id
+    ) sh ON TRUE
+    WHERE w.wallet_id = p_wallet_id;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+COMPACT_WALLET_BALANCE_SHARDS = """
+CREATE OR REPLACE FUNCTION compact_wallet_balance_shards(p_wallet_id INTEGER)
+RETURNS BIGINT AS $$
+DECLARE
+    v_total BIGINT;
+BEGIN
+    -- Same lock order as debits: wallet row, then slots by slot number
+    PERFORM 1 FROM wallet w WHERE w.wallet_id = p_wallet_id FOR UPDATE;
+
+    PERFORM 1
+    FROM wallet_balance_shard s
+    WHERE s.wallet_id = p_wallet_id
+    ORDER BY s.slot
+    FOR UPDATE;
+
+    SELECT COALESCE(SUM(s.fixed_balance), 0) INTO v_total
+    FROM wallet_balance_shard s
+    WHERE s.wallet_id = p_wallet_id;
+
+    IF v_total <> 0 THEN
+        UPDATE wallet_balance_shard s
+        SET fixed_balance = 0, updated_at = NOW()
+        WHERE s.wallet_id = p_wallet_id AND s.fixed_balance <> 0;
+
+        -- The total is unchanged, so wallet.updated_at is left alone
+        UPDATE wallet w
+        SET fixed_balance = w.fixed_balance + v_total
+        WHERE w.wallet_id = p_wallet_id;
+    END IF;
+
+    RETURN v_total;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+SET_WALLET_BALANCE_SHARDS = """
+CREATE OR REPLACE FUNCTION set_wallet_balance_shards(p_wallet_id INTEGER, p_shards INTEGER)
+RETURNS INTEGER AS $$
+BEGIN
+    IF p_shards < 0 THEN
+        RAISE EXCEPTION 'Shard count must be >= 0, got: %', p_shards;
+    END IF;
+
+    PERFORM 1 FROM wallet w WHERE w.wallet_id = p_wallet_id FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Wallet with ID % not found', p_wallet_id;
+    END IF;
+
+    -- Fold the slots back into the wallet row before resizing
+    PERFORM compact_wallet_balance_shards(p_wallet_id);
+
+    DELETE FROM wallet_balance_shard s
+    WHERE s.wallet_id = p_wallet_id AND s.slot >= p_shards;
+
+    INSERT INTO wallet_balance_shard (wallet_id, slot)
+    SELECT p_wallet_id, g
+    FROM generate_series(0, p_shards - 1) AS g
+    ON CONFLICT DO NOTHING;
+
+    UPDATE wallet w
+    SET balance_shards = p_shards
+    WHERE w.wallet_id = p_wallet_id;
+
+    RETURN p_shards;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _money_in_paise():
+    """The b369fdc51172 migration module, whose function bodies downgrade restores."""
+    path = os.path.join(os.path.dirname(__file__), "b369fdc51172_money_in_paise.py")
+    spec = importlib.util.spec_from_file_location("money_in_paise", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upgrade() -> None:
+    """Opt-in balance shards so credits to hot wallets stop serialising on one row."""
+    op.add_column('wallet', sa.Column('balance_shards', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'wallet_balance_shard',
+        sa.Column('wallet_id', sa.Integer(), nullable=False),
+        sa.Column('slot', sa.Integer(), nullable=False),
+        sa.Column('fixed_balance', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.ForeignKeyConstraint(['wallet_id'], ['wallet.wallet_id']),
+        sa.PrimaryKeyConstraint('wallet_id', 'slot'),
+    )
+
+    op.execute(PROCESS_WALLET_TRANSACTION_FULL)
+    op.execute(GET_WALLET_BALANCE)
+    op.execute(COMPACT_WALLET_BALANCE_SHARDS)
+    op.execute(SET_WALLET_BALANCE_SHARDS)
+
+
+def downgrade() -> None:
+    """Fold every shard back into its wallet and drop sharding."""
+    op.execute("""
+    UPDATE wallet w
+    SET fixed_balance = w.fixed_balance + sh.fixed_balance
+    FROM (
+        SELECT wallet_id, SUM(fixed_balance) AS fixed_balance
+        FROM wallet_balance_shard
+        GROUP BY wallet_id
+    ) sh
+    WHERE w.wallet_id = sh.wallet_id;
+    """)
+
+    op.execute("DROP FUNCTION IF EXISTS set_wallet_balance_shards(INTEGER, INTEGER);")
+    op.execute("DROP FUNCTION IF EXISTS compact_wallet_balance_shards(INTEGER);")
+
+    previous = _money_in_paise()
+    op.execute(previous.PROCESS_WALLET_TRANSACTION_FULL.format(money="BIGINT"))
+    op.execute(previous.GET_WALLET_BALANCE.format(money="BIGINT"))
+
+    op.drop_table('wallet_balance_shard')
+    op.drop_column('wallet', 'balance_shards')
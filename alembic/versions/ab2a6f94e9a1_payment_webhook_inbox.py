@@ -0,0 +1,57 @@
+"""payment webhook inbox
+
+Revision ID: ab2a6f94e9a1
+Revises: 0c3d5785e880
+Create Date: 2025-06-29 16:05:48.219073
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ab2a6f94e9a1'
+down_revision: Union[str, None] = '0c3d5785e880'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Durable inbox for Razorpay webhooks, one row per event id."""
+    op.create_table(
+        'payment_webhook_inbox',
+        sa.Column('event_id', sa.String(), nullable=False),
+        sa.Column('event_type', sa.String(), nullable=False),
+        sa.Column('payload', postgresql.JSONB(), nullable=False),
+        sa.Column('status', sa.String(), server_default='pending', nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('result', sa.String(), nullable=True),
+        sa.Column('received_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('event_id'),
+    )
+    # Workers only scan events that are due
+    op.create_index(
+        'ix_payment_webhook_inbox_pending',
+        'payment_webhook_inbox',
+        ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    op.create_index(
+        'ix_payment_webhook_inbox_dead',
+        'payment_webhook_inbox',
+        ['received_at'],
+        postgresql_where=sa.text("status = 'dead'"),
+    )
+
+
+def downgrade() -> None:
+    """Drop the webhook inbox."""
+    op.drop_index('ix_payment_webhook_inbox_dead', table_name='payment_webhook_inbox')
+    op.drop_index('ix_payment_webhook_inbox_pending', table_name='payment_webhook_inbox')
+    op.drop_table('payment_webhook_inbox')
@@ -0,0 +1,46 @@
+"""ledger archive segment
+
+Revision ID: b19dd9bd5ccb
+Revises: fd1d40dce1cf
+Create Date: 2025-06-24 15:12:44.603118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b19dd9bd5ccb'
+down_revision: Union[str, None] = 'fd1d40dce1cf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Pointer table for ledger rows moved to cold storage."""
+    op.create_table(
+        'ledger_archive_segment',
+        sa.Column('segment_id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('wallet_id_from', sa.Integer(), nullable=False),
+        sa.Column('wallet_id_to', sa.Integer(), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.PrimaryKeyConstraint('segment_id'),
+        sa.UniqueConstraint('table_name', 'month', 'wallet_id_from', name='uq_ledger_archive_segment'),
+    )
+    op.create_index(
+        'ix_ledger_archive_segment_lookup',
+        'ledger_archive_segment',
+        ['table_name', 'wallet_id_from', 'wallet_id_to', 'month'],
+    )
+
+
+def downgrade() -> None:
+    """Drop the archive pointer table (the files themselves are left alone)."""
+    op.drop_index('ix_ledger_archive_segment_lookup', table_name='ledger_archive_segment')
+    op.drop_table('ledger_archive_segment')
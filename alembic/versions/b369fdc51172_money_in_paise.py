@@ -0,0 +1,512 @@
+"""money in paise
+
+Revision ID: b369fdc51172
+Revises: 34db48aadabe
+Create Date: 2025-06-20 16:27:13.604482
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b369fdc51172'
+down_revision: Union[str, None] = '34db48aadabe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Money columns moving from double precision rupees to BIGINT paise
+MONEY_COLUMNS = [
+    ("account", "balance"),
+    ("wallet", "monthly_balance"),
+    ("wallet", "fixed_balance"),
+    ("wallet_transaction", "amount"),
+    ("wallet_transaction", "previous_balance"),
+    ("wallet_transaction", "current_balance"),
+    ("plan", "plan_amount"),
+    ("plan", "price"),
+    ("partner_transaction", "commission_amount"),
+    ("settlement", "settlement_amount"),
+]
+
+
+# The function bodies below are identical for both representations; only the
+# money type changes, so upgrade and downgrade share them.
+PROCESS_WALLET_TRANSACTION_FULL = """
+CREATE OR REPLACE FUNCTION process_wallet_transaction_full(
+    p_wallet_id INTEGER,
+    p_transaction_type VARCHAR,
+    p_amount {money},
+    p_source VARCHAR DEFAULT NULL,
+    p_remark VARCHAR DEFAULT NULL,
+    p_additional_info VARCHAR DEFAULT NULL
+)
+RETURNS TABLE(
+    transaction_id INTEGER,
+    wallet_id INTEGER,
+    transaction_type VARCHAR,
+    amount {money},
+    previous_balance {money},
+    current_balance {money},
+    wallet_monthly_balance {money},
+    wallet_fixed_balance {money},
+    source VARCHAR,
+    remark VARCHAR,
+    additional_info VARCHAR,
+    updated_at TIMESTAMP
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_monthly_balance {money};
+    v_fixed_balance {money};
+    v_previous_balance {money};
+    v_new_monthly_balance {money};
+    v_new_fixed_balance {money};
+    v_new_current_balance {money};
+    v_remaining_amount {money};
+    v_transaction_id INTEGER;
+    v_updated_at TIMESTAMP;
+BEGIN
+    -- Get current wallet balances with row-level lock
+    SELECT w.monthly_balance, w.fixed_balance
+    INTO v_monthly_balance, v_fixed_balance
+    FROM wallet w
+    WHERE w.wallet_id = p_wallet_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Wallet with ID % not found', p_wallet_id;
+    END IF;
+
+    -- Calculate previous total balance
+    v_previous_balance := v_monthly_balance + v_fixed_balance;
+
+    -- Process based on transaction type
+    IF LOWER(p_transaction_type) = 'credit' THEN
+        -- For credit, add to fixed balance
+        v_new_monthly_balance := v_monthly_balance;
+        v_new_fixed_balance := v_fixed_balance + p_amount;
+        v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+    ELSIF LOWER(p_transaction_type) = 'debit' THEN
+        -- Check if sufficient balance exists
+        IF v_previous_balance < p_amount THEN
+            RAISE EXCEPTION 'Insufficient balance. Available: %, Required: %', v_previous_balance, p_amount;
+        END IF;
+
+        -- Deduct from monthly balance first, then fixed balance
+        v_remaining_amount := p_amount;
+
+        IF v_monthly_balance >= v_remaining_amount THEN
+            v_new_monthly_balance := v_monthly_balance - v_remaining_amount;
+            v_new_fixed_balance := v_fixed_balance;
+        ELSE
+            v_remaining_amount := v_remaining_amount - v_monthly_balance;
+            v_new_monthly_balance := 0;
+            v_new_fixed_balance := v_fixed_balance - v_remaining_amount;
+        END IF;
+
+        v_new_current_balance := v_new_monthly_balance + v_new_fixed_balance;
+
+    ELSE
+        RAISE EXCEPTION 'Invalid transaction type. Must be either credit or debit, got: %', p_transaction_type;
+    END IF;
+
+    -- Update wallet balances
+    UPDATE wallet w
+    SET
+        monthly_balance = v_new_monthly_balance,
+        fixed_balance = v_new_fixed_balance,
+        updated_at = NOW()
+    WHERE w.wallet_id = p_wallet_id;
+
+    -- Insert wallet transaction record
+    INSERT INTO wallet_transaction (
+        wallet_id,
+        transaction_type,
+        amount,
+        previous_balance,
+        current_balance,
+        updated_at,
+        source,
+        remark,
+        additional_info
+    ) VALUES (
+        p_wallet_id,
+        LOWER(p_transaction_type),
+        p_amount,
+        v_previous_balance,
+        v_new_current_balance,
+        NOW(),
+        p_source,
+        p_remark,
+        p_additional_info
+    ) RETURNING wallet_transaction.transaction_id, wallet_transaction.updated_at
+    INTO v_transaction_id, v_updated_at;
+
+    RETURN QUERY SELECT
+        v_transaction_id,
+        p_wallet_id,
+        LOWER(p_transaction_type)::VARCHAR,
+        p_amount,
+        v_previous_balance,
+        v_new_current_balance,
+        v_new_monthly_balance,
+        v_new_fixed_balance,
+        p_source,
+        p_remark,
+        p_additional_info,
+        v_updated_at;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PROCESS_WALLET_TRANSACTION = """
+CREATE OR REPLACE FUNCTION process_wallet_transaction(
+    p_wallet_id INTEGER,
+    p_transaction_type VARCHAR,
+    p_amount {money},
+    p_source VARCHAR DEFAULT NULL,
+    p_remark VARCHAR DEFAULT NULL,
+    p_additional_info VARCHAR DEFAULT NULL
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_transaction_id INTEGER;
+BEGIN
+    SELECT t.transaction_id INTO v_transaction_id
+    FROM process_wallet_transaction_full(
+        p_wallet_id, p_transaction_type, p_amount, p_source, p_remark, p_additional_info
+    ) t;
+
+    RETURN v_transaction_id;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PROCESS_WALLET_TRANSACTION_BATCH = """
+CREATE OR REPLACE FUNCTION process_wallet_transaction_batch(p_items JSONB)
+RETURNS TABLE(
+    item_index INTEGER,
+    transaction_id INTEGER,
+    wallet_id INTEGER,
+    transaction_type VARCHAR,
+    amount {money},
+    previous_balance {money},
+    current_balance {money},
+    wallet_monthly_balance {money},
+    wallet_fixed_balance {money},
+    source VARCHAR,
+    remark VARCHAR,
+    additional_info VARCHAR,
+    updated_at TIMESTAMP
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_item RECORD;
+    v_index INTEGER;
+BEGIN
+    -- Lock every wallet touched by the batch up front, in wallet_id order,
+    -- so concurrent batches over overlapping wallets cannot deadlock
+    PERFORM 1
+    FROM wallet w
+    WHERE w.wallet_id IN (
+        SELECT (e->>'wallet_id')::INTEGER FROM jsonb_array_elements(p_items) e
+    )
+    ORDER BY w.wallet_id
+    FOR UPDATE;
+
+    FOR v_item IN
+        SELECT (t.ord - 1)::INTEGER AS idx, t.item
+        FROM jsonb_array_elements(p_items) WITH ORDINALITY AS t(item, ord)
+        ORDER BY t.ord
+    LOOP
+        v_index := v_item.idx;
+
+        -- Row locks are already held, so this does not wait
+        RETURN QUERY
+        SELECT v_index, f.*
+        FROM process_wallet_transaction_full(
+            (v_item.item->>'wallet_id')::INTEGER,
+            v_item.item->>'transaction_type',
+            (v_item.item->>'amount')::{money},
+            v_item.item->>'source',
+            v_item.item->>'remark',
+            v_item.item->>'additional_info'
+        ) f;
+    END LOOP;
+EXCEPTION WHEN OTHERS THEN
+    RAISE EXCEPTION 'batch item %: %', v_index, SQLERRM USING ERRCODE = SQLSTATE;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+GET_WALLET_BALANCE = """
+CREATE OR REPLACE FUNCTION get_wallet_balance(p_wallet_id INTEGER)
+RETURNS TABLE(
+    wallet_id INTEGER,
+    monthly_balance {money},
+    fixed_balance {money},
+    total_balance {money}
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        w.wallet_id,
+        w.monthly_balance,
+        w.fixed_balance,
+        (w.monthly_balance + w.fixed_balance) as total_balance
+    FROM wallet w
+    WHERE w.wallet_id = p_wallet_id;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+SUBSCRIBE_TO_PLAN = """
+CREATE OR REPLACE FUNCTION subscribe_to_plan(p_wallet_id INT, p_plan_id INT)
+RETURNS TABLE(
+    subscription_id INT,
+    wallet_id INT,
+    plan_id INT,
+    status TEXT,
+    start_time TIMESTAMP,
+    end_time TIMESTAMP,
+    message TEXT
+) AS $$
+DECLARE
+    v_plan_amount {money};
+    v_duration INT;
+    v_balance {money};
+    v_existing_id INT;
+    v_subscription_id INT;
+BEGIN
+    -- Validate plan
+    SELECT plan.plan_amount, plan.duration_in_days INTO v_plan_amount, v_duration
+    FROM plan
+    WHERE plan.plan_id = p_plan_id AND plan.is_active = TRUE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Invalid or inactive plan';
+    END IF;
+
+    -- Check wallet balance
+    SELECT wallet.monthly_balance INTO v_balance
+    FROM wallet
+    WHERE wallet.wallet_id = p_wallet_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Wallet not found';
+    END IF;
+
+    -- Deactivate existing subscription
+    SELECT subscription.subscription_id INTO v_existing_id
+    FROM subscription
+    WHERE subscription.wallet_id = p_wallet_id AND subscription.is_active = TRUE;
+
+    IF FOUND THEN
+        UPDATE subscription
+        SET is_active = FALSE
+        WHERE subscription.subscription_id = v_existing_id;
+
+        INSERT INTO subscription_history(subscription_id, wallet_id, plan_id, status, comment)
+        VALUES (v_existing_id, p_wallet_id, p_plan_id, 'cancelled', 'Auto-cancelled before new subscription');
+    END IF;
+
+    -- Deduct balance
+    UPDATE wallet
+    SET monthly_balance = wallet.monthly_balance + v_plan_amount,
+        updated_at = NOW()
+    WHERE wallet.wallet_id = p_wallet_id;
+
+    -- Create new subscription
+    INSERT INTO subscription(wallet_id, plan_id, is_active, start_time, end_time, is_billed)
+    VALUES (
+        p_wallet_id, p_plan_id, TRUE, NOW(), NOW() + (v_duration || ' days')::interval, TRUE
+    )
+    RETURNING subscription.subscription_id INTO v_subscription_id;
+
+    -- Log history
+    INSERT INTO subscription_history(subscription_id, wallet_id, plan_id, status, comment)
+    VALUES (v_subscription_id, p_wallet_id, p_plan_id, 'activated', 'Subscribed to new plan');
+
+    -- Return structured data
+    RETURN QUERY SELECT
+        v_subscription_id,
+        p_wallet_id,
+        p_plan_id,
+        'active'::TEXT,
+        NOW()::TIMESTAMP,
+        (NOW() + (v_duration || ' days')::interval)::TIMESTAMP,
+        'Subscription successful'::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+RENEW_SUBSCRIPTION = """
+CREATE OR REPLACE FUNCTION renew_subscription(p_wallet_id INT)
+RETURNS TABLE(
+    subscription_id INT,
+    wallet_id INT,
+    plan_id INT,
+    status TEXT,
+    end_time TIMESTAMP,
+    message TEXT
+) AS $$
+DECLARE
+    v_sub_id INT;
+    v_plan_id INT;
+    v_plan_amount {money};
+    v_duration INT;
+    v_balance {money};
+    v_new_end_time TIMESTAMP;
+BEGIN
+    SELECT s.subscription_id, s.plan_id INTO v_sub_id, v_plan_id
+    FROM subscription s
+    WHERE s.wallet_id = p_wallet_id AND s.is_active = TRUE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'No active subscription found';
+    END IF;
+
+    SELECT plan.plan_amount, plan.duration_in_days INTO v_plan_amount, v_duration
+    FROM plan
+    WHERE plan.plan_id = v_plan_id;
+
+    SELECT wallet.monthly_balance INTO v_balance
+    FROM wallet
+    WHERE wallet.wallet_id = p_wallet_id;
+
+    -- Deduct balance
+    UPDATE wallet
+    SET monthly_balance = wallet.monthly_balance + v_plan_amount
+    WHERE wallet.wallet_id = p_wallet_id;
+
+    -- Extend subscription
+    UPDATE subscription
+    SET end_time = subscription.end_time + (v_duration || ' days')::interval
+    WHERE subscription.subscription_id = v_sub_id
+    RETURNING subscription.end_time INTO v_new_end_time;
+
+    INSERT INTO subscription_history(subscription_id, wallet_id, plan_id, status, comment)
+    VALUES (v_sub_id, p_wallet_id, v_plan_id, 'renewed', 'Subscription renewed');
+
+    RETURN QUERY SELECT
+        v_sub_id,
+        p_wallet_id,
+        v_plan_id,
+        'active'::TEXT,
+        v_new_end_time,
+        'Subscription renewed'::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+COMPLETE_SUBSCRIPTION = """
+CREATE OR REPLACE PROCEDURE complete_subscription(p_subscription_id INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_wallet_id INT;
+    v_plan_id INT;
+    v_amount {money};
+    v_duration INT;
+    v_now TIMESTAMP := NOW();
+    v_end TIMESTAMP;
+BEGIN
+    -- Get wallet_id and plan_id from subscription
+    SELECT wallet_id, plan_id INTO v_wallet_id, v_plan_id
+    FROM subscription
+    WHERE subscription_id = p_subscription_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Subscription not found';
+    END IF;
+
+    -- Get plan details
+    SELECT plan_amount, duration_in_days INTO v_amount, v_duration
+    FROM plan
+    WHERE plan_id = v_plan_id;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Plan not found';
+    END IF;
+
+    -- Call existing wallet transaction processor
+    PERFORM process_wallet_transaction(
+        v_wallet_id,
+        'credit',
+        v_amount,
+        'Subscription',
+        CONCAT('Subscription for plan ', v_plan_id),
+        CONCAT('subscription_id=', p_subscription_id)
+    );
+
+    -- Update subscription record
+    v_end := v_now + (v_duration || ' days')::INTERVAL;
+
+    UPDATE subscription
+    SET
+        is_billed = TRUE,
+        is_active = TRUE,
+        start_time = v_now,
+        end_time = v_end
+    WHERE subscription_id = p_subscription_id;
+
+END;
+$$;
+"""
+
+
+def _alter_money_columns(type_clause: str) -> None:
+    # One ALTER per table so each table is rewritten only once
+    tables = {}
+    for table, column in MONEY_COLUMNS:
+        tables.setdefault(table, []).append(column)
+
+    for table, columns in tables.items():
+        clauses = ", ".join(
+            f"ALTER COLUMN {column} TYPE " + type_clause.format(column=column)
+            for column in columns
+        )
+        op.execute(f"ALTER TABLE {table} {clauses};")
+
+
+def _drop_wallet_functions(money: str) -> None:
+    op.execute(f"DROP FUNCTION IF EXISTS process_wallet_transaction(INTEGER, VARCHAR, {money}, VARCHAR, VARCHAR, VARCHAR);")
+    op.execute(f"DROP FUNCTION IF EXISTS process_wallet_transaction_full(INTEGER, VARCHAR, {money}, VARCHAR, VARCHAR, VARCHAR);")
+    op.execute("DROP FUNCTION IF EXISTS process_wallet_transaction_batch(JSONB);")
+    op.execute("DROP FUNCTION IF EXISTS get_wallet_balance(INTEGER);")
+
+
+def _create_functions(money: str) -> None:
+    for sql in (
+        PROCESS_WALLET_TRANSACTION_FULL,
+        PROCESS_WALLET_TRANSACTION,
+        PROCESS_WALLET_TRANSACTION_BATCH,
+        GET_WALLET_BALANCE,
+        SUBSCRIBE_TO_PLAN,
+        RENEW_SUBSCRIPTION,
+        COMPLETE_SUBSCRIPTION,
+    ):
+        op.execute(sql.format(money=money))
+
+
+def upgrade() -> None:
+    """Store money as BIGINT paise and switch the procedures to integer arithmetic."""
+    _drop_wallet_functions("FLOAT")
+
+    _alter_money_columns("BIGINT USING ROUND({column} * 100)::BIGINT")
+
+    _create_functions("BIGINT")
+
+
+def downgrade() -> None:
+    """Back to double precision rupees."""
+    _drop_wallet_functions("BIGINT")
+
+    _alter_money_columns("DOUBLE PRECISION USING {column} / 100.0")
+
+    _create_functions("FLOAT")
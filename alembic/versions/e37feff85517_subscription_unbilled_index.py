@@ -0,0 +1,34 @@
+"""subscription unbilled index
+
+Revision ID: e37feff85517
+Revises: 600dd7677713
+Create Date: 2025-07-02 10:17:54.230611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e37feff85517'
+down_revision: Union[str, None] = '600dd7677713'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Unbilled subscriptions by wallet, for app.jobs.billing_run."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_subscription_wallet_id_unbilled "
+            "ON subscription (wallet_id) WHERE NOT is_billed;"
+        )
+
+
+def downgrade() -> None:
+    """Drop the unbilled index."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_subscription_wallet_id_unbilled;")
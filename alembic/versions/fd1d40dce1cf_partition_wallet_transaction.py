@@ -0,0 +1,140 @@
+"""partition wallet_transaction
+
+Revision ID: fd1d40dce1cf
+Revises: b369fdc51172
+Create Date: 2025-06-23 10:48:30.915027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fd1d40dce1cf'
+down_revision: Union[str, None] = 'b369fdc51172'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Rebuild wallet_transaction as a monthly range-partitioned table on updated_at."""
+    # A foreign key can only reference a unique constraint that includes the
+    # partition key, so partner_transaction.transaction_id loses its FK.
+    op.execute("ALTER TABLE partner_transaction DROP CONSTRAINT IF EXISTS partner_transaction_transaction_id_fkey;")
+
+    op.execute("ALTER TABLE wallet_transaction RENAME TO wallet_transaction_unpartitioned;")
+    op.execute("ALTER TABLE wallet_transaction_unpartitioned RENAME CONSTRAINT wallet_transaction_pkey TO wallet_transaction_unpartitioned_pkey;")
+    op.execute("DROP INDEX IF EXISTS ix_wallet_transaction_transaction_id;")
+    op.execute("DROP INDEX IF EXISTS ix_wallet_transaction_wallet_id_updated_at;")
+
+    op.execute("""
+    CREATE TABLE wallet_transaction (
+        transaction_id INTEGER NOT NULL DEFAULT nextval('wallet_transaction_transaction_id_seq'),
+        wallet_id INTEGER REFERENCES wallet(wallet_id),
+        transaction_type VARCHAR,
+        amount BIGINT,
+        previous_balance BIGINT,
+        current_balance BIGINT,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        source VARCHAR,
+        remark VARCHAR,
+        additional_info VARCHAR,
+        PRIMARY KEY (transaction_id, updated_at)
+    ) PARTITION BY RANGE (updated_at);
+    """)
+
+    # Catches rows outside every monthly partition; the maintenance job keeps
+    # future months pre-created so this stays empty.
+    op.execute("CREATE TABLE wallet_transaction_default PARTITION OF wallet_transaction DEFAULT;")
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION create_wallet_transaction_partition(p_month DATE)
+    RETURNS TEXT AS $$
+    DECLARE
+        v_start DATE := date_trunc('month', p_month)::DATE;
+        v_end DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+        v_name TEXT := 'wallet_transaction_y' || to_char(v_start, 'YYYY') || 'm' || to_char(v_start, 'MM');
+    BEGIN
+        IF to_regclass(v_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF wallet_transaction FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_start, v_end
+            );
+        END IF;
+        RETURN v_name;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+    SELECT create_wallet_transaction_partition(m::DATE)
+    FROM generate_series(
+        date_trunc('month', COALESCE((SELECT min(updated_at) FROM wallet_transaction_unpartitioned), NOW())),
+        date_trunc('month', NOW()) + INTERVAL '3 months',
+        INTERVAL '1 month'
+    ) AS m;
+    """)
+
+    # Rows without a timestamp predate the stored procedures; park them in the default partition
+    op.execute("""
+    INSERT INTO wallet_transaction (
+        transaction_id, wallet_id, transaction_type, amount, previous_balance,
+        current_balance, updated_at, source, remark, additional_info
+    )
+    SELECT
+        transaction_id, wallet_id, transaction_type, amount, previous_balance,
+        current_balance, COALESCE(updated_at, '1970-01-01'), source, remark, additional_info
+    FROM wallet_transaction_unpartitioned;
+    """)
+
+    # Move the sequence over before the old table (its owner) is dropped
+    op.execute("ALTER SEQUENCE wallet_transaction_transaction_id_seq OWNED BY wallet_transaction.transaction_id;")
+    op.execute("DROP TABLE wallet_transaction_unpartitioned;")
+
+    op.execute("CREATE INDEX ix_wallet_transaction_transaction_id ON wallet_transaction (transaction_id);")
+    op.execute("CREATE INDEX ix_wallet_transaction_wallet_id_updated_at ON wallet_transaction (wallet_id, updated_at, transaction_id);")
+
+
+def downgrade() -> None:
+    """Collapse wallet_transaction back into a single heap."""
+    op.execute("""
+    CREATE TABLE wallet_transaction_unpartitioned (
+        transaction_id INTEGER NOT NULL DEFAULT nextval('wallet_transaction_transaction_id_seq'),
+        wallet_id INTEGER REFERENCES wallet(wallet_id),
+        transaction_type VARCHAR,
+        amount BIGINT,
+        previous_balance BIGINT,
+        current_balance BIGINT,
+        updated_at TIMESTAMP,
+        source VARCHAR,
+        remark VARCHAR,
+        additional_info VARCHAR,
+        CONSTRAINT wallet_transaction_unpartitioned_pkey PRIMARY KEY (transaction_id)
+    );
+    """)
+    op.execute("""
+    INSERT INTO wallet_transaction_unpartitioned (
+        transaction_id, wallet_id, transaction_type, amount, previous_balance,
+        current_balance, updated_at, source, remark, additional_info
+    )
+    SELECT
+        transaction_id, wallet_id, transaction_type, amount, previous_balance,
+        current_balance, updated_at, source, remark, additional_info
+    FROM wallet_transaction;
+    """)
+    op.execute("ALTER SEQUENCE wallet_transaction_transaction_id_seq OWNED BY wallet_transaction_unpartitioned.transaction_id;")
+
+    op.execute("DROP TABLE wallet_transaction;")
+    op.execute("DROP FUNCTION IF EXISTS create_wallet_transaction_partition(DATE);")
+
+    op.execute("ALTER TABLE wallet_transaction_unpartitioned RENAME TO wallet_transaction;")
+    op.execute("ALTER TABLE wallet_transaction RENAME CONSTRAINT wallet_transaction_unpartitioned_pkey TO wallet_transaction_pkey;")
+    op.execute("CREATE INDEX ix_wallet_transaction_transaction_id ON wallet_transaction (transaction_id);")
+    op.execute("CREATE INDEX ix_wallet_transaction_wallet_id_updated_at ON wallet_transaction (wallet_id, updated_at, transaction_id);")
+    op.execute("""
+    ALTER TABLE partner_transaction
+    ADD CONSTRAINT partner_transaction_transaction_id_fkey
+    FOREIGN KEY (transaction_id) REFERENCES wallet_transaction(transaction_id);
+    """)
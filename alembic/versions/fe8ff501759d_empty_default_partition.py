@@ -0,0 +1,61 @@
+"""empty default partition
+
+Revision ID: fe8ff501759d
+Revises: 1587728e38aa
+Create Date: 2025-07-05 11:12:40.558213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fe8ff501759d'
+down_revision: Union[str, None] = '1587728e38aa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Move rows parked in wallet_transaction_default into monthly partitions."""
+    # fd1d40dce1cf parked rows without a timestamp at 1970-01-01. A partition
+    # cannot be created for a range the default partition holds rows in, so
+    # each month is built as a plain table, filled from the default partition
+    # and then attached.
+    op.execute("""
+    DO $$
+    DECLARE
+        v_month DATE;
+        v_end DATE;
+        v_name TEXT;
+    BEGIN
+        FOR v_month IN
+            SELECT DISTINCT date_trunc('month', updated_at)::DATE FROM wallet_transaction_default
+        LOOP
+            v_end := (v_month + INTERVAL '1 month')::DATE;
+            v_name := 'wallet_transaction_y' || to_char(v_month, 'YYYY') || 'm' || to_char(v_month, 'MM');
+
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE wallet_transaction INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                v_name
+            );
+            EXECUTE format(
+                'WITH moved AS ('
+                '    DELETE FROM wallet_transaction_default WHERE updated_at >= %L AND updated_at < %L RETURNING *'
+                ') INSERT INTO %I SELECT * FROM moved',
+                v_month, v_end, v_name
+            );
+            EXECUTE format(
+                'ALTER TABLE wallet_transaction ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_end
+            );
+        END LOOP;
+    END;
+    $$;
+    """)
+
+
+def downgrade() -> None:
+    """Nothing to undo: the rows stay in their monthly partitions."""
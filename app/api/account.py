@@ -1,15 +1,14 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 from app.schemas.user import AccountCreate
 from app.models.user import Account
-from app.database import get_db
+from app.database import DbSession, get_session
 
 router = APIRouter(prefix="/account", tags=["Account"])
 
 @router.post("/")
-def create_account(account: AccountCreate, db: Session = Depends(get_db)):
+async def create_account(account: AccountCreate, db: DbSession = Depends(get_session)):
     new_account = Account(**account.dict())
     db.add(new_account)
-    db.commit()
-    db.refresh(new_account)
+    await db.commit()
+    await db.refresh(new_account)
     return {"message": "Account created", "id": new_account.id}
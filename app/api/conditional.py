@@ -0,0 +1,77 @@
+# app/api/conditional.py
+"""ETag / Last-Modified helpers for conditional GETs."""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.metrics import metrics
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag over the given validator parts."""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Naive timestamps in this schema are UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since when it is absent."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def not_modified_response(name: str, etag: str, last_modified: Optional[datetime]) -> Response:
+    metrics.incr(f"http.{name}.not_modified")
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def balance_validators(balance: Dict[str, Any]) -> Tuple[str, Optional[datetime]]:
+    """ETag and Last-Modified for a WalletService balance result.
+
+    The balances are part of the tag because renew_subscription changes them
+    without touching wallet.updated_at.
+    """
+    version = balance.get("version")
+    last_modified = datetime.fromisoformat(version) if version else None
+    etag = make_etag("balance", balance["wallet_id"], version, balance["monthly_balance"], balance["fixed_balance"])
+    return etag, last_modified
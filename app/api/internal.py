@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, validator
+from app.database import DbSession, get_session, pool_status
+from app.metrics import metrics
+from app.services.wallet_service import WalletService
+
+router = APIRouter(prefix="/internal", tags=["Internal"])
+
+@router.get("/metrics")
+async def get_metrics():
+    """All process-local counters, timers and gauges"""
+    return metrics.snapshot()
+
+@router.get("/pool")
+async def get_pool_metrics():
+    """Connection pool occupancy, acquire wait times and connection churn"""
+    snapshot = metrics.snapshot()
+    return {
+        **pool_status(),
+        "counters": {k: v for k, v in snapshot["counters"].items() if k.startswith("db.pool.")},
+        "timers": {k: v for k, v in snapshot["timers"].items() if k.startswith("db.pool.")},
+    }
+
+class WalletShardsRequest(BaseModel):
+    shards: int  # 0 turns sharding off
+
+    @validator('shards')
+    def validate_shards(cls, v):
+        if not 0 <= v <= 64:
+            raise ValueError('shards must be between 0 and 64')
+        return v
+
+@router.put("/wallets/{wallet_id}/shards")
+async def set_wallet_shards(wallet_id: int, request: WalletShardsRequest, db: DbSession = Depends(get_session)):
+    """Spread credits to a hot wallet over N balance slots (compacts existing slots first)"""
+    result = await WalletService.set_balance_shards(db, wallet_id, request.shards)
+    if result["success"]:
+        return result
+    raise HTTPException(status_code=400, detail=result["error"])
@@ -1,7 +1,6 @@
-# app/routes/payment.py
+# app/api/payment.py
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import DbSession, get_session
 from app.services.razorpay_service import create_payment_order, verify_payment, handle_webhook
 from pydantic import BaseModel
 
@@ -14,21 +13,18 @@ class PaymentVerificationRequest(BaseModel):
     user_id: int
 
 @router.post("/create-order")
-def create_payment(plan_id: int, db: Session = Depends(get_db)):
-    return create_payment_order(db, plan_id)
+async def create_payment(plan_id: int):
+    return await create_payment_order(plan_id)
 
 @router.post("/verify")
-def verify_payment_endpoint(
-    payment_data: PaymentVerificationRequest, 
-    db: Session = Depends(get_db)
-):
+async def verify_payment_endpoint(payment_data: PaymentVerificationRequest):
     """Verify payment after user completes payment on frontend"""
-    return verify_payment(db, payment_data)
+    return await verify_payment(payment_data)
 
 @router.post("/webhook")
-async def razorpay_webhook(request: Request, db: Session = Depends(get_db)):
+async def razorpay_webhook(request: Request, db: DbSession = Depends(get_session)):
     """Handle Razorpay webhooks for automatic payment updates"""
     body = await request.body()
     signature = request.headers.get("X-Razorpay-Signature")
-    return handle_webhook(db, body, signature)
-
+    event_id = request.headers.get("X-Razorpay-Event-Id")
+    return await handle_webhook(db, body, signature, event_id)
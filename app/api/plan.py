@@ -1,15 +1,40 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from app.schemas.user import PlanCreate
 from app.models.user import Plan
-from app.database import get_db
+from app.database import DbSession, get_session
+from app.services.plan_catalog import plan_catalog, CatalogUnavailable
+from app.api.conditional import make_etag, validator_headers, is_not_modified, not_modified_response
 
 router = APIRouter(prefix="/plan", tags=["Plan"])
 
 @router.post("/")
-def create_plan(plan: PlanCreate, db: Session = Depends(get_db)):
+async def create_plan(plan: PlanCreate, db: DbSession = Depends(get_session)):
     new_plan = Plan(**plan.dict())
     db.add(new_plan)
-    db.commit()
-    db.refresh(new_plan)
+    await db.commit()
+    await db.refresh(new_plan)
     return {"message": "Plan created", "id": new_plan.plan_id}
+
+@router.get("/")
+async def list_plans(request: Request, response: Response, include_inactive: bool = False):
+    """Plans with their active features, served from the in-process plan catalog"""
+    try:
+        plans, digest = plan_catalog.plans(include_inactive)
+    except CatalogUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=e.headers)
+    etag = make_etag("plans", digest, include_inactive)
+    if is_not_modified(request, etag, None):
+        return not_modified_response("plans", etag, None)
+    response.headers.update(validator_headers(etag, None))
+    return [
+        {
+            "plan_id": plan.plan_id,
+            "plan_name": plan.plan_name,
+            "plan_amount": plan.plan_amount,
+            "price": plan.price,
+            "duration_in_days": plan.duration_in_days,
+            "is_active": plan.is_active,
+            "features": [feature._asdict() for feature in plan.features],
+        }
+        for plan in plans
+    ]
@@ -1,15 +1,14 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 from app.schemas.user import PlanFeatureCreate
 from app.models.user import PlanFeature
-from app.database import get_db
+from app.database import DbSession, get_session
 
 router = APIRouter(prefix="/plan_feature", tags=["PlanFeature"])
 
 @router.post("/")
-def create_feature(feature: PlanFeatureCreate, db: Session = Depends(get_db)):
+async def create_feature(feature: PlanFeatureCreate, db: DbSession = Depends(get_session)):
     new_feature = PlanFeature(**feature.dict())
     db.add(new_feature)
-    db.commit()
-    db.refresh(new_feature)
+    await db.commit()
+    await db.refresh(new_feature)
     return {"message": "Feature added", "id": new_feature.feature_id}
\ No newline at end of file
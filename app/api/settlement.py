@@ -1,15 +1,14 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 from app.schemas.user import SettlementCreate
 from app.models.user import Settlement
-from app.database import get_db
+from app.database import DbSession, get_session
 
 router = APIRouter(prefix="/settlement", tags=["Settlement"])
 
 @router.post("/")
-def create_settlement(data: SettlementCreate, db: Session = Depends(get_db)):
+async def create_settlement(data: SettlementCreate, db: DbSession = Depends(get_session)):
     new_settlement = Settlement(**data.dict())
     db.add(new_settlement)
-    db.commit()
-    db.refresh(new_settlement)
+    await db.commit()
+    await db.refresh(new_settlement)
     return {"message": "Settlement recorded", "id": new_settlement.settlement_id}
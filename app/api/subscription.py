@@ -1,37 +1,29 @@
-import razorpay
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
 from app.schemas.user import SubscriptionCreate
 from app.services.subscription_service import SubscriptionService
-from app.models.user import Plan  # assuming your Plan model is here
-from app.database import get_db
+from app.services.razorpay_gateway import razorpay_gateway, verify_payment_signature, GatewayError
+from app.services.plan_catalog import plan_catalog, CatalogUnavailable
+from app.database import DbSession, get_session
+from app.config import RAZORPAY_KEY_ID
 from typing import Dict, Any
-import os
-from dotenv import load_dotenv
 router = APIRouter(prefix="/subscription", tags=["Subscription"])
 
-load_dotenv()
-
-RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
-RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
-
-# Razorpay client
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID,RAZORPAY_KEY_SECRET))
-
 @router.post("/create_order", response_model=Dict[str, Any])
-def create_order(sub: SubscriptionCreate, db: Session = Depends(get_db)):
-    plan = db.query(Plan).filter(Plan.plan_id == sub.plan_id).first()
+async def create_order(sub: SubscriptionCreate):
+    try:
+        plan = plan_catalog.get(sub.plan_id)
+    except CatalogUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=e.headers)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
 
-    amount_paise = int(plan.price * 100)  # Razorpay takes amount in paise
+    amount_paise = plan.price  # stored in paise, which is what Razorpay takes
 
     # Create order in Razorpay
-    razorpay_order = razorpay_client.order.create({
-        "amount": amount_paise,
-        "currency": "INR",
-        "payment_capture": "1"
-    })
+    try:
+        razorpay_order = await razorpay_gateway.create_order(amount=amount_paise)
+    except GatewayError as e:
+        raise HTTPException(status_code=e.http_status, detail=f"Failed to create Razorpay order: {e}", headers=e.headers)
 
     return {
         "order_id": razorpay_order["id"],
@@ -45,22 +37,20 @@ def create_order(sub: SubscriptionCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/verify_and_subscribe", response_model=Dict[str, Any])
-def verify_and_subscribe(
+async def verify_and_subscribe(
     payload: Dict[str, Any],
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_session)
 ):
-    try:
-        # Razorpay verification
-        razorpay_client.utility.verify_payment_signature({
-            "razorpay_order_id": payload["razorpay_order_id"],
-            "razorpay_payment_id": payload["razorpay_payment_id"],
-            "razorpay_signature": payload["razorpay_signature"]
-        })
-    except razorpay.errors.SignatureVerificationError:
+    # Razorpay verification
+    if not verify_payment_signature(
+        payload["razorpay_order_id"],
+        payload["razorpay_payment_id"],
+        payload["razorpay_signature"]
+    ):
         raise HTTPException(status_code=400, detail="Razorpay Signature Verification Failed")
 
     # If verification passes, call your subscription procedure
-    result = SubscriptionService.handle_subscription(
+    result = await SubscriptionService.handle_subscription(
         db=db,
         wallet_id=payload["wallet_id"],
         plan_id=payload["plan_id"],
@@ -1,15 +1,44 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from datetime import datetime
+from typing import Optional
 from app.schemas.user import WalletCreate
 from app.models.user import Wallet
-from app.database import get_db
+from app.database import DbSession, get_session
+from app.services.wallet_service import WalletService
+from app.api.conditional import balance_validators, validator_headers, is_not_modified, not_modified_response
 
 router = APIRouter(prefix="/wallet", tags=["Wallet"])
 
 @router.post("/")
-def create_wallet(wallet: WalletCreate, db: Session = Depends(get_db)):
+async def create_wallet(wallet: WalletCreate, db: DbSession = Depends(get_session)):
     new_wallet = Wallet(**wallet.dict())
     db.add(new_wallet)
-    db.commit()
-    db.refresh(new_wallet)
+    await db.commit()
+    await db.refresh(new_wallet)
     return {"message": "Wallet created", "id": new_wallet.wallet_id}
+
+@router.get("/{wallet_id}/balance")
+async def get_wallet_balance(
+    wallet_id: int,
+    request: Request,
+    response: Response,
+    as_of: Optional[datetime] = None,
+    db: DbSession = Depends(get_session)
+):
+    """Current balances, or the balances at as_of when given."""
+    if as_of is not None:
+        result = await WalletService.get_balance_as_of(db, wallet_id, as_of)
+        if result["success"]:
+            return result
+        raise HTTPException(status_code=404, detail=result["error"])
+
+    result = await WalletService.get_wallet_balance(db, wallet_id)
+
+    if result["success"]:
+        etag, last_modified = balance_validators(result)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response("wallet_balance", etag, last_modified)
+        response.headers.update(validator_headers(etag, last_modified))
+        return result
+    else:
+        raise HTTPException(status_code=404, detail=result["error"])
@@ -1,31 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Body, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, JSONResponse
 from app.schemas.user import WalletTransactionCreate
 from app.models.user import WalletTransaction
-from app.database import get_db
-from app.services.wallet_service import WalletService
+from app.database import DbSession, get_session
+from app.services.wallet_service import WalletService, decode_cursor
+from app.services import idempotency
+from app.services.idempotency import IdempotencyConflict
+from app.api.conditional import (
+    make_etag,
+    balance_validators,
+    validator_headers,
+    is_not_modified,
+    not_modified_response,
+)
+from app.services.razorpay_gateway import razorpay_gateway, verify_payment_signature, GatewayError
+from app.services.razorpay_service import razorpay_credit_params
+from app.config import (
+    RAZORPAY_KEY_ID,
+    WALLET_TXN_ASYNC_INGEST,
+    WALLET_TXN_BATCH_MAX_ITEMS,
+    TRANSACTIONS_PAGE_DEFAULT_LIMIT,
+    TRANSACTIONS_PAGE_MAX_LIMIT,
+)
 from pydantic import BaseModel, validator
-from typing import Optional
-import os
-import razorpay
-import hmac
-import hashlib
-from dotenv import load_dotenv
+from typing import List, Optional
+from datetime import datetime
+import json
 router = APIRouter(prefix="/wallet_transaction", tags=["WalletTransaction"])
 
-
-load_dotenv()
-
-RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
-RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
-
-# Razorpay client
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID,RAZORPAY_KEY_SECRET))
-
 class WalletTransactionRequest(BaseModel):
     wallet_id: int
     transaction_type: str  # 'credit' or 'debit'
-    amount: float
+    amount: int  # paise
     source: str
     remark: Optional[str] = None
     additional_info: Optional[str] = None
@@ -43,86 +50,217 @@ class WalletTransactionRequest(BaseModel):
         return v
 
 @router.post("/")
-def process_wallet_transaction(request: WalletTransactionRequest, db: Session = Depends(get_db)):
+async def process_wallet_transaction(
+    request: WalletTransactionRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    db: DbSession = Depends(get_session)
+):
+    """Apply a credit/debit, or queue it and answer 202 with a ticket.
+
+    Queueing happens when WALLET_TXN_ASYNC_INGEST is set or the client sends
+    "Prefer: respond-async"; poll GET /wallet_transaction/tickets/{ticket_id}.
+
+    With an Idempotency-Key header a retry gets the original response (marked
+    "Idempotent-Replayed: true") and the wallet is not touched again. Reusing
+    a key on the same wallet for a different request is rejected with 422
+    until the key expires (IDEMPOTENCY_KEY_TTL_HOURS).
+    """
+    key = None
+    if idempotency_key is not None:
+        if not idempotency_key or len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{idempotency.MAX_KEY_LENGTH} characters")
+        key = idempotency.client_key(idempotency_key, request.wallet_id, request.dict())
+
+    try:
+        if WALLET_TXN_ASYNC_INGEST or "respond-async" in http_request.headers.get("prefer", ""):
+            result = await WalletService.enqueue_transaction(
+                db=db,
+                wallet_id=request.wallet_id,
+                transaction_type=request.transaction_type,
+                amount=request.amount,
+                source=request.source,
+                remark=request.remark,
+                additional_info=request.additional_info,
+                idempotency_key=key
+            )
+        else:
+            result = await WalletService.process_transaction(
+                db=db,
+                wallet_id=request.wallet_id,
+                transaction_type=request.transaction_type,
+                amount=request.amount,
+                source=request.source,
+                remark=request.remark,
+                additional_info=request.additional_info,
+                idempotency_key=key
+            )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    replayed = result.pop("replayed", False)
+    headers = {"Idempotent-Replayed": "true"} if replayed else {}
+
+    # A key first used while queueing replays the ticket, whichever mode the retry hits
+    if "ticket_id" in result:
+        status_url = f"{router.prefix}/tickets/{result['ticket_id']}"
+        return JSONResponse(
+            status_code=202,
+            content={"message": "Transaction queued", **result, "status_url": status_url},
+            headers={"Location": status_url, **headers}
+        )
 
-    result = WalletService.process_transaction(
-        db=db,
-        wallet_id=request.wallet_id,
-        transaction_type=request.transaction_type,
-        amount=request.amount,
-        source=request.source,
-        remark=request.remark,
-        additional_info=request.additional_info
-    )
-    
     if result["success"]:
-        return {
-            "message": f"Transaction processed successfully",
-            "transaction_details": result
-        }
+        return JSONResponse(
+            content=jsonable_encoder({
+                "message": f"Transaction processed successfully",
+                "transaction_details": result
+            }),
+            headers=headers
+        )
     else:
         raise HTTPException(status_code=400, detail=result["error"])
 
+class WalletTransactionBatchRequest(BaseModel):
+    items: List[WalletTransactionRequest]
+    chunk_size: Optional[int] = None  # None = whole batch in one database transaction
+
+    @validator('items')
+    def validate_items(cls, v):
+        if not v:
+            raise ValueError('items must not be empty')
+        if len(v) > WALLET_TXN_BATCH_MAX_ITEMS:
+            raise ValueError(f'at most {WALLET_TXN_BATCH_MAX_ITEMS} items per batch')
+        return v
+
+    @validator('chunk_size')
+    def validate_chunk_size(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('chunk_size must be greater than 0')
+        return v
+
+@router.post("/batch")
+async def process_wallet_transaction_batch(request: WalletTransactionBatchRequest, db: DbSession = Depends(get_session)):
+    """Apply many credits/debits; each chunk commits or rolls back as a unit"""
+    results = await WalletService.process_batch(
+        db=db,
+        items=[item.dict() for item in request.items],
+        chunk_size=request.chunk_size
+    )
+    applied = sum(1 for r in results if r["success"])
+
+    return {
+        "message": "Batch processed",
+        "applied": applied,
+        "failed": len(results) - applied,
+        "results": results
+    }
+
+@router.get("/tickets/{ticket_id}")
+async def get_transaction_ticket(ticket_id: int, db: DbSession = Depends(get_session)):
+    """Status of a queued transaction: pending, applied or failed."""
+    ticket = await WalletService.get_ticket(db, ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return ticket
+
 @router.post("/legacy")
-def create_transaction_legacy(txn: WalletTransactionCreate, db: Session = Depends(get_db)):
+async def create_transaction_legacy(txn: WalletTransactionCreate, db: DbSession = Depends(get_session)):
     """Legacy endpoint - creates transaction without stored procedure logic"""
     new_txn = WalletTransaction(**txn.dict())
     db.add(new_txn)
-    db.commit()
-    db.refresh(new_txn)
+    await db.commit()
+    await db.refresh(new_txn)
     return {"message": "Transaction logged", "id": new_txn.transaction_id}
 
 @router.get("/{wallet_id}/balance")
-def get_wallet_balance(wallet_id: int, db: Session = Depends(get_db)):
+async def get_wallet_balance(wallet_id: int, request: Request, response: Response, db: DbSession = Depends(get_session)):
     """Get current wallet balance details"""
-    result = WalletService.get_wallet_balance(db, wallet_id)
+    result = await WalletService.get_wallet_balance(db, wallet_id)
     
     if result["success"]:
+        etag, last_modified = balance_validators(result)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response("wallet_balance", etag, last_modified)
+        response.headers.update(validator_headers(etag, last_modified))
         return result
     else:
         raise HTTPException(status_code=404, detail=result["error"])
 
 @router.get("/{wallet_id}/transactions")
-def get_wallet_transactions(wallet_id: int, db: Session = Depends(get_db)):
-    """Get all transactions for a wallet"""
-    transactions = db.query(WalletTransaction).filter(
-        WalletTransaction.wallet_id == wallet_id
-    ).order_by(WalletTransaction.updated_at.desc()).all()
-    
-    return {
-        "wallet_id": wallet_id,
-        "transactions": [
-            {
-                "transaction_id": txn.transaction_id,
-                "transaction_type": txn.transaction_type,
-                "amount": txn.amount,
-                "previous_balance": txn.previous_balance,
-                "current_balance": txn.current_balance,
-                "source": txn.source,
-                "remark": txn.remark,
-                "additional_info": txn.additional_info,
-                "updated_at": txn.updated_at
-            }
-            for txn in transactions
-        ]
-    }
+async def get_wallet_transactions(
+    wallet_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(TRANSACTIONS_PAGE_DEFAULT_LIMIT, ge=1, le=TRANSACTIONS_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: DbSession = Depends(get_session)
+):
+    """Transactions for a wallet, newest first.
+
+    format=json returns one page and a next_cursor; format=ndjson streams
+    every transaction after the cursor, one JSON object per line.
+
+    The ETag is derived from the newest ledger row and the wallet's version,
+    so an unchanged ledger is answered with 304 before any page is built.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    head = await WalletService.get_ledger_head(db, wallet_id)
+    # Hand the connection back: the page is loaded on its own session when
+    # coalesced, and holding two per request would exhaust the pool
+    await db.rollback()
+    head_id, last_modified, version = head if head else (None, None, None)
+    etag = make_etag("transactions", wallet_id, head_id, version, last_modified, limit, cursor, format)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response("wallet_transactions", etag, last_modified)
+    headers = validator_headers(etag, last_modified)
+
+    if format == "ndjson":
+        return StreamingResponse(
+            _ndjson_lines(WalletService.stream_transactions(wallet_id, cursor)),
+            media_type="application/x-ndjson",
+            headers=headers
+        )
+
+    response.headers.update(headers)
+    return await WalletService.get_transaction_page(db, wallet_id, limit, cursor)
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+async def _ndjson_lines(rows, lines_per_chunk: int = 500):
+    buffer = []
+    async for row in rows:
+        buffer.append(json.dumps(row, default=_json_default))
+        if len(buffer) >= lines_per_chunk:
+            yield "\n".join(buffer) + "\n"
+            buffer = []
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
 class RazorpayOrderRequest(BaseModel):
     wallet_id: int
-    amount: float  # in rupees (will be converted to paise on backend)
+    amount: int  # in paise
 
 @router.post("/create_order")
-def create_razorpay_order(request: RazorpayOrderRequest):
+async def create_razorpay_order(request: RazorpayOrderRequest):
     """
     Create Razorpay order and return order_id, amount, key_id, etc.
     """
     try:
-        amount_paise = int(request.amount * 100)
+        amount_paise = request.amount
 
-        razorpay_order = razorpay_client.order.create({
-            "amount": amount_paise,
-            "currency": "INR",
-            "payment_capture": 1
-        })
+        # The webhook worker finds the wallet to credit through the notes
+        razorpay_order = await razorpay_gateway.create_order(
+            amount=amount_paise,
+            notes={"wallet_id": str(request.wallet_id)}
+        )
 
         return {
             "key_id": RAZORPAY_KEY_ID,
@@ -132,52 +270,56 @@ def create_razorpay_order(request: RazorpayOrderRequest):
             "wallet_id": request.wallet_id,
             "input_amount": request.amount
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create Razorpay order: {str(e)}")
+    except GatewayError as e:
+        raise HTTPException(status_code=e.http_status, detail=f"Failed to create Razorpay order: {str(e)}", headers=e.headers)
 
 class RazorpayCreditRequest(BaseModel):
     razorpay_payment_id: str
     razorpay_order_id: str
     razorpay_signature: str
     wallet_id: int
-    amount: float  # original amount entered by user
+    amount: int  # original amount entered by user, in paise
 
 
 @router.post("/verify_and_credit")
-def verify_and_credit_via_razorpay(request: RazorpayCreditRequest, db: Session = Depends(get_db)):
+async def verify_and_credit_via_razorpay(request: RazorpayCreditRequest, db: DbSession = Depends(get_session)):
     """
     Verify Razorpay payment and credit wallet with amount * 10
+
+    The payment id is the idempotency key: a payment credits at most one
+    wallet once, and retries get the original response back.
     """
     try:
         # Step 1: Verify signature
-        payload = f"{request.razorpay_order_id}|{request.razorpay_payment_id}"
-        expected_signature = hmac.new(
-            RAZORPAY_KEY_SECRET.encode(),
-            payload.encode(),
-            hashlib.sha256
-        ).hexdigest()
-
-        if expected_signature != request.razorpay_signature:
+        if not verify_payment_signature(
+            request.razorpay_order_id, request.razorpay_payment_id, request.razorpay_signature
+        ):
             raise HTTPException(status_code=400, detail="Razorpay Signature Verification Failed")
 
         # Step 2: Process Wallet Credit
-        result = WalletService.process_transaction(
+        result = await WalletService.process_transaction(
             db=db,
-            wallet_id=request.wallet_id,
-            transaction_type="credit",
-            amount=request.amount * 10,
-            source="razorpay",
-            remark="Credited via Razorpay payment",
-            additional_info=f"Payment ID: {request.razorpay_payment_id}"
+            **razorpay_credit_params(request.wallet_id, request.amount, request.razorpay_payment_id),
+            idempotency_key=idempotency.razorpay_payment_key(
+                request.razorpay_payment_id, request.wallet_id, request.amount
+            )
         )
 
+        replayed = result.pop("replayed", False)
         if result["success"]:
-            return {
-                "message": "Wallet credited successfully after Razorpay payment",
-                "transaction_details": result
-            }
+            return JSONResponse(
+                content=jsonable_encoder({
+                    "message": "Wallet credited successfully after Razorpay payment",
+                    "transaction_details": result
+                }),
+                headers={"Idempotent-Replayed": "true"} if replayed else {}
+            )
         else:
             raise HTTPException(status_code=500, detail=result["error"])
 
+    except HTTPException:
+        raise
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Razorpay payment already credited to a different wallet or amount")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
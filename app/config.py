@@ -1,13 +1,110 @@
 # app/config.py
 import os
 from dotenv import load_dotenv
-import razorpay
 
 # Load environment variables
 load_dotenv()
 
-RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
-RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
+# RAZORPAY_USE_STUB points the gateway client at the local stub server
+# (python -m app.stubs.razorpay_stub) instead of api.razorpay.com, and falls
+# back to the stub's test credentials when no keys are set
+RAZORPAY_USE_STUB = os.getenv("RAZORPAY_USE_STUB", "false").lower() == "true"
+RAZORPAY_STUB_URL = os.getenv("RAZORPAY_STUB_URL", "http://127.0.0.1:9010/v1")
 
-# Initialize Razorpay client
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
\ No newline at end of file
+RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID", "rzp_test_stub" if RAZORPAY_USE_STUB else None)
+RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "stub_key_secret" if RAZORPAY_USE_STUB else None)
+# Secret Razorpay signs webhook bodies with (X-Razorpay-Signature)
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET", "stub_webhook_secret" if RAZORPAY_USE_STUB else None)
+
+# Razorpay gateway (app.services.razorpay_gateway). Timeouts are in seconds;
+# RAZORPAY_MAX_CONCURRENCY bounds in-flight gateway calls per process, and
+# retries back off exponentially from RAZORPAY_RETRY_BASE_DELAY_SECONDS with
+# full jitter.
+RAZORPAY_API_BASE_URL = RAZORPAY_STUB_URL if RAZORPAY_USE_STUB else os.getenv("RAZORPAY_API_BASE_URL", "https://api.razorpay.com/v1")
+RAZORPAY_CONNECT_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_CONNECT_TIMEOUT_SECONDS", "2"))
+RAZORPAY_READ_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_READ_TIMEOUT_SECONDS", "10"))
+RAZORPAY_POOL_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_POOL_TIMEOUT_SECONDS", "2"))
+RAZORPAY_MAX_CONNECTIONS = int(os.getenv("RAZORPAY_MAX_CONNECTIONS", "50"))
+RAZORPAY_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("RAZORPAY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+RAZORPAY_MAX_CONCURRENCY = int(os.getenv("RAZORPAY_MAX_CONCURRENCY", "50"))
+RAZORPAY_MAX_RETRIES = int(os.getenv("RAZORPAY_MAX_RETRIES", "2"))
+RAZORPAY_RETRY_BASE_DELAY_SECONDS = float(os.getenv("RAZORPAY_RETRY_BASE_DELAY_SECONDS", "0.2"))
+RAZORPAY_RETRY_MAX_DELAY_SECONDS = float(os.getenv("RAZORPAY_RETRY_MAX_DELAY_SECONDS", "2"))
+
+# Build the wallet transaction response from the row returned by
+# process_wallet_transaction_full instead of re-reading wallet and ledger
+WALLET_TXN_SINGLE_ROUND_TRIP = os.getenv("WALLET_TXN_SINGLE_ROUND_TRIP", "true").lower() == "true"
+
+# Upper bound on items accepted by POST /wallet_transaction/batch
+WALLET_TXN_BATCH_MAX_ITEMS = int(os.getenv("WALLET_TXN_BATCH_MAX_ITEMS", "10000"))
+
+# Transaction history: default/maximum page size and rows fetched per
+# server-side cursor round trip when streaming NDJSON exports
+TRANSACTIONS_PAGE_DEFAULT_LIMIT = int(os.getenv("TRANSACTIONS_PAGE_DEFAULT_LIMIT", "100"))
+TRANSACTIONS_PAGE_MAX_LIMIT = int(os.getenv("TRANSACTIONS_PAGE_MAX_LIMIT", "1000"))
+TRANSACTIONS_STREAM_BATCH_SIZE = int(os.getenv("TRANSACTIONS_STREAM_BATCH_SIZE", "1000"))
+
+# Cold storage: rows older than ARCHIVE_HORIZON_MONTHS are moved out of
+# wallet_transaction/subscription_history into Parquet files under
+# ARCHIVE_DIR, one file per month and block of ARCHIVE_WALLETS_PER_SEGMENT wallet ids
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_HORIZON_MONTHS = int(os.getenv("ARCHIVE_HORIZON_MONTHS", "12"))
+ARCHIVE_WALLETS_PER_SEGMENT = int(os.getenv("ARCHIVE_WALLETS_PER_SEGMENT", "10000"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+# Rows fetched per server-side cursor round trip (and Parquet record batch) when archiving
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "10000"))
+
+# Wallet balance cache. BALANCE_CACHE_BACKEND: "local" (per-process LRU only),
+# "redis" (LRU in front of Redis at BALANCE_CACHE_REDIS_URL) or "memory"
+# (LRU in front of an in-process stand-in for Redis)
+BALANCE_CACHE_ENABLED = os.getenv("BALANCE_CACHE_ENABLED", "true").lower() == "true"
+BALANCE_CACHE_BACKEND = os.getenv("BALANCE_CACHE_BACKEND", "local")
+BALANCE_CACHE_LOCAL_TTL_SECONDS = float(os.getenv("BALANCE_CACHE_LOCAL_TTL_SECONDS", "2"))
+BALANCE_CACHE_SHARED_TTL_SECONDS = float(os.getenv("BALANCE_CACHE_SHARED_TTL_SECONDS", "60"))
+BALANCE_CACHE_MAX_ENTRIES = int(os.getenv("BALANCE_CACHE_MAX_ENTRIES", "100000"))
+BALANCE_CACHE_REDIS_URL = os.getenv("BALANCE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Share one in-flight query between concurrent identical balance/history reads
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Queue POST /wallet_transaction/ for app.jobs.ingest_worker and answer 202
+# with a ticket instead of applying it inline. Clients can also opt in per
+# request with "Prefer: respond-async".
+WALLET_TXN_ASYNC_INGEST = os.getenv("WALLET_TXN_ASYNC_INGEST", "false").lower() == "true"
+
+# How long an Idempotency-Key sent to POST /wallet_transaction/ is remembered.
+# Razorpay payment ids never expire. Expired keys are removed by
+# app.jobs.idempotency_keys.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+# Circuit breaker and bulkhead around the Razorpay gateway. The breaker opens
+# when, over the last RAZORPAY_BREAKER_WINDOW_SIZE calls (and at least
+# RAZORPAY_BREAKER_MIN_CALLS), the failure rate or the rate of calls slower
+# than RAZORPAY_BREAKER_SLOW_CALL_SECONDS reaches its threshold; it then fails
+# calls fast with 503 for RAZORPAY_BREAKER_OPEN_SECONDS before letting
+# RAZORPAY_BREAKER_HALF_OPEN_CALLS probes through. A call that cannot get one
+# of the RAZORPAY_MAX_CONCURRENCY bulkhead slots within
+# RAZORPAY_BULKHEAD_MAX_WAIT_SECONDS is also rejected with 503.
+RAZORPAY_BREAKER_ENABLED = os.getenv("RAZORPAY_BREAKER_ENABLED", "true").lower() == "true"
+RAZORPAY_BREAKER_WINDOW_SIZE = int(os.getenv("RAZORPAY_BREAKER_WINDOW_SIZE", "50"))
+RAZORPAY_BREAKER_MIN_CALLS = int(os.getenv("RAZORPAY_BREAKER_MIN_CALLS", "20"))
+RAZORPAY_BREAKER_FAILURE_RATE = float(os.getenv("RAZORPAY_BREAKER_FAILURE_RATE", "0.5"))
+RAZORPAY_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("RAZORPAY_BREAKER_SLOW_CALL_SECONDS", "3"))
+RAZORPAY_BREAKER_SLOW_CALL_RATE = float(os.getenv("RAZORPAY_BREAKER_SLOW_CALL_RATE", "0.8"))
+RAZORPAY_BREAKER_OPEN_SECONDS = float(os.getenv("RAZORPAY_BREAKER_OPEN_SECONDS", "30"))
+RAZORPAY_BREAKER_HALF_OPEN_CALLS = int(os.getenv("RAZORPAY_BREAKER_HALF_OPEN_CALLS", "3"))
+RAZORPAY_BULKHEAD_MAX_WAIT_SECONDS = float(os.getenv("RAZORPAY_BULKHEAD_MAX_WAIT_SECONDS", "0.1"))
+
+# Razorpay webhook inbox (app.jobs.webhook_worker): a failing event is retried
+# with exponential backoff from WEBHOOK_RETRY_BASE_SECONDS (capped at
+# WEBHOOK_RETRY_MAX_SECONDS) and dead-lettered after WEBHOOK_MAX_ATTEMPTS
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", "5"))
+WEBHOOK_RETRY_MAX_SECONDS = float(os.getenv("WEBHOOK_RETRY_MAX_SECONDS", "3600"))
+
+# In-process plan/plan_feature catalog (app.services.plan_catalog), loaded at
+# startup and reloaded when the plan_catalog trigger NOTIFYs a change. A full
+# reload also runs every PLAN_CATALOG_REFRESH_SECONDS in case a notification
+# was missed; the listener reconnects after PLAN_CATALOG_RECONNECT_SECONDS.
+PLAN_CATALOG_REFRESH_SECONDS = float(os.getenv("PLAN_CATALOG_REFRESH_SECONDS", "300"))
+PLAN_CATALOG_RECONNECT_SECONDS = float(os.getenv("PLAN_CATALOG_RECONNECT_SECONDS", "5"))
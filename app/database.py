@@ -1,17 +1,126 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, Generator, Union
 import os
+import time
 from dotenv import load_dotenv
+from app.metrics import metrics
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# "sync" runs every query on a psycopg2 connection in Starlette's threadpool,
+# "async" runs it on the event loop through asyncpg. Routers are the same in both.
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+if DB_MODE not in ("sync", "async"):
+    raise ValueError("DB_MODE must be either 'sync' or 'async'")
+
+
+def _async_url(url: str) -> str:
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(SQLALCHEMY_DATABASE_URL)
+
+# Connection pool settings, shared by the sync and async engines
+POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    "pool_use_lifo": os.getenv("DB_POOL_USE_LIFO", "false").lower() == "true",
+}
+
+
+class _TimedCheckout:
+    """Records how long callers wait for a pooled connection."""
+
+    metrics_name = "db.pool"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            metrics.incr(f"{self.metrics_name}.acquire_failures")
+            raise
+        finally:
+            metrics.observe(f"{self.metrics_name}.acquire_wait", time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    metrics_name = "db.pool.sync"
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    metrics_name = "db.pool.async"
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, **POOL_SETTINGS)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool, **POOL_SETTINGS)
+
+
+def _instrument_pool(pool, name: str) -> None:
+    prefix = f"db.pool.{name}"
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.incr(f"{prefix}.connections_opened")
+
+    @event.listens_for(pool, "close")
+    def _on_close(dbapi_connection, connection_record):
+        metrics.incr(f"{prefix}.connections_closed")
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.incr(f"{prefix}.connections_invalidated")
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.incr(f"{prefix}.checkouts")
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics.incr(f"{prefix}.checkins")
+
+
+def _pool_status(pool) -> Dict[str, Any]:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # QueuePool counts overflow from -pool_size; only positive values are extra connections
+        "overflow_in_use": max(pool.overflow(), 0),
+        "max_overflow": POOL_SETTINGS["max_overflow"],
+    }
+
+
+def pool_status() -> Dict[str, Any]:
+    """Live state of both connection pools."""
+    return {
+        "mode": DB_MODE,
+        "settings": POOL_SETTINGS,
+        "sync": _pool_status(engine.pool),
+        "async": _pool_status(async_engine.sync_engine.pool),
+    }
+
+
+_instrument_pool(engine.pool, "sync")
+_instrument_pool(async_engine.sync_engine.pool, "async")
+metrics.gauge("db.pool", pool_status)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -21,3 +130,109 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class ThreadpoolSession:
+    """Awaitable facade over a sync Session.
+
+    Exposes the subset of the AsyncSession API the routers and services use,
+    running each blocking call in Starlette's threadpool. This is what the
+    async code paths talk to when DB_MODE=sync.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    @staticmethod
+    def _buffer(result):
+        # Fetch everything while still on the worker thread
+        if result.returns_rows:
+            return result.freeze()()
+        return result
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(
+            lambda: self._buffer(self.sync_session.execute(statement, params, **kwargs))
+        )
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        result = await self.execute(statement, params, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def refresh(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def stream(self, statement, params=None, **kwargs):
+        """Like AsyncSession.stream: rows are fetched a partition at a time."""
+        result = await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+        return _iterate_in_threadpool(result)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+async def _iterate_in_threadpool(result):
+    partitions = result.partitions()
+    while True:
+        rows = await run_in_threadpool(next, partitions, None)
+        if rows is None:
+            break
+        for row in rows:
+            yield row
+
+
+async def get_threadpool_db() -> AsyncGenerator[ThreadpoolSession, None]:
+    db = ThreadpoolSession(SessionLocal())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+DbSession = Union[AsyncSession, ThreadpoolSession]
+
+# Dependency used by the routers; DB_MODE picks the implementation
+get_session = get_async_db if DB_MODE == "async" else get_threadpool_db
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncGenerator[DbSession, None]:
+    """Session for code that runs outside a request (background tasks, jobs)."""
+    if DB_MODE == "async":
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = ThreadpoolSession(SessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
@@ -0,0 +1,150 @@
+# app/jobs/archive.py
+"""Move ledger rows older than the hot horizon into Parquet cold storage.
+
+Usage:
+    python -m app.jobs.archive [--horizon-months 12] [--table wallet_transaction] [--dry-run]
+
+Rows are split by calendar month and by blocks of ARCHIVE_WALLETS_PER_SEGMENT
+wallet ids. For each segment the rows are streamed into the file first,
+without locks (months past the horizon are immutable), then the pointer row
+is upserted and the hot rows deleted in one short transaction, so a crash at
+any point leaves the rows either hot or archived (re-running merges the file).
+
+Deleting leaves the old wallet_transaction partitions empty; release them
+with `python -m app.jobs.partitions detach --drop`.
+"""
+import argparse
+import sys
+from datetime import date
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.config import ARCHIVE_BATCH_ROWS, ARCHIVE_HORIZON_MONTHS, ARCHIVE_WALLETS_PER_SEGMENT
+from app.database import engine
+from app.jobs.partitions import add_months
+from app.services import ledger_archive
+
+
+def _segments(conn, table_name: str, cutoff: date) -> List[Tuple[date, int]]:
+    """(month, wallet block) pairs that have rows before cutoff, oldest first.
+
+    Only months that hold rows come back, so a lone ancient row does not
+    make the job walk every month since then.
+    """
+    time_column = ledger_archive.ARCHIVED_TABLES[table_name]["time_column"]
+    rows = conn.execute(
+        text(f"""
+            SELECT DISTINCT date_trunc('month', {time_column})::DATE AS month, wallet_id / :per_segment AS block
+            FROM {table_name}
+            WHERE {time_column} < :cutoff AND wallet_id IS NOT NULL
+            ORDER BY 1, 2
+        """),
+        {"per_segment": ARCHIVE_WALLETS_PER_SEGMENT, "cutoff": cutoff}
+    ).fetchall()
+    return [(row.month, row.block) for row in rows]
+
+
+def archive_segment(table_name: str, month: date, block: int, dry_run: bool = False) -> int:
+    """Archive one month x wallet block; returns the number of rows moved."""
+    spec = ledger_archive.ARCHIVED_TABLES[table_name]
+    time_column = spec["time_column"]
+    columns = ", ".join(name for name, _ in spec["columns"])
+    wallet_id_from = block * ARCHIVE_WALLETS_PER_SEGMENT
+    wallet_id_to = wallet_id_from + ARCHIVE_WALLETS_PER_SEGMENT
+    params = {
+        "start": month,
+        "end": add_months(month, 1),
+        "wallet_id_from": wallet_id_from,
+        "wallet_id_to": wallet_id_to,
+    }
+    where = (
+        f"{time_column} >= :start AND {time_column} < :end "
+        "AND wallet_id >= :wallet_id_from AND wallet_id < :wallet_id_to"
+    )
+
+    if dry_run:
+        with engine.connect() as conn:
+            return conn.execute(text(f"SELECT count(*) FROM {table_name} WHERE {where}"), params).scalar()
+
+    path = ledger_archive.segment_path(table_name, month, wallet_id_from, wallet_id_to)
+    streamed = 0
+
+    # Months past the horizon no longer change, so the rows are read without
+    # locks and streamed to the file a batch at a time
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=ARCHIVE_BATCH_ROWS).execute(
+            text(f"""
+                SELECT {columns} FROM {table_name} WHERE {where}
+                ORDER BY wallet_id, {time_column}, {spec["key_column"]}
+            """),
+            params
+        )
+        partitions = result.mappings().partitions()
+        first = next(partitions, None)
+        if not first:
+            return 0
+
+        def batches() -> Iterator[List[Dict]]:
+            nonlocal streamed
+            for partition in chain([first], partitions):
+                streamed += len(partition)
+                yield [dict(row) for row in partition]
+
+        row_count = ledger_archive.write_segment(table_name, path, batches())
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO ledger_archive_segment (table_name, month, wallet_id_from, wallet_id_to, path, row_count)
+            VALUES (:table_name, :month, :wallet_id_from, :wallet_id_to, :path, :row_count)
+            ON CONFLICT (table_name, month, wallet_id_from)
+            DO UPDATE SET path = EXCLUDED.path, row_count = EXCLUDED.row_count
+        """), {**params, "table_name": table_name, "month": month, "path": path, "row_count": row_count})
+        deleted = conn.execute(text(f"DELETE FROM {table_name} WHERE {where}"), params).rowcount
+        if deleted != streamed:
+            # Rolls back; the file is merged again on the next run
+            raise RuntimeError(
+                f"{path}: archived {streamed} rows but {deleted} match now; rows are still arriving for {month:%Y-%m}"
+            )
+
+    return streamed
+
+
+def archive(table_name: str, horizon_months: int, dry_run: bool = False, today: Optional[date] = None) -> Dict[str, int]:
+    """Archive every segment of table_name older than the horizon."""
+    cutoff = add_months((today or date.today()).replace(day=1), -horizon_months)
+    with engine.connect() as conn:
+        segments = _segments(conn, table_name, cutoff)
+
+    moved = {}
+    for month, block in segments:
+        count = archive_segment(table_name, month, block, dry_run)
+        if count:
+            moved[ledger_archive.segment_path(
+                table_name, month,
+                block * ARCHIVE_WALLETS_PER_SEGMENT, (block + 1) * ARCHIVE_WALLETS_PER_SEGMENT
+            )] = count
+    return moved
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--horizon-months", type=int, default=ARCHIVE_HORIZON_MONTHS,
+                        help="keep this many whole months in the hot tables")
+    parser.add_argument("--table", choices=sorted(ledger_archive.ARCHIVED_TABLES), action="append",
+                        help="table to archive (repeatable; default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would move without writing")
+    args = parser.parse_args(argv)
+
+    for table_name in args.table or list(ledger_archive.ARCHIVED_TABLES):
+        moved = archive(table_name, args.horizon_months, args.dry_run)
+        verb = "would move" if args.dry_run else "moved"
+        for path, count in moved.items():
+            print(f"{verb} {count} rows -> {path}")
+        print(f"{table_name}: {verb} {sum(moved.values())} rows in {len(moved)} segments")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
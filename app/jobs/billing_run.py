@@ -0,0 +1,320 @@
+# app/jobs/billing_run.py
+"""Bill every unbilled subscription, one wallet update per wallet.
+
+Usage:
+    python -m app.jobs.billing_run [--workers 4] [--chunk-size 5000] [--dry-run]
+    python -m app.jobs.billing_run --resume [--run-id N]
+
+Does what complete_subscription() does for one subscription, for a whole
+wallet_id range in a single statement per chunk:
+
+- one wallet_transaction row per subscription ('credit', source
+  'Subscription', remark 'Subscription for plan N', additional_info
+  'subscription_id=N'), with previous/current balances running in
+  subscription_id order within the wallet;
+- wallet.fixed_balance += the sum of the wallet's plan amounts, once;
+- subscription: is_billed, start_time = NOW(),
+  end_time = NOW() + duration_in_days.
+
+A wallet keeps at most one active subscription: its newest billed one.
+Any other active subscription is deactivated with a 'cancelled' history row,
+as complete_subscription does.
+
+Wallets are split between workers by hashint4(wallet_id), each worker with
+its own job_run checkpoint, so workers never touch the same wallet and an
+interrupted run resumes every unfinished partition (or just --run-id)
+without billing anything twice. Wallet rows are locked FOR NO KEY UPDATE in
+wallet_id order, then their balance shards, as process_wallet_transaction
+does, so a sharded credit's ledger insert is not blocked. Subscriptions
+whose plan is missing are left unbilled. --dry-run only counts what a run
+would bill, per partition. Each chunk's credited wallets are dropped from
+the shared balance cache once it commits.
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.jobs import job_runs
+from app.metrics import metrics
+from app.services.balance_cache import invalidate_shared
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "billing_run"
+
+BILL_CHUNK = text("""
+    WITH candidates AS MATERIALIZED (
+        SELECT DISTINCT s.wallet_id
+        FROM subscription s
+        WHERE NOT s.is_billed
+          AND s.wallet_id >= :wallet_id_from AND s.wallet_id < :wallet_id_to
+          AND (hashint4(s.wallet_id) & 2147483647) % :partitions = :partition
+    ),
+    locked AS MATERIALIZED (
+        SELECT w.wallet_id, w.monthly_balance, w.fixed_balance
+        FROM wallet w
+        WHERE w.wallet_id IN (SELECT wallet_id FROM candidates)
+        ORDER BY w.wallet_id
+        FOR NO KEY UPDATE OF w
+    ),
+    slots AS MATERIALIZED (
+        SELECT sh.wallet_id, sh.fixed_balance
+        FROM wallet_balance_shard sh
+        WHERE sh.wallet_id IN (SELECT wallet_id FROM locked)
+        ORDER BY sh.wallet_id, sh.slot
+        FOR UPDATE OF sh
+    ),
+    -- Re-checked under the wallet locks, so a subscription billed meanwhile
+    -- is left alone
+    due AS MATERIALIZED (
+        SELECT s.subscription_id, s.wallet_id, s.plan_id, s.is_active, p.plan_amount, p.duration_in_days
+        FROM subscription s
+        JOIN plan p ON p.plan_id = s.plan_id
+        WHERE s.wallet_id IN (SELECT wallet_id FROM locked)
+          AND NOT s.is_billed
+        FOR UPDATE OF s
+    ),
+    -- The subscription each wallet is left with, as if complete_subscription
+    -- had run for its due subscriptions in subscription_id order
+    newest AS (
+        SELECT wallet_id, max(subscription_id) AS subscription_id
+        FROM due
+        GROUP BY wallet_id
+    ),
+    superseded AS (
+        UPDATE subscription s
+        SET is_active = FALSE
+        FROM newest n
+        WHERE s.wallet_id = n.wallet_id
+          AND s.is_active
+          AND s.subscription_id NOT IN (SELECT subscription_id FROM due)
+        RETURNING s.subscription_id, s.wallet_id, s.plan_id
+    ),
+    balances AS (
+        SELECT l.wallet_id,
+               l.monthly_balance + l.fixed_balance
+                   + COALESCE((SELECT SUM(sl.fixed_balance) FROM slots sl WHERE sl.wallet_id = l.wallet_id), 0)
+                   AS balance
+        FROM locked l
+    ),
+    ledger AS (
+        INSERT INTO wallet_transaction (
+            wallet_id, transaction_type, amount, previous_balance, current_balance,
+            updated_at, source, remark, additional_info
+        )
+        SELECT d.wallet_id,
+               'credit',
+               d.plan_amount,
+               b.balance + d.running - d.plan_amount,
+               b.balance + d.running,
+               NOW(),
+               'Subscription',
+               CONCAT('Subscription for plan ', d.plan_id),
+               CONCAT('subscription_id=', d.subscription_id)
+        FROM (
+            SELECT due.*, SUM(due.plan_amount) OVER (PARTITION BY due.wallet_id ORDER BY due.subscription_id) AS running
+            FROM due
+        ) d
+        JOIN balances b ON b.wallet_id = d.wallet_id
+        ORDER BY d.wallet_id, d.subscription_id
+        RETURNING 1
+    ),
+    credited AS (
+        UPDATE wallet w
+        SET fixed_balance = w.fixed_balance + c.amount,
+            updated_at = clock_timestamp()
+        FROM (SELECT wallet_id, SUM(plan_amount) AS amount FROM due GROUP BY wallet_id) c
+        WHERE w.wallet_id = c.wallet_id
+        RETURNING w.wallet_id
+    ),
+    -- Reading superseded's count first keeps the unique index on active
+    -- subscriptions from seeing two at once
+    billed AS (
+        UPDATE subscription s
+        SET is_billed = TRUE,
+            is_active = (s.subscription_id IN (SELECT subscription_id FROM newest)),
+            start_time = NOW(),
+            end_time = NOW() + make_interval(days => due.duration_in_days)
+        FROM due
+        WHERE s.subscription_id = due.subscription_id
+          AND (SELECT count(*) FROM superseded) >= 0
+        RETURNING s.subscription_id
+    ),
+    cancelled AS (
+        INSERT INTO subscription_history (subscription_id, wallet_id, plan_id, status, comment)
+        SELECT subscription_id, wallet_id, plan_id, 'cancelled', 'Auto-cancelled before new subscription'
+        FROM superseded
+        UNION ALL
+        SELECT subscription_id, wallet_id, plan_id, 'cancelled', 'Auto-cancelled before new subscription'
+        FROM due
+        WHERE is_active AND subscription_id NOT IN (SELECT subscription_id FROM newest)
+        RETURNING 1
+    )
+    SELECT
+        (SELECT count(*) FROM billed) AS billed,
+        (SELECT count(*) FROM credited) AS wallets,
+        (SELECT count(*) FROM ledger) AS ledger_rows,
+        (SELECT count(*) FROM cancelled) AS cancelled,
+        (SELECT COALESCE(SUM(plan_amount), 0) FROM due) AS amount,
+        (SELECT array_agg(wallet_id) FROM credited) AS wallet_ids
+""")
+
+WALLET_BOUNDS = text("""
+    SELECT min(wallet_id), max(wallet_id)
+    FROM subscription
+    WHERE NOT is_billed
+""")
+
+PREVIEW = text("""
+    SELECT (hashint4(s.wallet_id) & 2147483647) % :partitions AS partition,
+           count(*) AS subscriptions,
+           count(DISTINCT s.wallet_id) AS wallets,
+           COALESCE(SUM(p.plan_amount), 0) AS amount
+    FROM subscription s
+    JOIN plan p ON p.plan_id = s.plan_id
+    WHERE NOT s.is_billed
+    GROUP BY 1
+    ORDER BY 1
+""")
+
+
+def preview(partitions: int) -> List[Dict[str, Any]]:
+    """What a run with this many workers would bill, per partition; takes no locks."""
+    with engine.connect() as conn:
+        rows = conn.execute(PREVIEW, {"partitions": partitions}).fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def start_runs(partitions: int, chunk_size: int) -> List[Dict[str, Any]]:
+    """One run per partition over the wallets with unbilled subscriptions; [] if there are none."""
+    with engine.connect() as conn:
+        lo, hi = conn.execute(WALLET_BOUNDS).fetchone()
+    if lo is None:
+        return []
+    return [
+        job_runs.start(
+            JOB_NAME,
+            {"partition": i, "partitions": partitions, "chunk_size": chunk_size, "wallet_id_max": hi},
+            lo
+        )
+        for i in range(partitions)
+    ]
+
+
+def run_chunks(run: Dict[str, Any], report_every: float = 5.0) -> Dict[str, Any]:
+    """Bill one partition chunk by chunk from the run's checkpoint to the end of its range."""
+    params = run["params"]
+    chunk_size = params["chunk_size"]
+    totals = {"billed": 0, "wallets": 0, "amount": 0}
+    started = last_report = time.perf_counter()
+
+    wallet_id_from = run["last_key"]
+    while wallet_id_from <= params["wallet_id_max"]:
+        wallet_id_to = wallet_id_from + chunk_size
+        with engine.begin() as conn:
+            job_runs.lock(conn, run["run_id"], wallet_id_from)
+            with metrics.time("billing_run.chunk"):
+                result = conn.execute(BILL_CHUNK, {
+                    "wallet_id_from": wallet_id_from,
+                    "wallet_id_to": wallet_id_to,
+                    "partition": params["partition"],
+                    "partitions": params["partitions"],
+                }).fetchone()
+            job_runs.advance(conn, run["run_id"], wallet_id_to, result.billed)
+        invalidate_shared(result.wallet_ids or ())
+
+        totals["billed"] += result.billed
+        totals["wallets"] += result.wallets
+        totals["amount"] += result.amount
+        metrics.incr("billing_run.billed", result.billed)
+        metrics.incr("billing_run.amount", result.amount)
+        wallet_id_from = wallet_id_to
+
+        now = time.perf_counter()
+        if now - last_report >= report_every:
+            print(f"run {run['run_id']}: wallet_id < {wallet_id_to}, {totals['billed'] / (now - started):.0f} subscriptions/s")
+            last_report = now
+
+    job_runs.finish(run["run_id"])
+    return totals
+
+
+def _run_worker(run: Dict[str, Any], failed: List[int]) -> None:
+    try:
+        totals = run_chunks(run)
+    except Exception:
+        # The run stays 'running' at its last committed chunk for --resume
+        logger.exception("billing run %s failed", run["run_id"])
+        failed.append(run["run_id"])
+        return
+    print(
+        f"run {run['run_id']} (partition {run['params']['partition']}): billed {totals['billed']} subscriptions "
+        f"on {totals['wallets']} wallets ({totals['amount']} paise)"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="wallet_id hash partitions, one thread each")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="wallet ids per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be billed and exit")
+    parser.add_argument("--resume", action="store_true", help="continue every unfinished partition")
+    parser.add_argument("--run-id", type=int, help="with --resume, the one run to continue")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        rows = preview(args.workers)
+        for row in rows:
+            print(
+                f"partition {row['partition']}: {row['subscriptions']} subscriptions "
+                f"on {row['wallets']} wallets ({row['amount']} paise)"
+            )
+        print(f"would bill {sum(row['subscriptions'] for row in rows)} subscriptions ({sum(row['amount'] for row in rows)} paise)")
+        return 0
+
+    if args.resume:
+        if args.run_id is not None:
+            run = job_runs.load(JOB_NAME, args.run_id)
+            runs = [run] if run else []
+        else:
+            runs = job_runs.running(JOB_NAME)
+        if not runs:
+            print("no unfinished billing_run run")
+            return 1
+    else:
+        runs = start_runs(args.workers, args.chunk_size)
+        if not runs:
+            print("nothing to bill")
+            return 0
+
+    started = time.perf_counter()
+    failed: List[int] = []
+    threads = [
+        threading.Thread(target=_run_worker, args=(run, failed), name=f"billing-{run['run_id']}", daemon=True)
+        for run in runs
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - started
+    billed = metrics.counter("billing_run.billed")
+    print(
+        f"billed {billed:.0f} subscriptions ({metrics.counter('billing_run.amount'):.0f} paise) "
+        f"in {elapsed:.1f}s, {billed / elapsed if elapsed else 0:.0f} subscriptions/s"
+    )
+    if failed:
+        print(f"failed runs: {', '.join(map(str, failed))}; continue them with --resume")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# app/jobs/bulk_renewal.py
+"""Renew every active subscription whose end_time falls in a window.
+
+Usage:
+    python -m app.jobs.bulk_renewal [--window-start TS] [--window-end TS] [--chunk-size 5000]
+    python -m app.jobs.bulk_renewal --resume [--run-id N]
+
+Does what renew_subscription() does for one wallet, for a whole wallet_id
+range in a single statement per chunk:
+
+- wallet.monthly_balance += plan_amount, with updated_at stamped under the
+  wallet lock so the balance cache version moves;
+- subscription.end_time += duration_in_days;
+- one subscription_history row ('renewed', 'Subscription renewed').
+
+Wallet rows are locked FOR NO KEY UPDATE in wallet_id order before their
+subscriptions, the same order renew_subscription takes them in; unlike FOR
+UPDATE that does not block the KEY SHARE lock the expiry sweeper's history
+insert takes on the wallet. Progress is checkpointed in
+job_run with each chunk, so an interrupted run resumes where it stopped
+without renewing anything twice. The default window is everything that
+ends before tomorrow (UTC midnight). Each chunk's charged wallets are
+dropped from the shared balance cache once it commits.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.jobs import job_runs
+from app.metrics import metrics
+from app.services.balance_cache import invalidate_shared
+
+JOB_NAME = "bulk_renewal"
+
+RENEW_CHUNK = text("""
+    WITH candidates AS MATERIALIZED (
+        SELECT DISTINCT s.wallet_id
+        FROM subscription s
+        WHERE s.is_active
+          AND s.wallet_id >= :wallet_id_from AND s.wallet_id < :wallet_id_to
+          AND s.end_time >= CAST(:window_start AS TIMESTAMP) AND s.end_time < CAST(:window_end AS TIMESTAMP)
+    ),
+    locked AS MATERIALIZED (
+        SELECT w.wallet_id
+        FROM wallet w
+        WHERE w.wallet_id IN (SELECT wallet_id FROM candidates)
+        ORDER BY w.wallet_id
+        FOR NO KEY UPDATE OF w
+    ),
+    -- Re-checked under the wallet locks, so a subscription cancelled or
+    -- renewed meanwhile is left alone
+    due AS MATERIALIZED (
+        SELECT s.subscription_id, s.wallet_id, s.plan_id, p.plan_amount, p.duration_in_days
+        FROM subscription s
+        JOIN plan p ON p.plan_id = s.plan_id
+        WHERE s.wallet_id IN (SELECT wallet_id FROM locked)
+          AND s.is_active
+          AND s.end_time >= CAST(:window_start AS TIMESTAMP) AND s.end_time < CAST(:window_end AS TIMESTAMP)
+        FOR UPDATE OF s
+    ),
+    charged AS (
+        UPDATE wallet w
+        SET monthly_balance = w.monthly_balance + c.amount,
+            updated_at = clock_timestamp()
+        FROM (SELECT wallet_id, SUM(plan_amount) AS amount FROM due GROUP BY wallet_id) c
+        WHERE w.wallet_id = c.wallet_id
+        RETURNING w.wallet_id
+    ),
+    extended AS (
+        UPDATE subscription s
+        SET end_time = s.end_time + make_interval(days => due.duration_in_days)
+        FROM due
+        WHERE s.subscription_id = due.subscription_id
+        RETURNING s.subscription_id, s.wallet_id, s.plan_id
+    ),
+    logged AS (
+        INSERT INTO subscription_history (subscription_id, wallet_id, plan_id, status, comment)
+        SELECT subscription_id, wallet_id, plan_id, 'renewed', 'Subscription renewed'
+        FROM extended
+        RETURNING 1
+    )
+    SELECT
+        (SELECT count(*) FROM extended) AS renewed,
+        (SELECT count(*) FROM charged) AS wallets,
+        (SELECT count(*) FROM logged) AS history_rows,
+        (SELECT COALESCE(SUM(plan_amount), 0) FROM due) AS amount,
+        (SELECT array_agg(wallet_id) FROM charged) AS wallet_ids
+""")
+
+WALLET_BOUNDS = text("""
+    SELECT min(wallet_id), max(wallet_id)
+    FROM subscription
+    WHERE is_active
+      AND end_time >= CAST(:window_start AS TIMESTAMP) AND end_time < CAST(:window_end AS TIMESTAMP)
+""")
+
+
+def _default_window_end() -> str:
+    tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+    return tomorrow.isoformat()
+
+
+def start_run(window_start: str, window_end: str, chunk_size: int) -> Optional[Dict[str, Any]]:
+    """New run over the wallets with subscriptions due in the window; None if there are none."""
+    params = {"window_start": window_start, "window_end": window_end, "chunk_size": chunk_size}
+    with engine.connect() as conn:
+        lo, hi = conn.execute(WALLET_BOUNDS, params).fetchone()
+    if lo is None:
+        return None
+    return job_runs.start(JOB_NAME, {**params, "wallet_id_max": hi}, lo)
+
+
+def run_chunks(run: Dict[str, Any], report_every: float = 5.0) -> Dict[str, Any]:
+    """Renew chunk by chunk from the run's checkpoint to the end of its range."""
+    params = run["params"]
+    chunk_size = params["chunk_size"]
+    totals = {"renewed": 0, "wallets": 0, "amount": 0}
+    started = last_report = time.perf_counter()
+
+    wallet_id_from = run["last_key"]
+    while wallet_id_from <= params["wallet_id_max"]:
+        wallet_id_to = wallet_id_from + chunk_size
+        with engine.begin() as conn:
+            job_runs.lock(conn, run["run_id"], wallet_id_from)
+            with metrics.time("bulk_renewal.chunk"):
+                result = conn.execute(RENEW_CHUNK, {
+                    "wallet_id_from": wallet_id_from,
+                    "wallet_id_to": wallet_id_to,
+                    "window_start": params["window_start"],
+                    "window_end": params["window_end"],
+                }).fetchone()
+            job_runs.advance(conn, run["run_id"], wallet_id_to, result.renewed)
+        invalidate_shared(result.wallet_ids or ())
+
+        totals["renewed"] += result.renewed
+        totals["wallets"] += result.wallets
+        totals["amount"] += result.amount
+        metrics.incr("bulk_renewal.renewed", result.renewed)
+        wallet_id_from = wallet_id_to
+
+        now = time.perf_counter()
+        if now - last_report >= report_every:
+            print(f"run {run['run_id']}: wallet_id < {wallet_id_to}, {totals['renewed'] / (now - started):.0f} renewals/s")
+            last_report = now
+
+    job_runs.finish(run["run_id"])
+    elapsed = time.perf_counter() - started
+    return {**totals, "seconds": elapsed, "per_second": totals["renewed"] / elapsed if elapsed else 0.0}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--window-start", default="-infinity", help="renew end_time >= this (default: no lower bound)")
+    parser.add_argument("--window-end", default=None, help="renew end_time < this (default: tomorrow, UTC)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="wallet ids per transaction")
+    parser.add_argument("--resume", action="store_true", help="continue the latest unfinished run")
+    parser.add_argument("--run-id", type=int, help="with --resume, the run to continue")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        run = job_runs.load(JOB_NAME, args.run_id)
+        if run is None:
+            print("no unfinished bulk_renewal run")
+            return 1
+    else:
+        run = start_run(args.window_start, args.window_end or _default_window_end(), args.chunk_size)
+        if run is None:
+            print("nothing to renew")
+            return 0
+
+    totals = run_chunks(run)
+    print(
+        f"run {run['run_id']}: renewed {totals['renewed']} subscriptions on {totals['wallets']} wallets "
+        f"({totals['amount']} paise) in {totals['seconds']:.1f}s, {totals['per_second']:.0f} renewals/s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
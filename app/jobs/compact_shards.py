@@ -0,0 +1,49 @@
+# app/jobs/compact_shards.py
+"""Fold wallet balance shards back into their wallet rows.
+
+Usage:
+    python -m app.jobs.compact_shards [--wallet-id N]
+
+Sharded credits accumulate in wallet_balance_shard; compaction moves those
+amounts into wallet.fixed_balance so debits find the money on the wallet row
+and do not have to walk the slots. Each wallet is compacted in its own short
+transaction. Run it every few minutes from cron.
+"""
+import argparse
+import sys
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+
+
+def sharded_wallets() -> List[int]:
+    with engine.connect() as conn:
+        return list(conn.execute(
+            text("SELECT wallet_id FROM wallet WHERE balance_shards > 0 ORDER BY wallet_id")
+        ).scalars())
+
+
+def compact(wallet_id: int) -> int:
+    """Compact one wallet; returns the amount (paise) folded into it."""
+    with engine.begin() as conn:
+        return conn.execute(
+            text("SELECT compact_wallet_balance_shards(:wallet_id)"),
+            {"wallet_id": wallet_id}
+        ).scalar()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wallet-id", type=int, action="append", help="wallet to compact (default: every sharded wallet)")
+    args = parser.parse_args(argv)
+
+    for wallet_id in args.wallet_id or sharded_wallets():
+        folded = compact(wallet_id)
+        print(f"wallet {wallet_id}: folded {folded} paise")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# app/jobs/expiry_sweeper.py
+"""Deactivate subscriptions whose end_time has passed.
+
+Usage:
+    python -m app.jobs.expiry_sweeper [--workers 2] [--batch-size 1000] [--poll-interval 5] [--once]
+
+Each worker repeatedly takes the oldest due subscriptions off the partial
+index ix_subscription_end_time_active (subscription(end_time) WHERE
+is_active) with FOR UPDATE SKIP LOCKED, sets is_active = FALSE and writes an
+'expired' subscription_history row, one short transaction per batch. Any
+number of sweeper processes can run side by side; a subscription that a
+renewal holds or has just extended is skipped.
+
+The history row's foreign key needs KEY SHARE on the wallet, which renewals
+lock before the subscription. The sweeper takes that lock up front with SKIP
+LOCKED too, so it never waits on a wallet while holding a subscription.
+
+Expired subscriptions can no longer be renewed, so run app.jobs.bulk_renewal
+for a billing cycle before its subscriptions come due here.
+
+Lag is the age of the oldest subscription that is due but still active
+(expiry_sweeper.lag_seconds); with enough workers it stays close to the poll
+interval however many subscriptions there are, because both the sweep and
+the lag probe only touch the front of the index.
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPIRE_BATCH = text("""
+    WITH due AS (
+        SELECT s.subscription_id, s.end_time
+        FROM subscription s
+        JOIN wallet w ON w.wallet_id = s.wallet_id
+        WHERE s.is_active AND s.end_time <= NOW()
+        ORDER BY s.end_time
+        LIMIT :batch_size
+        FOR UPDATE OF s SKIP LOCKED
+        FOR KEY SHARE OF w SKIP LOCKED
+    ),
+    expired AS (
+        UPDATE subscription s
+        SET is_active = FALSE
+        FROM due
+        WHERE s.subscription_id = due.subscription_id
+        RETURNING s.subscription_id, s.wallet_id, s.plan_id, due.end_time
+    ),
+    logged AS (
+        INSERT INTO subscription_history (subscription_id, wallet_id, plan_id, status, comment)
+        SELECT subscription_id, wallet_id, plan_id, 'expired', 'Subscription expired'
+        FROM expired
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM logged) AS expired,
+           EXTRACT(EPOCH FROM NOW() - (SELECT min(end_time) FROM expired)) AS oldest_age_seconds
+""")
+
+LAG = text("""
+    SELECT COALESCE(EXTRACT(EPOCH FROM NOW() - min(end_time)), 0)
+    FROM subscription
+    WHERE is_active AND end_time <= NOW()
+""")
+
+
+def expire_batch(batch_size: int) -> int:
+    """Expire up to batch_size due subscriptions; returns how many."""
+    with engine.begin() as conn:
+        row = conn.execute(EXPIRE_BATCH, {"batch_size": batch_size}).fetchone()
+    if row.expired:
+        metrics.incr("expiry_sweeper.expired", row.expired)
+        metrics.observe("expiry_sweeper.expired_age", float(row.oldest_age_seconds))
+    return row.expired
+
+
+def lag_seconds() -> float:
+    with engine.connect() as conn:
+        return float(conn.execute(LAG).scalar())
+
+
+def run_worker(batch_size: int, poll_interval: float, stop: threading.Event, once: bool = False) -> None:
+    while not stop.is_set():
+        try:
+            with metrics.time("expiry_sweeper.batch"):
+                expired = expire_batch(batch_size)
+        except Exception:
+            logger.exception("expiry batch failed")
+            metrics.incr("expiry_sweeper.batch_errors")
+            stop.wait(poll_interval)
+            continue
+        # A full batch means there is more due right now
+        if expired < batch_size:
+            if once:
+                return
+            stop.wait(poll_interval)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2, help="concurrent worker threads")
+    parser.add_argument("--batch-size", type=int, default=1000, help="subscriptions expired per transaction")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="seconds to sleep once caught up")
+    parser.add_argument("--lag-interval", type=float, default=30.0, help="seconds between lag reports")
+    parser.add_argument("--once", action="store_true", help="expire everything due now and exit")
+    args = parser.parse_args(argv)
+
+    lag = {"seconds": 0.0}
+    metrics.gauge("expiry_sweeper.lag_seconds", lambda: lag["seconds"])
+
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(args.batch_size, args.poll_interval, stop, args.once),
+            name=f"expiry-{i}",
+            daemon=True
+        )
+        for i in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        last_report = 0.0
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+            if time.monotonic() - last_report >= args.lag_interval:
+                lag["seconds"] = lag_seconds()
+                print(f"expired={metrics.counter('expiry_sweeper.expired'):.0f} lag={lag['seconds']:.1f}s")
+                last_report = time.monotonic()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    print(f"expired={metrics.counter('expiry_sweeper.expired'):.0f} lag={lag_seconds():.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
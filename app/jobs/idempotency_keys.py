@@ -0,0 +1,52 @@
+# app/jobs/idempotency_keys.py
+"""Delete expired Idempotency-Key records.
+
+Usage:
+    python -m app.jobs.idempotency_keys [--batch-size 5000]
+
+Only keys sent by clients to POST /wallet_transaction/ expire (after
+IDEMPOTENCY_KEY_TTL_HOURS); Razorpay payment ids are kept for good. Deletes
+run in short batches so a large backlog never holds locks for long.
+"""
+import argparse
+import sys
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+
+
+PURGE_BATCH = text("""
+    DELETE FROM idempotency_key
+    WHERE (scope, idempotency_key) IN (
+        SELECT scope, idempotency_key
+        FROM idempotency_key
+        WHERE expires_at IS NOT NULL AND expires_at < NOW()
+        LIMIT :batch_size
+    )
+""")
+
+
+def purge(batch_size: int = 5000) -> int:
+    """Delete every expired key; returns the number removed."""
+    removed = 0
+    while True:
+        with engine.begin() as conn:
+            deleted = conn.execute(PURGE_BATCH, {"batch_size": batch_size}).rowcount
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=5000, help="keys deleted per transaction")
+    args = parser.parse_args(argv)
+
+    print(f"removed {purge(args.batch_size)} expired idempotency keys")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# app/jobs/index_advisor.py
+"""Run EXPLAIN (ANALYZE, BUFFERS) over the hot queries and flag sequential scans.
+
+Usage:
+    python -m app.jobs.index_advisor [--wallet-id N] [--min-rows 10000]
+
+Every statement runs inside a transaction that is rolled back, so the
+procedure probes (which write) leave no trace. Exits with status 1 when a
+sequential scan over a large table is found, so it can gate a deploy.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+
+
+# Statements issued by app/api and, for the PL/pgSQL functions, the
+# statements those functions run internally (EXPLAIN cannot see inside them).
+QUERIES: List[Dict[str, str]] = [
+    {
+        "name": "partner.create_partner: partner by email",
+        "sql": "SELECT * FROM partner WHERE partner_email = :partner_email",
+    },
+    {
+        "name": "wallet_transaction.get_wallet_transactions: history page",
+        "sql": (
+            "SELECT * FROM wallet_transaction WHERE wallet_id = :wallet_id "
+            "ORDER BY updated_at DESC, transaction_id DESC LIMIT 101"
+        ),
+    },
+    {
+        "name": "get_wallet_balance: wallet by id",
+        "sql": "SELECT wallet_id, monthly_balance, fixed_balance FROM wallet WHERE wallet_id = :wallet_id",
+    },
+    {
+        "name": "process_wallet_transaction: wallet lock",
+        "sql": "SELECT monthly_balance, fixed_balance FROM wallet WHERE wallet_id = :wallet_id FOR NO KEY UPDATE",
+    },
+    {
+        "name": "process_wallet_transaction_full: end to end",
+        "sql": "SELECT * FROM process_wallet_transaction_full(:wallet_id, 'credit', 1, 'index_advisor', NULL, NULL)",
+    },
+    {
+        "name": "subscribe/renew/cancel: active subscription for wallet",
+        "sql": "SELECT subscription_id, plan_id FROM subscription WHERE wallet_id = :wallet_id AND is_active = TRUE",
+    },
+    {
+        "name": "complete_subscription: subscription by id",
+        "sql": "SELECT wallet_id, plan_id FROM subscription WHERE subscription_id = :subscription_id",
+    },
+    {
+        "name": "partner transactions for partner",
+        "sql": "SELECT * FROM partner_transaction WHERE partner_id = :partner_id",
+    },
+    {
+        "name": "pending settlements for partner",
+        "sql": "SELECT * FROM settlement WHERE partner_id = :partner_id AND settlement_status = 'pending'",
+    },
+    {
+        "name": "subscription history for wallet",
+        "sql": "SELECT * FROM subscription_history WHERE wallet_id = :wallet_id ORDER BY action_time DESC LIMIT 50",
+    },
+]
+
+
+def _sample_params(conn, wallet_id: Optional[int]) -> Dict[str, Any]:
+    """Pick real ids so the planner sees realistic selectivity."""
+    def first(sql: str, default: Any) -> Any:
+        value = conn.execute(text(sql)).scalar()
+        return default if value is None else value
+
+    return {
+        "wallet_id": wallet_id if wallet_id is not None else first("SELECT min(wallet_id) FROM wallet", 0),
+        "plan_id": first("SELECT min(plan_id) FROM plan", 0),
+        "partner_id": first("SELECT min(partner_id) FROM partner", 0),
+        "partner_email": first("SELECT partner_email FROM partner ORDER BY partner_id LIMIT 1", ""),
+        "subscription_id": first("SELECT min(subscription_id) FROM subscription", 0),
+    }
+
+
+def _walk(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def _estimated_rows(conn, relation: str) -> int:
+    value = conn.execute(
+        text("SELECT reltuples::BIGINT FROM pg_class WHERE oid = to_regclass(:relation)"),
+        {"relation": relation}
+    ).scalar()
+    return int(value or 0)
+
+
+def explain(conn, sql: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    raw = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return raw[0]
+
+
+def _report(conn, query: Dict[str, str], params: Dict[str, Any], min_rows: int) -> Dict[str, Any]:
+    result = explain(conn, query["sql"], params)
+    plan = result["Plan"]
+
+    findings = []
+    for node in _walk(plan):
+        if node.get("Node Type") != "Seq Scan":
+            continue
+        relation = node.get("Relation Name")
+        rows = _estimated_rows(conn, relation)
+        if rows >= min_rows:
+            findings.append({
+                "relation": relation,
+                "estimated_rows": rows,
+                "filter": node.get("Filter"),
+                "rows_removed_by_filter": node.get("Rows Removed by Filter", 0),
+            })
+
+    return {
+        "name": query["name"],
+        "execution_ms": result.get("Execution Time"),
+        "shared_hit_blocks": plan.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": plan.get("Shared Read Blocks", 0),
+        "findings": findings,
+    }
+
+
+def advise(wallet_id: Optional[int] = None, min_rows: int = 10000) -> List[Dict[str, Any]]:
+    """Explain every query in QUERIES; return one report dict per query."""
+    reports = []
+    with engine.connect() as conn:
+        params = _sample_params(conn, wallet_id)
+        conn.rollback()
+
+        for query in QUERIES:
+            trans = conn.begin()
+            try:
+                reports.append(_report(conn, query, params, min_rows))
+            except Exception as e:
+                reports.append({"name": query["name"], "error": str(e).splitlines()[0], "findings": []})
+            finally:
+                trans.rollback()
+
+    return reports
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wallet-id", type=int, help="wallet to use for per-wallet queries (default: lowest id)")
+    parser.add_argument("--min-rows", type=int, default=10000, help="only flag seq scans on tables at least this large")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    reports = advise(args.wallet_id, args.min_rows)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            if "error" in report:
+                print(f"[ERROR] {report['name']}: {report['error']}")
+                continue
+            status = "SEQ SCAN" if report["findings"] else "ok"
+            print(
+                f"[{status}] {report['name']}: {report['execution_ms']:.2f} ms, "
+                f"buffers hit={report['shared_hit_blocks']} read={report['shared_read_blocks']}"
+            )
+            for finding in report["findings"]:
+                print(
+                    f"    seq scan on {finding['relation']} (~{finding['estimated_rows']} rows), "
+                    f"filter: {finding['filter']}, removed: {finding['rows_removed_by_filter']}"
+                )
+
+    return 1 if any(r["findings"] for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# app/jobs/ingest_worker.py
+"""Apply queued wallet transactions from wallet_transaction_queue.
+
+Usage:
+    python -m app.jobs.ingest_worker [--workers 4] [--batch-size 200] [--poll-interval 0.5] [--once]
+
+Each worker claims a batch of pending tickets with FOR UPDATE SKIP LOCKED and
+applies them through process_wallet_transaction_full, one savepoint per
+ticket, committing the whole batch at once. Per-wallet order is kept: a
+wallet's tickets are only applied when no older pending ticket for that
+wallet is held by another worker, and they run in ticket order. A ticket
+that fails (e.g. insufficient balance) is marked failed and does not block
+the tickets behind it.
+
+Once a batch commits, its wallets are dropped from the shared balance
+cache; API processes may still serve a local entry for up to
+BALANCE_CACHE_LOCAL_TTL_SECONDS.
+"""
+import argparse
+import logging
+import sys
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.metrics import metrics
+from app.services.balance_cache import invalidate_shared
+
+logger = logging.getLogger(__name__)
+
+# Claim the oldest pending tickets, then keep only those with no older
+# pending ticket for the same wallet outside the claim (i.e. held by another
+# worker). The CTE is materialised, so the row locks are taken once.
+CLAIM_BATCH = text("""
+    WITH claimed AS MATERIALIZED (
+        SELECT ticket_id, wallet_id
+        FROM wallet_transaction_queue
+        WHERE status = 'pending'
+        ORDER BY ticket_id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    SELECT q.ticket_id, q.wallet_id, q.transaction_type, q.amount, q.source, q.remark, q.additional_info
+    FROM claimed c
+    JOIN wallet_transaction_queue q ON q.ticket_id = c.ticket_id
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM wallet_transaction_queue older
+        WHERE older.wallet_id = c.wallet_id
+          AND older.status = 'pending'
+          AND older.ticket_id < c.ticket_id
+          AND older.ticket_id NOT IN (SELECT ticket_id FROM claimed)
+    )
+    ORDER BY q.wallet_id, q.ticket_id
+""")
+
+APPLY = text("""
+    SELECT transaction_id
+    FROM process_wallet_transaction_full(:wallet_id, :transaction_type, :amount, :source, :remark, :additional_info)
+""")
+
+MARK_APPLIED = text("""
+    UPDATE wallet_transaction_queue
+    SET status = 'applied', transaction_id = :transaction_id, processed_at = NOW()
+    WHERE ticket_id = :ticket_id
+""")
+
+MARK_FAILED = text("""
+    UPDATE wallet_transaction_queue
+    SET status = 'failed', error = :error, processed_at = NOW()
+    WHERE ticket_id = :ticket_id
+""")
+
+
+def process_batch(batch_size: int) -> Dict[str, int]:
+    """Claim and apply one batch; returns applied/failed counts."""
+    applied: List[Dict] = []
+    failed: List[Dict] = []
+
+    with engine.begin() as conn:
+        tickets = conn.execute(CLAIM_BATCH, {"batch_size": batch_size}).fetchall()
+
+        # Ordered by wallet_id, so wallet locks are taken in the same order as
+        # process_wallet_transaction_batch and concurrent workers cannot deadlock
+        for ticket in tickets:
+            savepoint = conn.begin_nested()
+            try:
+                transaction_id = conn.execute(APPLY, {
+                    "wallet_id": ticket.wallet_id,
+                    "transaction_type": ticket.transaction_type,
+                    "amount": ticket.amount,
+                    "source": ticket.source,
+                    "remark": ticket.remark,
+                    "additional_info": ticket.additional_info,
+                }).scalar()
+                savepoint.commit()
+                applied.append({"ticket_id": ticket.ticket_id, "transaction_id": transaction_id})
+            except Exception as e:
+                savepoint.rollback()
+                error = str(getattr(e, "orig", e)).strip().splitlines()[0]
+                failed.append({"ticket_id": ticket.ticket_id, "error": error})
+
+        if applied:
+            conn.execute(MARK_APPLIED, applied)
+        if failed:
+            conn.execute(MARK_FAILED, failed)
+
+    invalidate_shared(ticket.wallet_id for ticket in tickets)
+    metrics.incr("ingest.applied", len(applied))
+    metrics.incr("ingest.failed", len(failed))
+    return {"applied": len(applied), "failed": len(failed)}
+
+
+def run_worker(batch_size: int, poll_interval: float, stop: threading.Event, once: bool = False) -> None:
+    while not stop.is_set():
+        try:
+            with metrics.time("ingest.batch"):
+                counts = process_batch(batch_size)
+        except Exception:
+            # The batch rolled back and its tickets are pending again
+            logger.exception("ingest batch failed")
+            metrics.incr("ingest.batch_errors")
+            stop.wait(poll_interval)
+            continue
+        if once:
+            return
+        if not counts["applied"] and not counts["failed"]:
+            stop.wait(poll_interval)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="concurrent worker threads")
+    parser.add_argument("--batch-size", type=int, default=200, help="tickets claimed per transaction")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds to sleep when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="process one batch per worker and exit")
+    args = parser.parse_args(argv)
+
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(args.batch_size, args.poll_interval, stop, args.once),
+            name=f"ingest-{i}",
+            daemon=True
+        )
+        for i in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    print(f"applied={metrics.counter('ingest.applied'):.0f} failed={metrics.counter('ingest.failed'):.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# app/jobs/job_runs.py
+"""Checkpoints for chunked batch jobs, kept in job_run.
+
+A job walks a key range (wallet ids) in chunks. Each chunk's transaction
+starts with lock(), which locks the run row and checks the checkpoint has
+not moved (so two processes cannot work the same run), and ends with
+advance(), so the checkpoint commits or rolls back together with the
+chunk's work. Resuming a run starts after its last committed chunk.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+
+
+class RunConflict(Exception):
+    """Another process advanced the run, or it is no longer running."""
+
+
+def start(job_name: str, params: Dict[str, Any], first_key: int) -> Dict[str, Any]:
+    with engine.begin() as conn:
+        run_id = conn.execute(
+            text("""
+                INSERT INTO job_run (job_name, params, last_key)
+                VALUES (:job_name, CAST(:params AS JSONB), :last_key)
+                RETURNING run_id
+            """),
+            {"job_name": job_name, "params": json.dumps(params), "last_key": first_key}
+        ).scalar()
+    return {"run_id": run_id, "params": params, "last_key": first_key, "processed": 0}
+
+
+def load(job_name: str, run_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """A running run of job_name: the given one, or the most recent."""
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("""
+                SELECT run_id, params, last_key, processed
+                FROM job_run
+                WHERE job_name = :job_name AND status = 'running'
+                  AND (CAST(:run_id AS INTEGER) IS NULL OR run_id = :run_id)
+                ORDER BY run_id DESC
+                LIMIT 1
+            """),
+            {"job_name": job_name, "run_id": run_id}
+        ).fetchone()
+    return dict(row._mapping) if row else None
+
+
+def running(job_name: str) -> List[Dict[str, Any]]:
+    """Every running run of job_name, oldest first."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT run_id, params, last_key, processed
+                FROM job_run
+                WHERE job_name = :job_name AND status = 'running'
+                ORDER BY run_id
+            """),
+            {"job_name": job_name}
+        ).fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def lock(conn, run_id: int, from_key: int) -> None:
+    """Lock the run for this chunk's transaction and check it is still at from_key."""
+    current = conn.execute(
+        text("SELECT last_key FROM job_run WHERE run_id = :run_id AND status = 'running' FOR UPDATE"),
+        {"run_id": run_id}
+    ).scalar()
+    if current != from_key:
+        raise RunConflict(f"run {run_id} is at {current}, expected {from_key}")
+
+
+def advance(conn, run_id: int, to_key: int, processed: int) -> None:
+    """Move the checkpoint to to_key in the caller's (locked) transaction."""
+    conn.execute(
+        text("""
+            UPDATE job_run
+            SET last_key = :to_key, processed = processed + :processed, updated_at = NOW()
+            WHERE run_id = :run_id
+        """),
+        {"run_id": run_id, "to_key": to_key, "processed": processed}
+    )
+
+
+def finish(run_id: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE job_run SET status = 'completed', finished_at = NOW(), updated_at = NOW() WHERE run_id = :run_id"),
+            {"run_id": run_id}
+        )
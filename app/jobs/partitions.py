@@ -0,0 +1,191 @@
+# app/jobs/partitions.py
+"""Maintain the monthly partitions of wallet_transaction.
+
+Usage:
+    python -m app.jobs.partitions list
+    python -m app.jobs.partitions ensure [--months-ahead 3]
+    python -m app.jobs.partitions detach --older-than-months 12 [--archive-schema archive | --drop]
+
+`ensure` pre-creates partitions so inserts never land in the DEFAULT
+partition; run it from cron at least monthly. `detach` removes whole months
+from the live table, then optionally moves the detached table to another
+schema or drops it. DETACH ... CONCURRENTLY is not allowed while the table
+has a DEFAULT partition, so each month is detached in its own short
+transaction under --lock-timeout; a month whose lock cannot be had in time
+is skipped and reported, and a later run picks it up. --drop only drops a
+month whose rows have all gone to cold storage (app.jobs.archive deletes
+them as it archives); a month that still holds rows stays attached.
+"""
+import argparse
+import re
+import sys
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.database import engine
+
+
+PARENT = "wallet_transaction"
+DEFAULT_PARTITION = "wallet_transaction_default"
+_MONTHLY_NAME = re.compile(r"^wallet_transaction_y(\d{4})m(\d{2})$")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_of(name: str) -> Optional[date]:
+    match = _MONTHLY_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def list_partitions(conn) -> List[Dict[str, Any]]:
+    """Attached partitions with their bounds and estimated row counts, oldest first."""
+    rows = conn.execute(text("""
+        SELECT c.relname AS name,
+               pg_get_expr(c.relpartbound, c.oid) AS bound,
+               c.reltuples::BIGINT AS estimated_rows,
+               pg_total_relation_size(c.oid) AS total_bytes
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:parent)
+        ORDER BY c.relname
+    """), {"parent": PARENT}).fetchall()
+    return [{**dict(row._mapping), "month": _month_of(row.name)} for row in rows]
+
+
+def ensure(months_ahead: int = 3, today: Optional[date] = None) -> List[str]:
+    """Create any missing partitions from the current month to months_ahead."""
+    this_month = (today or date.today()).replace(day=1)
+    with engine.begin() as conn:
+        created = [
+            conn.execute(
+                text("SELECT create_wallet_transaction_partition(:month)"),
+                {"month": add_months(this_month, offset)}
+            ).scalar()
+            for offset in range(months_ahead + 1)
+        ]
+    return created
+
+
+def default_partition_rows() -> int:
+    """Rows that fell outside every monthly partition; should be zero."""
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+
+
+# lock_not_available: lock_timeout expired
+_LOCK_TIMEOUT_SQLSTATE = "55P03"
+
+
+class _NotArchived(Exception):
+    """Rolls back the detach of a month that --drop would lose rows from."""
+
+
+def detach(
+    older_than_months: int,
+    archive_schema: Optional[str] = None,
+    drop: bool = False,
+    today: Optional[date] = None,
+    lock_timeout: str = "2s"
+) -> Tuple[List[str], List[str], List[str]]:
+    """Detach monthly partitions that ended more than older_than_months ago.
+
+    Returns (detached, skipped, unarchived): skipped months could not be
+    locked within lock_timeout; with drop, unarchived months still hold rows
+    and are left attached.
+    """
+    cutoff = add_months((today or date.today()).replace(day=1), -older_than_months)
+    detached: List[str] = []
+    skipped: List[str] = []
+    unarchived: List[str] = []
+
+    with engine.connect() as conn:
+        candidates = [
+            p["name"] for p in list_partitions(conn)
+            if p["month"] is not None and add_months(p["month"], 1) <= cutoff
+        ]
+    if archive_schema:
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"'))
+
+    for name in candidates:
+        # A plain DETACH takes ACCESS EXCLUSIVE on the parent; the timeout
+        # keeps it from queueing writers behind it for long
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("SELECT set_config('lock_timeout', :timeout, true)"), {"timeout": lock_timeout})
+                conn.execute(text(f'ALTER TABLE {PARENT} DETACH PARTITION "{name}"'))
+                if drop:
+                    # Checked under the detach's lock, so no row can arrive after
+                    if conn.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{name}")')).scalar():
+                        raise _NotArchived(name)
+                    conn.execute(text(f'DROP TABLE "{name}"'))
+                elif archive_schema:
+                    conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{archive_schema}"'))
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != _LOCK_TIMEOUT_SQLSTATE:
+                raise
+            skipped.append(name)
+            continue
+        except _NotArchived:
+            unarchived.append(name)
+            continue
+        detached.append(name)
+
+    return detached, skipped, unarchived
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="show attached partitions")
+
+    ensure_cmd = commands.add_parser("ensure", help="pre-create upcoming monthly partitions")
+    ensure_cmd.add_argument("--months-ahead", type=int, default=3, help="months to create beyond the current one")
+
+    detach_cmd = commands.add_parser("detach", help="detach old monthly partitions")
+    detach_cmd.add_argument("--older-than-months", type=int, required=True,
+                            help="detach months that ended at least this many months ago")
+    target = detach_cmd.add_mutually_exclusive_group()
+    target.add_argument("--archive-schema", help="move detached partitions into this schema")
+    target.add_argument("--drop", action="store_true", help="drop detached partitions")
+    detach_cmd.add_argument("--lock-timeout", default="2s",
+                            help="give up on a month if its lock is not granted within this (Postgres interval)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        with engine.connect() as conn:
+            for p in list_partitions(conn):
+                print(f"{p['name']}: {p['bound']} (~{p['estimated_rows']} rows, {p['total_bytes']} bytes)")
+        return 0
+
+    if args.command == "ensure":
+        for name in ensure(args.months_ahead):
+            print(f"ok {name}")
+        stray = default_partition_rows()
+        if stray:
+            print(f"warning: {stray} rows in {DEFAULT_PARTITION}; create their months and move them out")
+            return 1
+        return 0
+
+    detached, skipped, unarchived = detach(
+        args.older_than_months, args.archive_schema, args.drop, lock_timeout=args.lock_timeout
+    )
+    for name in detached:
+        print(f"detached {name}")
+    for name in skipped:
+        print(f"skipped {name}: lock not granted within {args.lock_timeout}; run again")
+    for name in unarchived:
+        print(f"kept {name}: it still has rows; run app.jobs.archive before dropping it")
+    return 1 if skipped or unarchived else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
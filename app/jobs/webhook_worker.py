@@ -0,0 +1,228 @@
+# app/jobs/webhook_worker.py
+"""Apply Razorpay webhooks from payment_webhook_inbox.
+
+Usage:
+    python -m app.jobs.webhook_worker [--workers 2] [--batch-size 100] [--poll-interval 1] [--once]
+    python -m app.jobs.webhook_worker --requeue-dead
+
+POST /payment/webhook only verifies and stores events; this worker does the
+work. Each worker claims due events with FOR UPDATE SKIP LOCKED and handles
+them one savepoint each, committing the batch at once.
+
+payment.captured credits the wallet named in the payment notes (set by
+/wallet_transaction/create_order) under the payment's razorpay_payment
+idempotency key, the same key verify_and_credit uses, so a payment is
+credited once whichever path sees it first. Other event types are marked
+skipped.
+
+A failed event is retried with exponential backoff and jitter and moves to
+status 'dead' after WEBHOOK_MAX_ATTEMPTS; malformed events and idempotency
+conflicts go there straight away. --requeue-dead puts dead events back.
+Once a batch commits, the credited wallets are dropped from the shared
+balance cache, so a client polling its balance after a top-up sees it.
+"""
+import argparse
+import logging
+import random
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from app.config import WEBHOOK_MAX_ATTEMPTS, WEBHOOK_RETRY_BASE_SECONDS, WEBHOOK_RETRY_MAX_SECONDS
+from app.database import engine
+from app.metrics import metrics
+from app.services import idempotency
+from app.services.balance_cache import invalidate_shared
+from app.services.idempotency import IdempotencyConflict
+from app.services.razorpay_service import razorpay_credit_params
+from app.services.wallet_service import transaction_result
+
+logger = logging.getLogger(__name__)
+
+CLAIM_BATCH = text("""
+    SELECT event_id, event_type, payload, attempts
+    FROM payment_webhook_inbox
+    WHERE status = 'pending' AND next_attempt_at <= NOW()
+    ORDER BY next_attempt_at
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+""")
+
+APPLY = text("""
+    SELECT *
+    FROM process_wallet_transaction_full(:wallet_id, :transaction_type, :amount, :source, :remark, :additional_info)
+""")
+
+MARK_DONE = text("""
+    UPDATE payment_webhook_inbox
+    SET status = :status, result = :result, attempts = attempts + 1, last_error = NULL, processed_at = NOW()
+    WHERE event_id = :event_id
+""")
+
+MARK_RETRY = text("""
+    UPDATE payment_webhook_inbox
+    SET attempts = attempts + 1,
+        last_error = :error,
+        next_attempt_at = NOW() + make_interval(secs => :delay)
+    WHERE event_id = :event_id
+""")
+
+MARK_DEAD = text("""
+    UPDATE payment_webhook_inbox
+    SET status = 'dead', attempts = attempts + 1, last_error = :error, processed_at = NOW()
+    WHERE event_id = :event_id
+""")
+
+REQUEUE_DEAD = text("""
+    UPDATE payment_webhook_inbox
+    SET status = 'pending', attempts = 0, next_attempt_at = NOW(), processed_at = NULL
+    WHERE status = 'dead'
+""")
+
+# Retrying cannot fix these
+_PERMANENT_ERRORS = (IdempotencyConflict, KeyError, ValueError, TypeError)
+
+
+def credit_captured_payment(conn, event: Dict[str, Any], credited: Set[int]) -> Tuple[str, str]:
+    """payment.captured -> wallet credit; returns (status, result) and adds the wallet to credited."""
+    payment = event["payload"]["payment"]["entity"]
+    wallet_id = (payment.get("notes") or {}).get("wallet_id")
+    if wallet_id is None:
+        return "skipped", "no wallet_id in payment notes"
+
+    key = idempotency.razorpay_payment_key(payment["id"], int(wallet_id), payment["amount"])
+    lookup = {"scope": key.scope, "key": key.key}
+    if idempotency.stored_response(key, conn.execute(idempotency.LOOKUP_KEY, lookup).fetchone()) is not None:
+        return "processed", "already credited"
+    if conn.execute(idempotency.CLAIM_KEY, idempotency.claim_params(key)).scalar() is None:
+        # verify_and_credit committed it while we waited on the key
+        idempotency.stored_response(key, conn.execute(idempotency.LOOKUP_KEY, lookup).fetchone())
+        return "processed", "already credited"
+
+    row = conn.execute(APPLY, razorpay_credit_params(int(wallet_id), payment["amount"], payment["id"])).fetchone()
+    credited.add(row.wallet_id)
+    conn.execute(idempotency.STORE_RESPONSE, idempotency.store_params(key, transaction_result(row)))
+    return "processed", f"credited transaction {row.transaction_id}"
+
+
+HANDLERS = {
+    "payment.captured": credit_captured_payment,
+}
+
+
+def _retry_delay(attempts: int) -> float:
+    return random.uniform(0.5, 1.0) * min(WEBHOOK_RETRY_MAX_SECONDS, WEBHOOK_RETRY_BASE_SECONDS * 2 ** attempts)
+
+
+def process_batch(batch_size: int) -> Dict[str, int]:
+    """Claim and handle one batch; returns counts per outcome."""
+    done: List[Dict] = []
+    retry: List[Dict] = []
+    dead: List[Dict] = []
+    credited: Set[int] = set()
+
+    with engine.begin() as conn:
+        events = conn.execute(CLAIM_BATCH, {"batch_size": batch_size}).fetchall()
+
+        for event in events:
+            handler = HANDLERS.get(event.event_type)
+            if handler is None:
+                done.append({"event_id": event.event_id, "status": "skipped", "result": "unhandled event type"})
+                continue
+
+            savepoint = conn.begin_nested()
+            try:
+                status, result = handler(conn, event.payload, credited)
+                savepoint.commit()
+                done.append({"event_id": event.event_id, "status": status, "result": result})
+            except Exception as e:
+                savepoint.rollback()
+                error = str(getattr(e, "orig", e)).strip().splitlines()[0] if str(e) else type(e).__name__
+                if isinstance(e, _PERMANENT_ERRORS) or event.attempts + 1 >= WEBHOOK_MAX_ATTEMPTS:
+                    logger.error("webhook %s dead-lettered: %s", event.event_id, error)
+                    dead.append({"event_id": event.event_id, "error": error})
+                else:
+                    retry.append({"event_id": event.event_id, "error": error, "delay": _retry_delay(event.attempts)})
+
+        if done:
+            conn.execute(MARK_DONE, done)
+        if retry:
+            conn.execute(MARK_RETRY, retry)
+        if dead:
+            conn.execute(MARK_DEAD, dead)
+
+    invalidate_shared(credited)
+    metrics.incr("webhook.processed", len(done))
+    metrics.incr("webhook.retried", len(retry))
+    metrics.incr("webhook.dead", len(dead))
+    return {"processed": len(done), "retried": len(retry), "dead": len(dead)}
+
+
+def requeue_dead() -> int:
+    with engine.begin() as conn:
+        return conn.execute(REQUEUE_DEAD).rowcount
+
+
+def run_worker(batch_size: int, poll_interval: float, stop: threading.Event, once: bool = False) -> None:
+    while not stop.is_set():
+        try:
+            with metrics.time("webhook.batch"):
+                counts = process_batch(batch_size)
+        except Exception:
+            # The batch rolled back and its events are due again
+            logger.exception("webhook batch failed")
+            metrics.incr("webhook.batch_errors")
+            stop.wait(poll_interval)
+            continue
+        if once:
+            return
+        if not any(counts.values()):
+            stop.wait(poll_interval)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2, help="concurrent worker threads")
+    parser.add_argument("--batch-size", type=int, default=100, help="events claimed per transaction")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds to sleep when nothing is due")
+    parser.add_argument("--once", action="store_true", help="process one batch per worker and exit")
+    parser.add_argument("--requeue-dead", action="store_true", help="move dead events back to pending and exit")
+    args = parser.parse_args(argv)
+
+    if args.requeue_dead:
+        print(f"requeued {requeue_dead()} dead events")
+        return 0
+
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(args.batch_size, args.poll_interval, stop, args.once),
+            name=f"webhook-{i}",
+            daemon=True
+        )
+        for i in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    print(
+        f"processed={metrics.counter('webhook.processed'):.0f} "
+        f"retried={metrics.counter('webhook.retried'):.0f} dead={metrics.counter('webhook.dead'):.0f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
 from app.api import (
     partner,
@@ -11,10 +14,24 @@ from app.api import (
     plan_feature,
     partner_transaction,
     settlement,
+    internal,
+    payment,
 )
+from app.services.plan_catalog import plan_catalog
+from app.services.razorpay_gateway import razorpay_gateway
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load plans and start listening for changes before serving
+    await run_in_threadpool(plan_catalog.start)
+    yield
+    await run_in_threadpool(plan_catalog.stop)
+    # Drain the pooled gateway connections
+    await razorpay_gateway.aclose()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Include routers
 app.include_router(partner.router)
@@ -26,6 +43,8 @@ app.include_router(plan.router)
 app.include_router(plan_feature.router)
 app.include_router(partner_transaction.router)
 app.include_router(settlement.router)
+app.include_router(internal.router)
+app.include_router(payment.router)
 
 app.add_middleware(
     CORSMiddleware,
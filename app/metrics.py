@@ -0,0 +1,72 @@
+# app/metrics.py
+import threading
+import time
+from typing import Any, Callable, Dict
+
+
+class Metrics:
+    """Process-local counters, timers and gauges exposed on /internal/metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timers: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timer = self._timers.setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            timer["count"] += 1
+            timer["total_seconds"] += seconds
+            timer["max_seconds"] = max(timer["max_seconds"], seconds)
+
+    def time(self, name: str) -> "_Timer":
+        return _Timer(self, name)
+
+    def gauge(self, name: str, fn: Callable[[], Any]) -> None:
+        """Register a callable evaluated on every snapshot."""
+        with self._lock:
+            self._gauges[name] = fn
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {
+                name: {**t, "avg_seconds": t["total_seconds"] / t["count"] if t["count"] else 0.0}
+                for name, t in self._timers.items()
+            }
+            gauges = dict(self._gauges)
+
+        values = {}
+        for name, fn in gauges.items():
+            try:
+                values[name] = fn()
+            except Exception as e:
+                values[name] = {"error": str(e)}
+
+        return {"counters": counters, "timers": timers, "gauges": values}
+
+
+class _Timer:
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+metrics = Metrics()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Float, Date, DateTime, ForeignKey, Index, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.database import Base
@@ -9,7 +10,7 @@ class Partner(Base):
 
     partner_id = Column(Integer, primary_key=True, index=True)
     partner_name = Column(String)
-    partner_email = Column(String)
+    partner_email = Column(String, index=True)
     partner_ph_no = Column(Integer)
     partner_address = Column(String)
     is_active = Column(Boolean, default=True)
@@ -30,7 +31,7 @@ class Account(Base):
     id = Column(Integer, primary_key=True, index=True)
     account_name = Column(String)
     is_active = Column(Boolean, default=True)
-    balance = Column(Float, default=0.0)
+    balance = Column(BigInteger, default=0)  # paise
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     partner_id = Column(Integer, ForeignKey("partner.partner_id"))
 
@@ -43,44 +44,143 @@ class Wallet(Base):
 
     wallet_id = Column(Integer, primary_key=True, index=True)
     account_id = Column(Integer, ForeignKey("account.id"))
-    monthly_balance = Column(Float, default=0.0)
-    fixed_balance = Column(Float, default=0.0)
+    monthly_balance = Column(BigInteger, default=0)  # paise
+    fixed_balance = Column(BigInteger, default=0)  # paise
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # > 0 spreads credits over that many wallet_balance_shard rows
+    balance_shards = Column(Integer, nullable=False, default=0, server_default="0")
 
     account = relationship("Account", back_populates="wallets")
     transactions = relationship("WalletTransaction", back_populates="wallet")
     subscriptions = relationship("Subscription", back_populates="wallet")
 
 
+class WalletBalanceShard(Base):
+    """A slice of a hot wallet's fixed balance; credits pick one slot at random."""
+    __tablename__ = "wallet_balance_shard"
+
+    wallet_id = Column(Integer, ForeignKey("wallet.wallet_id"), primary_key=True)
+    slot = Column(Integer, primary_key=True)
+    fixed_balance = Column(BigInteger, nullable=False, default=0)  # paise
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
 class WalletTransaction(Base):
     __tablename__ = "wallet_transaction"
+    __table_args__ = (
+        Index("ix_wallet_transaction_wallet_id_updated_at", "wallet_id", "updated_at", "transaction_id"),
+        Index("ix_wallet_transaction_wallet_id_transaction_id", "wallet_id", "transaction_id"),
+        # Monthly partitions are created by app.jobs.partitions
+        {"postgresql_partition_by": "RANGE (updated_at)"},
+    )
 
     transaction_id = Column(Integer, primary_key=True, index=True)
     wallet_id = Column(Integer, ForeignKey("wallet.wallet_id"))
     transaction_type = Column(String)
-    amount = Column(Float)
-    previous_balance = Column(Float)
-    current_balance = Column(Float)
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    amount = Column(BigInteger)  # paise
+    previous_balance = Column(BigInteger)
+    current_balance = Column(BigInteger)
+    # Partition key, so it is part of the primary key
+    updated_at = Column(DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc))
     source = Column(String)
     remark = Column(String)
     additional_info = Column(String)
 
     wallet = relationship("Wallet", back_populates="transactions")
-    partner_transactions = relationship("PartnerTransaction", back_populates="wallet_transaction")
+    partner_transactions = relationship(
+        "PartnerTransaction",
+        back_populates="wallet_transaction",
+        primaryjoin="WalletTransaction.transaction_id == foreign(PartnerTransaction.transaction_id)",
+    )
+
+
+class WalletTransactionQueue(Base):
+    """A credit/debit accepted with 202, applied later by app.jobs.ingest_worker."""
+    __tablename__ = "wallet_transaction_queue"
+    __table_args__ = (
+        Index("ix_wallet_transaction_queue_pending", "ticket_id", postgresql_where=text("status = 'pending'")),
+        Index("ix_wallet_transaction_queue_wallet_pending", "wallet_id", "ticket_id",
+              postgresql_where=text("status = 'pending'")),
+    )
+
+    ticket_id = Column(BigInteger, primary_key=True)
+    wallet_id = Column(Integer, nullable=False)
+    transaction_type = Column(String, nullable=False)
+    amount = Column(BigInteger, nullable=False)  # paise
+    source = Column(String)
+    remark = Column(String)
+    additional_info = Column(String)
+    status = Column(String, nullable=False, default="pending")  # pending | applied | failed
+    transaction_id = Column(Integer)
+    error = Column(String)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = Column(DateTime)
+
+
+class IdempotencyRecord(Base):
+    """Response stored for an Idempotency-Key (or Razorpay payment id) so retries replay it."""
+    __tablename__ = "idempotency_key"
+    __table_args__ = (
+        Index("ix_idempotency_key_expires_at", "expires_at", postgresql_where=text("expires_at IS NOT NULL")),
+    )
+
+    scope = Column(String, primary_key=True)  # wallet_transaction | razorpay_payment
+    idempotency_key = Column(String, primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    response = Column(JSONB)  # NULL until the owning transaction stores it
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime)
+
+
+class PaymentWebhookEvent(Base):
+    """A verified Razorpay webhook, applied later by app.jobs.webhook_worker."""
+    __tablename__ = "payment_webhook_inbox"
+    __table_args__ = (
+        Index("ix_payment_webhook_inbox_pending", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+        Index("ix_payment_webhook_inbox_dead", "received_at", postgresql_where=text("status = 'dead'")),
+    )
+
+    event_id = Column(String, primary_key=True)  # X-Razorpay-Event-Id
+    event_type = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending | processed | skipped | dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    last_error = Column(String)
+    result = Column(String)
+    received_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = Column(DateTime)
+
+
+class WalletBalanceCheckpoint(Base):
+    """Wallet balances as of checkpoint_at, covering every ledger row up to last_transaction_id."""
+    __tablename__ = "wallet_balance_checkpoint"
+    __table_args__ = (
+        Index("ix_wallet_balance_checkpoint_wallet_id_checkpoint_at", "wallet_id", "checkpoint_at"),
+    )
+
+    checkpoint_id = Column(Integer, primary_key=True)
+    wallet_id = Column(Integer, ForeignKey("wallet.wallet_id"), nullable=False)
+    checkpoint_at = Column(DateTime, nullable=False)
+    last_transaction_id = Column(Integer)
+    monthly_balance = Column(BigInteger, nullable=False)  # paise
+    fixed_balance = Column(BigInteger, nullable=False)  # paise
 
 
 class Plan(Base):
     __tablename__ = "plan"
+    __table_args__ = (
+        Index("ix_plan_plan_id_active", "plan_id", postgresql_where=text("is_active")),
+    )
 
     plan_id = Column(Integer, primary_key=True, index=True)
     plan_name = Column(String)
-    plan_amount = Column(Float)
+    plan_amount = Column(BigInteger)  # paise
     duration_in_days = Column(Integer)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    price = Column(Float)
+    price = Column(BigInteger)  # paise
 
     features = relationship("PlanFeature", back_populates="plan")
     subscriptions = relationship("Subscription", back_populates="plan")
@@ -88,6 +188,11 @@ class Plan(Base):
 
 class Subscription(Base):
     __tablename__ = "subscription"
+    __table_args__ = (
+        Index("uq_subscription_wallet_id_active", "wallet_id", unique=True, postgresql_where=text("is_active")),
+        Index("ix_subscription_end_time_active", "end_time", postgresql_where=text("is_active")),
+        Index("ix_subscription_wallet_id_unbilled", "wallet_id", postgresql_where=text("NOT is_billed")),
+    )
 
     subscription_id = Column(Integer, primary_key=True, index=True)
     wallet_id = Column(Integer, ForeignKey("wallet.wallet_id"))
@@ -106,7 +211,7 @@ class PlanFeature(Base):
     __tablename__ = "plan_feature"
 
     feature_id = Column(Integer, primary_key=True, index=True)
-    plan_id = Column(Integer, ForeignKey("plan.plan_id"))
+    plan_id = Column(Integer, ForeignKey("plan.plan_id"), index=True)
     feature_name = Column(String)
     feature_description = Column(String)
     feature_catagory = Column(String)
@@ -119,30 +224,74 @@ class PartnerTransaction(Base):
     __tablename__ = "partner_transaction"
 
     partner_transaction_id = Column(Integer, primary_key=True, index=True)
-    partner_id = Column(Integer, ForeignKey("partner.partner_id"))
-    transaction_id = Column(Integer, ForeignKey("wallet_transaction.transaction_id"))
+    partner_id = Column(Integer, ForeignKey("partner.partner_id"), index=True)
+    # No FK: wallet_transaction is partitioned and transaction_id alone is not unique-constrained
+    transaction_id = Column(Integer, index=True)
     is_active = Column(Boolean, default=True)
-    commission_amount = Column(Float)
+    commission_amount = Column(BigInteger)  # paise
     transaction_date = Column(DateTime)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     partner = relationship("Partner", back_populates="transactions")
-    wallet_transaction = relationship("WalletTransaction", back_populates="partner_transactions")
+    wallet_transaction = relationship(
+        "WalletTransaction",
+        back_populates="partner_transactions",
+        primaryjoin="foreign(PartnerTransaction.transaction_id) == WalletTransaction.transaction_id",
+    )
     settlements = relationship("Settlement", back_populates="partner_transaction")
 
 
 class Settlement(Base):
     __tablename__ = "settlement"
+    __table_args__ = (
+        Index("ix_settlement_partner_id_status", "partner_id", "settlement_status"),
+    )
 
     settlement_id = Column(Integer, primary_key=True, index=True)
     partner_id = Column(Integer, ForeignKey("partner.partner_id"))
     partner_transaction_id = Column(Integer, ForeignKey("partner_transaction.partner_transaction_id"))
     settlement_status = Column(String)
     settlement_date = Column(DateTime)
-    settlement_amount = Column(Float)
+    settlement_amount = Column(BigInteger)  # paise
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     partner = relationship("Partner", back_populates="settlements")
     partner_transaction = relationship("PartnerTransaction", back_populates="settlements")
 
+
+
+class JobRun(Base):
+    """Checkpoint of a chunked batch job (app.jobs.*), advanced with each committed chunk."""
+    __tablename__ = "job_run"
+    __table_args__ = (
+        Index("ix_job_run_job_name_running", "job_name", "run_id", postgresql_where=text("status = 'running'")),
+    )
+
+    run_id = Column(Integer, primary_key=True)
+    job_name = Column(String, nullable=False)
+    params = Column(JSONB, nullable=False)
+    status = Column(String, nullable=False, default="running")  # running | completed
+    last_key = Column(BigInteger)  # exclusive upper bound of the last committed chunk
+    processed = Column(BigInteger, nullable=False, default=0)
+    started_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime)
+
+
+class LedgerArchiveSegment(Base):
+    """One Parquet file holding a month of ledger rows for a block of wallet ids."""
+    __tablename__ = "ledger_archive_segment"
+    __table_args__ = (
+        UniqueConstraint("table_name", "month", "wallet_id_from", name="uq_ledger_archive_segment"),
+        Index("ix_ledger_archive_segment_lookup", "table_name", "wallet_id_from", "wallet_id_to", "month"),
+    )
+
+    segment_id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)  # wallet_transaction | subscription_history
+    month = Column(Date, nullable=False)
+    wallet_id_from = Column(Integer, nullable=False)  # inclusive
+    wallet_id_to = Column(Integer, nullable=False)  # exclusive
+    path = Column(String, nullable=False)  # relative to ARCHIVE_DIR
+    row_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
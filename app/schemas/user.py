@@ -12,20 +12,20 @@ class PartnerCreate(BaseModel):
 class AccountCreate(BaseModel):
     account_name: str
     is_active: bool = True
-    balance: float
+    balance: int  # paise
     partner_id: int
 
 class WalletCreate(BaseModel):
     account_id: int
-    monthly_balance: float
-    fixed_balance: float
+    monthly_balance: int  # paise
+    fixed_balance: int  # paise
 
 class WalletTransactionCreate(BaseModel):
     wallet_id: int
     transaction_type: str
-    amount: float
-    previous_balance: float
-    current_balance: float
+    amount: int  # paise
+    previous_balance: int
+    current_balance: int
     source: str
     remark: Optional[str]
     additional_info: Optional[str]
@@ -41,10 +41,10 @@ class SubscriptionCreate(BaseModel):
 
 class PlanCreate(BaseModel):
     plan_name: str
-    plan_amount: float
+    plan_amount: int  # paise
     duration_in_days: int
     is_active: bool = True
-    price: float
+    price: int  # paise
 
 class PlanFeatureCreate(BaseModel):
     plan_id: int
@@ -60,7 +60,7 @@ class PartnerTransactionCreate(BaseModel):
     commission_rate: float
     commission_type: str
     is_active: bool = True
-    commission_amount: float
+    commission_amount: int  # paise
     transaction_date: datetime
 
 class SettlementCreate(BaseModel):
@@ -68,5 +68,5 @@ class SettlementCreate(BaseModel):
     partner_transaction_id: int
     settlement_status: str
     settlement_date: datetime
-    settlement_amount: float
+    settlement_amount: int  # paise
 
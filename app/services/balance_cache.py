@@ -0,0 +1,221 @@
+# app/services/balance_cache.py
+"""Read-through cache for wallet balances.
+
+Two levels: a per-process LRU with a short TTL in front of an optional shared
+backend (Redis, or an in-memory stand-in with the same interface for local
+runs). Entries carry a version taken from wallet.updated_at; a put never
+replaces a newer version, so a slow reader cannot clobber a write-through
+from process_transaction. Jobs that change balances outside the API drop
+the wallets from the shared backend with invalidate_shared().
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from app.config import (
+    BALANCE_CACHE_ENABLED,
+    BALANCE_CACHE_BACKEND,
+    BALANCE_CACHE_LOCAL_TTL_SECONDS,
+    BALANCE_CACHE_SHARED_TTL_SECONDS,
+    BALANCE_CACHE_MAX_ENTRIES,
+    BALANCE_CACHE_REDIS_URL,
+)
+from app.metrics import metrics
+
+try:
+    import redis
+    import redis.asyncio as redis_asyncio
+except ImportError:  # only needed for BALANCE_CACHE_BACKEND=redis
+    redis = redis_asyncio = None
+
+# Keys per DEL when a job invalidates many wallets
+_INVALIDATE_BATCH = 1000
+
+
+class LocalLRU:
+    """Thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value: Dict[str, Any], ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MemorySharedBackend:
+    """Stand-in for the shared backend when Redis is not available."""
+
+    def __init__(self, max_entries: int):
+        self._lru = LocalLRU(max_entries, BALANCE_CACHE_SHARED_TTL_SECONDS)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._lru.get(key)
+
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        self._lru.put(key, value, ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        self._lru.delete(key)
+
+
+class RedisSharedBackend:
+    """Shared backend over redis.asyncio; values are stored as JSON."""
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise RuntimeError("BALANCE_CACHE_BACKEND=redis requires the redis package")
+        self._client = redis_asyncio.from_url(url)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        await self._client.set(key, json.dumps(value), px=int(ttl_seconds * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(key)
+
+
+def _is_older(candidate: Dict[str, Any], current: Optional[Dict[str, Any]]) -> bool:
+    return current is not None and candidate["version"] < current["version"]
+
+
+class BalanceCache:
+
+    def __init__(self, local: LocalLRU, shared=None, shared_ttl_seconds: float = BALANCE_CACHE_SHARED_TTL_SECONDS):
+        self.local = local
+        self.shared = shared
+        self.shared_ttl_seconds = shared_ttl_seconds
+
+    @staticmethod
+    def _key(wallet_id: int) -> str:
+        return f"wallet_balance:{wallet_id}"
+
+    async def get(self, wallet_id: int) -> Optional[Dict[str, Any]]:
+        key = self._key(wallet_id)
+        value = self.local.get(key)
+        if value is not None:
+            metrics.incr("balance_cache.hit.local")
+            return value
+
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(key)
+            except Exception:
+                metrics.incr("balance_cache.shared_errors")
+                value = None
+            if value is not None:
+                metrics.incr("balance_cache.hit.shared")
+                self.local.put(key, value)
+                return value
+
+        metrics.incr("balance_cache.miss")
+        return None
+
+    async def put(self, wallet_id: int, value: Dict[str, Any]) -> None:
+        """Store a balance unless a newer version is already cached.
+
+        value must carry "version" (wallet.updated_at as an ISO string, which
+        orders correctly as text).
+        """
+        key = self._key(wallet_id)
+        if _is_older(value, self.local.get(key)):
+            metrics.incr("balance_cache.stale_put")
+            return
+        self.local.put(key, value)
+
+        if self.shared is not None:
+            try:
+                if _is_older(value, await self.shared.get(key)):
+                    metrics.incr("balance_cache.stale_put")
+                    return
+                await self.shared.set(key, value, self.shared_ttl_seconds)
+            except Exception:
+                metrics.incr("balance_cache.shared_errors")
+
+    async def invalidate(self, wallet_id: int) -> None:
+        key = self._key(wallet_id)
+        metrics.incr("balance_cache.invalidate")
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(key)
+            except Exception:
+                metrics.incr("balance_cache.shared_errors")
+
+
+def _build() -> Optional[BalanceCache]:
+    if not BALANCE_CACHE_ENABLED:
+        return None
+
+    local = LocalLRU(BALANCE_CACHE_MAX_ENTRIES, BALANCE_CACHE_LOCAL_TTL_SECONDS)
+    if BALANCE_CACHE_BACKEND == "redis":
+        shared = RedisSharedBackend(BALANCE_CACHE_REDIS_URL)
+    elif BALANCE_CACHE_BACKEND == "memory":
+        shared = MemorySharedBackend(BALANCE_CACHE_MAX_ENTRIES)
+    else:
+        shared = None
+    return BalanceCache(local, shared)
+
+
+# None when the cache is disabled
+balance_cache = _build()
+
+_sync_client = None
+
+
+def invalidate_shared(wallet_ids: Iterable[int]) -> None:
+    """Drop wallets from the shared backend after a job committed balance changes.
+
+    Synchronous, for the job processes, which share only Redis with the API;
+    with any other backend there is nothing they can reach, so it does
+    nothing. API processes may still serve a local entry for up to
+    BALANCE_CACHE_LOCAL_TTL_SECONDS.
+    """
+    global _sync_client
+    if balance_cache is None or BALANCE_CACHE_BACKEND != "redis":
+        return
+    keys = [BalanceCache._key(wallet_id) for wallet_id in set(wallet_ids)]
+    if not keys:
+        return
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(BALANCE_CACHE_REDIS_URL)
+    try:
+        for start in range(0, len(keys), _INVALIDATE_BATCH):
+            _sync_client.delete(*keys[start:start + _INVALIDATE_BATCH])
+        metrics.incr("balance_cache.invalidate", len(keys))
+    except Exception:
+        metrics.incr("balance_cache.shared_errors")
+
+if balance_cache is not None:
+    metrics.gauge("balance_cache.local_entries", lambda: len(balance_cache.local))
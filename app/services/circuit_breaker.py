@@ -0,0 +1,132 @@
+# app/services/circuit_breaker.py
+"""Count-based circuit breaker for calls to an external dependency.
+
+CLOSED: calls go through and their outcomes fill a sliding window of the last
+window_size calls. Once at least minimum_calls are recorded, the breaker opens
+if the failure rate or the slow-call rate reaches its threshold.
+
+OPEN: calls are rejected immediately with CircuitOpenError for open_seconds.
+
+HALF_OPEN: up to half_open_calls probe calls are let through. If they all
+succeed (and are not slow) the breaker closes with an empty window; any
+failed or slow probe opens it again.
+
+The breaker is driven from a single event loop, so it keeps no lock.
+"""
+import time
+from collections import deque
+from typing import Deque, Dict, Any, Optional, Tuple
+
+from app.metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit {name} is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 50,
+        minimum_calls: int = 20,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 3.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 3
+    ):
+        self.name = name
+        self.minimum_calls = minimum_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probes_started = 0
+        self._probes_succeeded = 0
+
+        metrics.gauge(f"circuit.{name}", self.stats)
+
+    def _rates(self) -> Tuple[float, float]:
+        if not self._window:
+            return 0.0, 0.0
+        calls = len(self._window)
+        failed = sum(1 for f, _ in self._window if f)
+        slow = sum(1 for _, s in self._window if s)
+        return failed / calls, slow / calls
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        metrics.incr(f"circuit.{self.name}.{state}")
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self._probes_started = 0
+            self._probes_succeeded = 0
+        else:
+            self._window.clear()
+
+    def acquire(self) -> None:
+        """Admit one call or raise CircuitOpenError; pair with release()."""
+        if self.state == OPEN:
+            remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                metrics.incr(f"circuit.{self.name}.rejected")
+                raise CircuitOpenError(self.name, remaining)
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probes_started >= self.half_open_calls:
+                metrics.incr(f"circuit.{self.name}.rejected")
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._probes_started += 1
+
+    def release(self, failed: Optional[bool], duration: float) -> None:
+        """Record the outcome of an admitted call; failed=None (cancelled) is not counted."""
+        if failed is None:
+            if self.state == HALF_OPEN:
+                self._probes_started -= 1
+            return
+
+        slow = duration >= self.slow_call_seconds
+        if slow:
+            metrics.incr(f"circuit.{self.name}.slow_calls")
+        if failed:
+            metrics.incr(f"circuit.{self.name}.failed_calls")
+
+        if self.state == HALF_OPEN:
+            if failed or slow:
+                self._transition(OPEN)
+            else:
+                self._probes_succeeded += 1
+                if self._probes_succeeded >= self.half_open_calls:
+                    self._transition(CLOSED)
+            return
+
+        if self.state == CLOSED:
+            self._window.append((failed, slow))
+            if len(self._window) >= self.minimum_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    self._transition(OPEN)
+
+    def stats(self) -> Dict[str, Any]:
+        failure_rate, slow_rate = self._rates()
+        return {
+            "state": self.state,
+            "calls_in_window": len(self._window),
+            "failure_rate": round(failure_rate, 3),
+            "slow_call_rate": round(slow_rate, 3),
+        }
@@ -0,0 +1,155 @@
+# app/services/idempotency.py
+"""Idempotency-Key store for the money-moving endpoints.
+
+A key is claimed in the same database transaction that moves the money, and
+the response is stored before that transaction commits, so the ledger row and
+the stored response exist together or not at all. A retry of a completed
+request is answered from the store without touching the wallet. A concurrent
+duplicate blocks on the (scope, key) primary key, never on the wallet row,
+until the first request finishes: it then replays the stored response, or
+goes ahead itself if the first one rolled back.
+
+Failed requests (e.g. insufficient balance) roll back their claim and are not
+stored; retrying them runs them again, which is safe because nothing moved.
+
+Client keys are namespaced by wallet and bind for IDEMPOTENCY_KEY_TTL_HOURS:
+an expired key is neither replayed nor a conflict, and the next claim takes
+it over, whether or not app.jobs.idempotency_keys has purged it yet.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from app.config import IDEMPOTENCY_KEY_TTL_HOURS
+from app.database import DbSession
+from app.metrics import metrics
+
+SCOPE_WALLET_TRANSACTION = "wallet_transaction"
+SCOPE_RAZORPAY_PAYMENT = "razorpay_payment"
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKey(NamedTuple):
+    scope: str
+    key: str
+    request_hash: str
+    ttl_hours: Optional[int] = None  # None = kept for good
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+def request_hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def client_key(key: str, wallet_id: int, *parts) -> IdempotencyKey:
+    """Key for a client-supplied Idempotency-Key header on POST /wallet_transaction/.
+
+    Scoped to the wallet, so unrelated callers that happen to pick the same
+    key do not collide.
+    """
+    return IdempotencyKey(
+        SCOPE_WALLET_TRANSACTION, f"{wallet_id}:{key}", request_hash(*parts), IDEMPOTENCY_KEY_TTL_HOURS
+    )
+
+
+def razorpay_payment_key(payment_id: str, *parts) -> IdempotencyKey:
+    """A Razorpay payment credits a wallet at most once, whichever path reports it."""
+    return IdempotencyKey(SCOPE_RAZORPAY_PAYMENT, payment_id, request_hash(*parts))
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+# The statements are shared with app.jobs.webhook_worker, which runs them on a
+# plain connection
+LOOKUP_KEY = text("""
+    SELECT request_hash, response
+    FROM idempotency_key
+    WHERE scope = :scope AND idempotency_key = :key
+      AND (expires_at IS NULL OR expires_at > NOW())
+""")
+
+CLAIM_KEY = text("""
+    INSERT INTO idempotency_key (scope, idempotency_key, request_hash, expires_at)
+    VALUES (
+        :scope, :key, :request_hash,
+        CASE WHEN CAST(:ttl_hours AS INTEGER) IS NULL THEN NULL
+             ELSE NOW() + make_interval(hours => CAST(:ttl_hours AS INTEGER)) END
+    )
+    -- An expired key that the purge job has not reached yet is taken over
+    ON CONFLICT (scope, idempotency_key) DO UPDATE
+    SET request_hash = EXCLUDED.request_hash,
+        expires_at = EXCLUDED.expires_at,
+        response = NULL
+    WHERE idempotency_key.expires_at <= NOW()
+    RETURNING 1
+""")
+
+STORE_RESPONSE = text("""
+    UPDATE idempotency_key
+    SET response = CAST(:response AS JSONB)
+    WHERE scope = :scope AND idempotency_key = :key
+""")
+
+
+def claim_params(idem: IdempotencyKey) -> Dict[str, Any]:
+    return {"scope": idem.scope, "key": idem.key, "request_hash": idem.request_hash, "ttl_hours": idem.ttl_hours}
+
+
+def store_params(idem: IdempotencyKey, response: Dict[str, Any]) -> Dict[str, Any]:
+    return {"scope": idem.scope, "key": idem.key, "response": json.dumps(response, default=_json_default)}
+
+
+def stored_response(idem: IdempotencyKey, row) -> Optional[Dict[str, Any]]:
+    """Replay for a LOOKUP_KEY row, None if nothing is stored yet."""
+    if row is None or row.response is None:
+        return None
+    if row.request_hash != idem.request_hash:
+        metrics.incr("idempotency.conflicts")
+        raise IdempotencyConflict(f"Idempotency key {idem.key!r} was already used for a different request")
+    metrics.incr(f"idempotency.{idem.scope}.replayed")
+    return {**row.response, "replayed": True}
+
+
+async def lookup(db: DbSession, idem: IdempotencyKey) -> Optional[Dict[str, Any]]:
+    """The stored response, marked replayed=True, or None if there is none yet."""
+    row = (await db.execute(LOOKUP_KEY, {"scope": idem.scope, "key": idem.key})).fetchone()
+    return stored_response(idem, row)
+
+
+async def claim(db: DbSession, idem: IdempotencyKey) -> bool:
+    """Claim the key in the current transaction.
+
+    Returns False when another transaction already committed it. While that
+    transaction is still open this waits for it to finish.
+    """
+    return (await db.execute(CLAIM_KEY, claim_params(idem))).scalar() is not None
+
+
+async def store(db: DbSession, idem: IdempotencyKey, response: Dict[str, Any]) -> None:
+    """Record the response for a claimed key; commits with the caller's transaction."""
+    await db.execute(STORE_RESPONSE, store_params(idem, response))
+    metrics.incr(f"idempotency.{idem.scope}.stored")
+
+
+async def claim_or_replay(db: DbSession, idem: IdempotencyKey) -> Optional[Dict[str, Any]]:
+    """Replay a stored response, or claim the key and return None so the caller proceeds."""
+    replay = await lookup(db, idem)
+    if replay is not None:
+        return replay
+    if await claim(db, idem):
+        return None
+    # A request with the same key committed while we waited on it
+    await db.rollback()
+    replay = await lookup(db, idem)
+    if replay is None:
+        raise IdempotencyConflict(f"Idempotency key {idem.key!r} is no longer available")
+    return replay
@@ -0,0 +1,125 @@
+# app/services/ledger_archive.py
+"""Parquet cold storage for ledger rows past the hot horizon.
+
+Files live under ARCHIVE_DIR as <table>/<YYYY-MM>/wallets_<from>_<to>.parquet
+and are indexed by the ledger_archive_segment table. Writing is done by
+app.jobs.archive; the API only reads.
+"""
+import os
+from datetime import date
+from typing import Any, Dict, Iterable, List
+
+from app.config import ARCHIVE_DIR, ARCHIVE_COMPRESSION
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # archive support is optional until a segment exists
+    pa = pq = None
+
+
+# table -> column used for the month split, unique key used for ordering and
+# de-duplication, and the stored column types
+ARCHIVED_TABLES: Dict[str, Dict[str, Any]] = {
+    "wallet_transaction": {
+        "time_column": "updated_at",
+        "key_column": "transaction_id",
+        "columns": [
+            ("transaction_id", "int32"),
+            ("wallet_id", "int32"),
+            ("transaction_type", "string"),
+            ("amount", "int64"),
+            ("previous_balance", "int64"),
+            ("current_balance", "int64"),
+            ("updated_at", "timestamp[us]"),
+            ("source", "string"),
+            ("remark", "string"),
+            ("additional_info", "string"),
+        ],
+    },
+    "subscription_history": {
+        "time_column": "action_time",
+        "key_column": "history_id",
+        "columns": [
+            ("history_id", "int32"),
+            ("subscription_id", "int32"),
+            ("wallet_id", "int32"),
+            ("plan_id", "int32"),
+            ("status", "string"),
+            ("action_time", "timestamp[us]"),
+            ("comment", "string"),
+        ],
+    },
+}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("pyarrow is required to read or write archived ledger segments")
+
+
+def _schema(table_name: str):
+    return pa.schema([
+        (name, pa.type_for_alias(type_name))
+        for name, type_name in ARCHIVED_TABLES[table_name]["columns"]
+    ])
+
+
+def segment_path(table_name: str, month: date, wallet_id_from: int, wallet_id_to: int) -> str:
+    """Path of a segment file relative to ARCHIVE_DIR."""
+    return os.path.join(
+        table_name, month.strftime("%Y-%m"), f"wallets_{wallet_id_from:09d}_{wallet_id_to:09d}.parquet"
+    )
+
+
+def read_segment(table_name: str, path: str) -> List[Dict[str, Any]]:
+    """Every row of a segment file."""
+    _require_pyarrow()
+    return pq.read_table(os.path.join(ARCHIVE_DIR, path), schema=_schema(table_name)).to_pylist()
+
+
+def write_segment(table_name: str, path: str, batches: Iterable[List[Dict[str, Any]]]) -> int:
+    """Stream batches of rows into a segment file, after any rows already there.
+
+    Each batch is written as one record batch, so memory is bounded by the
+    batch size. Rows whose key is already in an existing file (left by an
+    interrupted earlier pass) are skipped, so re-running cannot double up a
+    segment. The file is replaced atomically. Returns the number of rows in
+    the file.
+    """
+    _require_pyarrow()
+    key_column = ARCHIVED_TABLES[table_name]["key_column"]
+    schema = _schema(table_name)
+    full_path = os.path.join(ARCHIVE_DIR, path)
+    tmp_path = full_path + ".tmp"
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    existing = set()
+    written = 0
+    with pq.ParquetWriter(tmp_path, schema, compression=ARCHIVE_COMPRESSION) as writer:
+        if os.path.exists(full_path):
+            for batch in pq.ParquetFile(full_path).iter_batches():
+                existing.update(batch.column(key_column).to_pylist())
+                writer.write_batch(batch)
+                written += batch.num_rows
+        for rows in batches:
+            rows = [row for row in rows if row[key_column] not in existing]
+            if rows:
+                writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+                written += len(rows)
+
+    os.replace(tmp_path, full_path)
+    return written
+
+
+def read_wallet_rows(table_name: str, path: str, wallet_id: int) -> List[Dict[str, Any]]:
+    """One wallet's rows from a segment file, newest first."""
+    _require_pyarrow()
+    spec = ARCHIVED_TABLES[table_name]
+    table = pq.read_table(
+        os.path.join(ARCHIVE_DIR, path),
+        schema=_schema(table_name),
+        filters=[("wallet_id", "=", wallet_id)]
+    )
+    table = table.sort_by([(spec["time_column"], "descending"), (spec["key_column"], "descending")])
+    return table.to_pylist()
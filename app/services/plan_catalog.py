@@ -0,0 +1,186 @@
+# app/services/plan_catalog.py
+"""In-process catalog of plans and their features.
+
+plan and plan_feature are tiny and rarely change, so each process holds all
+of them in memory and the Python code paths read plans from here instead of
+querying. The catalog is loaded at startup and reloaded whole when the
+plan_catalog trigger (migration 1587728e38aa) NOTIFYs a change: a daemon
+thread LISTENs on its own connection, outside the pool. It LISTENs before
+each load, so a change committed during a load is not missed, reloads after
+reconnecting, and also reloads every PLAN_CATALOG_REFRESH_SECONDS as a
+backstop. Until the first load succeeds, reads raise CatalogUnavailable
+rather than querying from the event loop. The PL/pgSQL procedures still
+read plan themselves.
+"""
+import hashlib
+import logging
+import select
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.config import PLAN_CATALOG_REFRESH_SECONDS, PLAN_CATALOG_RECONNECT_SECONDS
+from app.database import engine
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "plan_catalog"
+
+LOAD_PLANS = text("""
+    SELECT plan_id, plan_name, plan_amount, price, duration_in_days, is_active
+    FROM plan
+    ORDER BY plan_id
+""")
+
+LOAD_FEATURES = text("""
+    SELECT feature_id, plan_id, feature_name, feature_description, feature_catagory
+    FROM plan_feature
+    WHERE is_active
+    ORDER BY plan_id, feature_id
+""")
+
+
+class CatalogUnavailable(Exception):
+    """The catalog has not loaded yet; the API answers 503 until the listener loads it."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Headers for the HTTPException raised from this error."""
+        return {"Retry-After": str(max(1, int(self.retry_after + 0.5)))}
+
+
+class CatalogFeature(NamedTuple):
+    feature_id: int
+    feature_name: Optional[str]
+    feature_description: Optional[str]
+    feature_catagory: Optional[str]
+
+
+class CatalogPlan(NamedTuple):
+    """A plan row with its active features; reads like the Plan model."""
+    plan_id: int
+    plan_name: Optional[str]
+    plan_amount: Optional[int]  # paise
+    price: Optional[int]  # paise
+    duration_in_days: Optional[int]
+    is_active: bool
+    features: Tuple[CatalogFeature, ...]
+
+
+class PlanCatalog:
+
+    def __init__(self, refresh_seconds: float = PLAN_CATALOG_REFRESH_SECONDS,
+                 reconnect_seconds: float = PLAN_CATALOG_RECONNECT_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.reconnect_seconds = reconnect_seconds
+        # (plans, digest), replaced in one assignment so readers never pair
+        # one load's plans with another's digest
+        self._snapshot: Optional[Tuple[Dict[int, CatalogPlan], str]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> Dict[int, CatalogPlan]:
+        """Load every plan and its active features, replacing the catalog in one step."""
+        with engine.connect() as conn:
+            plan_rows = conn.execute(LOAD_PLANS).fetchall()
+            feature_rows = conn.execute(LOAD_FEATURES).fetchall()
+
+        features: Dict[int, List[CatalogFeature]] = {}
+        for row in feature_rows:
+            features.setdefault(row.plan_id, []).append(
+                CatalogFeature(row.feature_id, row.feature_name, row.feature_description, row.feature_catagory)
+            )
+        plans = {
+            row.plan_id: CatalogPlan(
+                row.plan_id, row.plan_name, row.plan_amount, row.price, row.duration_in_days,
+                bool(row.is_active), tuple(features.get(row.plan_id, ()))
+            )
+            for row in plan_rows
+        }
+
+        digest = hashlib.sha256(repr(list(plans.values())).encode()).hexdigest()
+        self._snapshot = (plans, digest)
+        metrics.incr("plan_catalog.reloads")
+        return plans
+
+    def _loaded(self) -> Tuple[Dict[int, CatalogPlan], str]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Startup could not load it (database down); the listener thread
+            # keeps retrying, and a refresh here would block the event loop
+            metrics.incr("plan_catalog.unavailable")
+            raise CatalogUnavailable("Plan catalog not loaded yet", self.reconnect_seconds)
+        return snapshot
+
+    def get(self, plan_id: int) -> Optional[CatalogPlan]:
+        return self._loaded()[0].get(plan_id)
+
+    def plans(self, include_inactive: bool = False) -> Tuple[List[CatalogPlan], str]:
+        """The plans and the digest of the load they came from, for an ETag."""
+        plans, digest = self._loaded()
+        return [plan for plan in plans.values() if include_inactive or plan.is_active], digest
+
+    def _listen_once(self) -> None:
+        """LISTEN, load, then reload on every notification until stopped or disconnected."""
+        raw = engine.raw_connection()
+        raw.detach()  # held for the process lifetime; keep it out of the pool
+        try:
+            dbapi_connection = raw.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            self.refresh()
+            next_refresh = time.monotonic() + self.refresh_seconds
+
+            while not self._stop.is_set():
+                readable, _, _ = select.select([dbapi_connection], [], [], 1.0)
+                if readable:
+                    dbapi_connection.poll()
+                if dbapi_connection.notifies:
+                    # One reload covers every change notified so far
+                    dbapi_connection.notifies.clear()
+                    metrics.incr("plan_catalog.notifications")
+                    self.refresh()
+                    next_refresh = time.monotonic() + self.refresh_seconds
+                elif time.monotonic() >= next_refresh:
+                    self.refresh()
+                    next_refresh = time.monotonic() + self.refresh_seconds
+        finally:
+            raw.close()
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("plan catalog listener failed; reconnecting")
+                metrics.incr("plan_catalog.listen_errors")
+                self._stop.wait(self.reconnect_seconds)
+
+    def start(self) -> None:
+        """Load the catalog and start the listener thread."""
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("plan catalog load failed; the listener will retry")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="plan-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+plan_catalog = PlanCatalog()
+
+metrics.gauge("plan_catalog.plans", lambda: len(plan_catalog._snapshot[0]) if plan_catalog._snapshot else 0)
@@ -0,0 +1,266 @@
+# app/services/razorpay_gateway.py
+"""Async client for the Razorpay REST API.
+
+One pooled httpx.AsyncClient per process replaces the blocking razorpay SDK
+clients, so a slow gateway response holds a coroutine rather than a worker
+thread and keep-alive connections are shared by every endpoint.
+
+Each attempt passes two guards before it goes out:
+
+- a circuit breaker (see app.services.circuit_breaker), which fails calls
+  fast while the gateway is erroring or slow;
+- a bulkhead of RAZORPAY_MAX_CONCURRENCY slots, so a degraded gateway can
+  tie up at most that many requests. A call that cannot get a slot within
+  RAZORPAY_BULKHEAD_MAX_WAIT_SECONDS is rejected instead of queueing.
+
+Both guards reject with GatewayError(http_status=503) and a Retry-After.
+
+Retries back off exponentially with full jitter. A POST is only retried when
+the gateway cannot have acted on it (connection never established, 429, 503);
+a read timeout on a POST is surfaced, since the order may already exist.
+"""
+import asyncio
+import hashlib
+import hmac
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.config import (
+    RAZORPAY_KEY_ID,
+    RAZORPAY_KEY_SECRET,
+    RAZORPAY_WEBHOOK_SECRET,
+    RAZORPAY_API_BASE_URL,
+    RAZORPAY_CONNECT_TIMEOUT_SECONDS,
+    RAZORPAY_READ_TIMEOUT_SECONDS,
+    RAZORPAY_POOL_TIMEOUT_SECONDS,
+    RAZORPAY_MAX_CONNECTIONS,
+    RAZORPAY_MAX_KEEPALIVE_CONNECTIONS,
+    RAZORPAY_MAX_CONCURRENCY,
+    RAZORPAY_MAX_RETRIES,
+    RAZORPAY_RETRY_BASE_DELAY_SECONDS,
+    RAZORPAY_RETRY_MAX_DELAY_SECONDS,
+    RAZORPAY_BREAKER_ENABLED,
+    RAZORPAY_BREAKER_WINDOW_SIZE,
+    RAZORPAY_BREAKER_MIN_CALLS,
+    RAZORPAY_BREAKER_FAILURE_RATE,
+    RAZORPAY_BREAKER_SLOW_CALL_SECONDS,
+    RAZORPAY_BREAKER_SLOW_CALL_RATE,
+    RAZORPAY_BREAKER_OPEN_SECONDS,
+    RAZORPAY_BREAKER_HALF_OPEN_CALLS,
+    RAZORPAY_BULKHEAD_MAX_WAIT_SECONDS,
+)
+from app.metrics import metrics
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# Statuses that mean the request was not processed, whatever the method
+_RETRY_ANY_METHOD = {429, 503}
+# Statuses worth retrying only when repeating the request is harmless
+_RETRY_IDEMPOTENT = {500, 502, 504}
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "DELETE"}
+
+
+class GatewayError(Exception):
+    """A Razorpay call failed; http_status is what the API should answer with."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        http_status: int = 502,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code  # Razorpay's status, if a response came back
+        self.http_status = http_status
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Optional[Dict[str, str]]:
+        """Headers for the HTTPException raised from this error."""
+        if self.retry_after is None:
+            return None
+        return {"Retry-After": str(max(1, int(self.retry_after + 0.5)))}
+
+
+def verify_payment_signature(order_id: str, payment_id: str, signature: str) -> bool:
+    """Checkout signature: HMAC-SHA256 of "order_id|payment_id" with the key secret."""
+    expected = hmac.new(
+        (RAZORPAY_KEY_SECRET or "").encode(),
+        f"{order_id}|{payment_id}".encode(),
+        hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+def verify_webhook_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Webhook signature: HMAC-SHA256 of the raw body with the webhook secret."""
+    if not RAZORPAY_WEBHOOK_SECRET or not signature:
+        return False
+    expected = hmac.new(RAZORPAY_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    delay = random.uniform(0, min(RAZORPAY_RETRY_MAX_DELAY_SECONDS, RAZORPAY_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), RAZORPAY_RETRY_MAX_DELAY_SECONDS))
+        except ValueError:
+            pass
+    return delay
+
+
+class RazorpayGateway:
+
+    def __init__(self, base_url: str = RAZORPAY_API_BASE_URL, breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url
+        self.breaker = breaker
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        metrics.gauge("razorpay.in_flight", lambda: self._in_flight)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=(RAZORPAY_KEY_ID or "", RAZORPAY_KEY_SECRET or ""),
+                timeout=httpx.Timeout(
+                    connect=RAZORPAY_CONNECT_TIMEOUT_SECONDS,
+                    read=RAZORPAY_READ_TIMEOUT_SECONDS,
+                    write=RAZORPAY_READ_TIMEOUT_SECONDS,
+                    pool=RAZORPAY_POOL_TIMEOUT_SECONDS
+                ),
+                limits=httpx.Limits(
+                    max_connections=RAZORPAY_MAX_CONNECTIONS,
+                    max_keepalive_connections=RAZORPAY_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+            self._slots = asyncio.Semaphore(RAZORPAY_MAX_CONCURRENCY)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _acquire_slot(self) -> None:
+        # Bulkhead: wait briefly for a slot, never queue behind a slow gateway
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=RAZORPAY_BULKHEAD_MAX_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            metrics.incr("razorpay.bulkhead.rejected")
+            raise GatewayError("Payment gateway is busy", http_status=503, retry_after=1)
+
+    async def _send(self, client: httpx.AsyncClient, method: str, path: str, json: Optional[Dict[str, Any]]) -> httpx.Response:
+        """One attempt through the breaker and the bulkhead."""
+        if self.breaker is not None:
+            try:
+                self.breaker.acquire()
+            except CircuitOpenError as e:
+                raise GatewayError("Payment gateway unavailable (circuit open)", http_status=503, retry_after=e.retry_after)
+
+        failed: Optional[bool] = None
+        try:
+            await self._acquire_slot()
+        except GatewayError:
+            if self.breaker is not None:
+                self.breaker.release(None, 0.0)
+            raise
+
+        started = time.monotonic()
+        self._in_flight += 1
+        try:
+            with metrics.time("razorpay.request"):
+                response = await client.request(method, path, json=json)
+            # 4xx is the caller's problem, not the gateway's
+            failed = response.status_code >= 500 or response.status_code == 429
+            return response
+        except httpx.HTTPError:
+            failed = True
+            raise
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+            if self.breaker is not None:
+                self.breaker.release(failed, time.monotonic() - started)
+
+    async def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        client = self._get_client()
+        idempotent = method.upper() in _IDEMPOTENT_METHODS
+
+        for attempt in range(RAZORPAY_MAX_RETRIES + 1):
+            last_attempt = attempt == RAZORPAY_MAX_RETRIES
+            retry_after = None
+
+            try:
+                response = await self._send(client, method, path, json)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Never reached the gateway: safe to retry any method
+                metrics.incr("razorpay.connect_errors")
+                if last_attempt:
+                    raise GatewayError(f"Payment gateway unreachable: {e}", http_status=503)
+            except httpx.TimeoutException as e:
+                metrics.incr("razorpay.timeouts")
+                if last_attempt or not idempotent:
+                    raise GatewayError(f"Payment gateway timed out: {e!r}", http_status=504)
+            except httpx.HTTPError as e:
+                metrics.incr("razorpay.transport_errors")
+                if last_attempt or not idempotent:
+                    raise GatewayError(f"Payment gateway request failed: {e!r}")
+            else:
+                if response.status_code < 400:
+                    return response.json()
+                metrics.incr(f"razorpay.status.{response.status_code}")
+                retryable = response.status_code in _RETRY_ANY_METHOD or (
+                    idempotent and response.status_code in _RETRY_IDEMPOTENT
+                )
+                if last_attempt or not retryable:
+                    raise GatewayError(
+                        f"Payment gateway returned {response.status_code}: {response.text[:200]}",
+                        status_code=response.status_code
+                    )
+                retry_after = response.headers.get("retry-after")
+
+            metrics.incr("razorpay.retries")
+            await asyncio.sleep(_backoff(attempt, retry_after))
+
+        raise GatewayError("Payment gateway request failed")  # not reached
+
+    async def create_order(
+        self,
+        amount: int,
+        currency: str = "INR",
+        payment_capture: int = 1,
+        notes: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """POST /orders; amount is in paise."""
+        payload: Dict[str, Any] = {"amount": amount, "currency": currency, "payment_capture": payment_capture}
+        if notes:
+            payload["notes"] = notes
+        return await self.request("POST", "/orders", json=payload)
+
+    async def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
+        return await self.request("GET", f"/payments/{payment_id}")
+
+
+def _build_breaker() -> Optional[CircuitBreaker]:
+    if not RAZORPAY_BREAKER_ENABLED:
+        return None
+    return CircuitBreaker(
+        "razorpay",
+        window_size=RAZORPAY_BREAKER_WINDOW_SIZE,
+        minimum_calls=RAZORPAY_BREAKER_MIN_CALLS,
+        failure_rate_threshold=RAZORPAY_BREAKER_FAILURE_RATE,
+        slow_call_seconds=RAZORPAY_BREAKER_SLOW_CALL_SECONDS,
+        slow_call_rate_threshold=RAZORPAY_BREAKER_SLOW_CALL_RATE,
+        open_seconds=RAZORPAY_BREAKER_OPEN_SECONDS,
+        half_open_calls=RAZORPAY_BREAKER_HALF_OPEN_CALLS
+    )
+
+
+razorpay_gateway = RazorpayGateway(breaker=_build_breaker())
@@ -1,38 +1,114 @@
 # app/services/razorpay_service.py
-from app.config import razorpay_client
-from sqlalchemy.orm import Session
-from app.models.user import Plan  # assuming your model is named Plan
+import hashlib
+import json
+from typing import Any, Dict, Optional
+from sqlalchemy import text
+from app.services.razorpay_gateway import (
+    razorpay_gateway,
+    verify_payment_signature,
+    verify_webhook_signature,
+    GatewayError,
+)
+from app.database import DbSession
+from app.metrics import metrics
+from app.services.plan_catalog import plan_catalog, CatalogUnavailable
 from fastapi import HTTPException
 
-def create_payment_order(db: Session, plan_id: int):
-    # Fetch plan from DB
-    plan = db.query(Plan).filter(Plan.plan_id == plan_id, Plan.is_active == True).first()
-    
-    if not plan:
+# Wallet credit per paisa paid through Razorpay
+RAZORPAY_CREDIT_MULTIPLIER = 10
+
+
+def razorpay_credit_params(wallet_id: int, amount: int, payment_id: str) -> Dict[str, Any]:
+    """process_wallet_transaction_full arguments for crediting a captured payment.
+
+    Shared by verify_and_credit and the webhook worker, so both paths write the
+    same ledger row (and the same idempotency fingerprint) for a payment.
+    """
+    return {
+        "wallet_id": wallet_id,
+        "transaction_type": "credit",
+        "amount": amount * RAZORPAY_CREDIT_MULTIPLIER,
+        "source": "razorpay",
+        "remark": "Credited via Razorpay payment",
+        "additional_info": f"Payment ID: {payment_id}"
+    }
+
+
+async def create_payment_order(plan_id: int):
+    try:
+        plan = plan_catalog.get(plan_id)
+    except CatalogUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=e.headers)
+    if not plan or not plan.is_active:
         raise HTTPException(status_code=404, detail="Plan not found or inactive")
 
-    amount_paise = int(plan.price * 100)
+    amount_paise = plan.price  # already in paise
+    plan_name = plan.plan_name
 
     # Create Razorpay Order
-    order_data = {
+    try:
+        razorpay_order = await razorpay_gateway.create_order(
+            amount=amount_paise,
+            notes={
+                "plan_name": plan_name,
+                "plan_id": str(plan_id),
+            }
+        )
+    except GatewayError as e:
+        raise HTTPException(status_code=e.http_status, detail=f"Razorpay order creation failed: {e}", headers=e.headers)
+
+    return {
+        "order_id": razorpay_order["id"],
+        "plan_name": plan_name,
         "amount": amount_paise,
-        "currency": "INR",
-        "payment_capture": 1,
-        "notes": {
-            "plan_name": plan.plan_name,
-            "plan_id": str(plan.plan_id),
-        }
+        "currency": "INR"
     }
 
+
+async def verify_payment(payment_data) -> Dict[str, Any]:
+    """Check the Checkout signature; the credit itself arrives via the webhook."""
+    if not verify_payment_signature(
+        payment_data.razorpay_order_id,
+        payment_data.razorpay_payment_id,
+        payment_data.razorpay_signature
+    ):
+        raise HTTPException(status_code=400, detail="Razorpay Signature Verification Failed")
+    return {
+        "verified": True,
+        "order_id": payment_data.razorpay_order_id,
+        "payment_id": payment_data.razorpay_payment_id
+    }
+
+
+async def handle_webhook(db: DbSession, body: bytes, signature: Optional[str], event_id: Optional[str]) -> Dict[str, Any]:
+    """Verify a Razorpay webhook and put it in the inbox; app.jobs.webhook_worker applies it.
+
+    Nothing else happens inline, so the gateway gets its 200 within a single
+    INSERT. Redelivered events (same X-Razorpay-Event-Id) are acknowledged
+    without a second row.
+    """
+    if not verify_webhook_signature(body, signature):
+        metrics.incr("webhook.bad_signature")
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+
     try:
-        razorpay_order = razorpay_client.order.create(data=order_data)
-        return {
-            "order_id": razorpay_order["id"],
-            "plan_name": plan.plan_name,
-            "amount": plan.price,
-            "currency": "INR"
-        }
-    except Exception as e:
-        # Razorpay failed — log actual error response
-        print("🔥 Razorpay error:", str(e))
-        raise HTTPException(status_code=500, detail="Razorpay order creation failed")
\ No newline at end of file
+        event_type = json.loads(body)["event"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Malformed webhook body")
+
+    # Razorpay always sends an event id; fall back to the body for safety
+    event_id = event_id or "sha256:" + hashlib.sha256(body).hexdigest()
+    inserted = (await db.execute(
+        text("""
+            INSERT INTO payment_webhook_inbox (event_id, event_type, payload)
+            VALUES (:event_id, :event_type, CAST(:payload AS JSONB))
+            ON CONFLICT (event_id) DO NOTHING
+            RETURNING 1
+        """),
+        {"event_id": event_id, "event_type": event_type, "payload": body.decode()}
+    )).scalar()
+    await db.commit()
+
+    status = "accepted" if inserted is not None else "duplicate"
+    metrics.incr(f"webhook.{status}")
+    return {"status": status, "event_id": event_id}
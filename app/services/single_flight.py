@@ -0,0 +1,46 @@
+# app/services/single_flight.py
+"""Coalesce concurrent identical reads into one in-flight call."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.metrics import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Concurrent do() calls with the same key share one execution of fn.
+
+    The shared call runs as its own task, so a caller that disconnects does
+    not cancel it for the others. Results are handed to every waiter as-is;
+    treat them as read-only. Counters land under single_flight.<name>.*, and
+    the coalescing ratio (share of calls that did not hit the database) is a
+    gauge.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        metrics.gauge(f"single_flight.{name}", self.stats)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        metrics.incr(f"single_flight.{self.name}.calls")
+        task = self._in_flight.get(key)
+        if task is None:
+            metrics.incr(f"single_flight.{self.name}.executions")
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            metrics.incr(f"single_flight.{self.name}.coalesced")
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        calls = metrics.counter(f"single_flight.{self.name}.calls")
+        executions = metrics.counter(f"single_flight.{self.name}.executions")
+        return {
+            "calls": calls,
+            "executions": executions,
+            "in_flight": len(self._in_flight),
+            "coalescing_ratio": 1 - executions / calls if calls else 0.0,
+        }
@@ -1,14 +1,15 @@
-from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import Dict, Any, Optional
+from app.database import DbSession
+from app.services.balance_cache import balance_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SubscriptionService:
     @staticmethod
-    def handle_subscription(
-        db: Session,
+    async def handle_subscription(
+        db: DbSession,
         wallet_id: int,
         plan_id: Optional[int],
         subscription_type: str
@@ -18,10 +19,10 @@ class SubscriptionService:
                 if plan_id is None:
                     raise ValueError("plan_id is required for new subscriptions")
                     
-                result = db.execute(
+                result = (await db.execute(
                     text("SELECT * FROM subscribe_to_plan(:wallet_id, :plan_id)"),
                     {"wallet_id": wallet_id, "plan_id": plan_id}
-                ).fetchone()
+                )).fetchone()
                 
                 if result is None:
                     raise Exception("Failed to create subscription - no result returned")
@@ -38,14 +39,17 @@ class SubscriptionService:
                 }
                 
                 # Commit the transaction
-                db.commit()
+                await db.commit()
+                # subscribe_to_plan credits monthly_balance
+                if balance_cache is not None:
+                    await balance_cache.invalidate(wallet_id)
                 return {"action": "created", "subscription": subscription_data}
 
             elif subscription_type == "renew":
-                result = db.execute(
+                result = (await db.execute(
                     text("SELECT * FROM renew_subscription(:wallet_id)"),
                     {"wallet_id": wallet_id}
-                ).fetchone()
+                )).fetchone()
 
                 if result is None:
                     raise Exception("Failed to renew subscription - no result returned")
@@ -61,14 +65,18 @@ class SubscriptionService:
                 }
                 
                 # Commit the transaction
-                db.commit()
+                await db.commit()
+                # renew_subscription credits monthly_balance without bumping
+                # wallet.updated_at, so the version cannot be relied on here
+                if balance_cache is not None:
+                    await balance_cache.invalidate(wallet_id)
                 return {"action": "renewed", "subscription": subscription_data}
 
             elif subscription_type == "cancel":
-                result = db.execute(
+                result = (await db.execute(
                     text("SELECT * FROM cancel_subscription(:wallet_id)"),
                     {"wallet_id": wallet_id}
-                ).fetchone()
+                )).fetchone()
 
                 if result is None:
                     raise Exception("Failed to cancel subscription - no result returned")
@@ -77,7 +85,7 @@ class SubscriptionService:
                 subscription_data = dict(result._mapping)
                 
                 # Commit the transaction
-                db.commit()
+                await db.commit()
                 return {"action": "canceled", "subscription": subscription_data}
 
             else:
@@ -85,5 +93,5 @@ class SubscriptionService:
 
         except Exception as e:
             logger.error(f"Subscription operation failed: {str(e)}")
-            db.rollback()  # Rollback on error
+            await db.rollback()  # Rollback on error
             raise
\ No newline at end of file
@@ -1,22 +1,163 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import Optional, Dict, Any
-from app.models.user import Wallet, WalletTransaction
+from sqlalchemy import text, select, tuple_, func, cast, true, BigInteger
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+from datetime import datetime, timedelta, timezone
+import base64
+import binascii
+import json
+import re
+from app.models.user import (
+    Wallet,
+    WalletBalanceShard,
+    WalletTransaction,
+    WalletTransactionQueue,
+    WalletBalanceCheckpoint,
+    LedgerArchiveSegment,
+)
+from app.database import DbSession, session_scope
+from app.services import idempotency, ledger_archive
+from app.services.balance_cache import balance_cache
+from app.services.idempotency import IdempotencyKey, IdempotencyConflict
+from app.services.single_flight import SingleFlight
+from app.config import WALLET_TXN_SINGLE_ROUND_TRIP, TRANSACTIONS_STREAM_BATCH_SIZE, SINGLE_FLIGHT_ENABLED
+
+
+_BATCH_ERROR = re.compile(r"batch item (\d+): (.*)")
+
+_HISTORY_COLUMNS = (
+    WalletTransaction.transaction_id,
+    WalletTransaction.transaction_type,
+    WalletTransaction.amount,
+    WalletTransaction.previous_balance,
+    WalletTransaction.current_balance,
+    WalletTransaction.source,
+    WalletTransaction.remark,
+    WalletTransaction.additional_info,
+    WalletTransaction.updated_at,
+)
+_HISTORY_FIELDS = tuple(column.key for column in _HISTORY_COLUMNS)
+
+# Concurrent identical reads share one query (see SingleFlight)
+_balance_flight = SingleFlight("wallet_balance")
+_history_flight = SingleFlight("wallet_transactions")
+
+
+def encode_cursor(updated_at: datetime, transaction_id: int) -> str:
+    """Opaque keyset cursor pointing just past (updated_at, transaction_id)."""
+    raw = f"{updated_at.isoformat()}|{transaction_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        updated_at, transaction_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(updated_at), int(transaction_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def _recent_window_start(upper: Optional[datetime]) -> datetime:
+    """Start of the month before upper (or now): the newest two monthly partitions."""
+    upper = upper or datetime.now()
+    first_of_month = upper.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return (first_of_month - timedelta(days=1)).replace(day=1)
+
+
+def _apply_ledger_row(monthly: int, fixed: int, transaction_type: str, amount: int) -> Tuple[int, int]:
+    """Replay one ledger row the way process_wallet_transaction_full applies it."""
+    if transaction_type == "credit":
+        return monthly, fixed + amount
+    from_monthly = min(monthly, amount)
+    return monthly - from_monthly, fixed - (amount - from_monthly)
+
+
+async def _in_own_session(fn, *args):
+    """Run fn(db, *args) on a fresh session.
+
+    Coalesced reads serve many requests, so they cannot borrow any single
+    request's session.
+    """
+    async with session_scope() as db:
+        return await fn(db, *args)
+
+
+def _balance_entry(wallet_id: int, monthly: int, fixed: int, updated_at: Optional[datetime]) -> Dict[str, Any]:
+    """Balance response, versioned by wallet.updated_at."""
+    return {
+        "success": True,
+        "wallet_id": wallet_id,
+        "monthly_balance": monthly,
+        "fixed_balance": fixed,
+        "total_balance": monthly + fixed,
+        "version": updated_at.isoformat() if updated_at else ""
+    }
+
+
+def transaction_result(row) -> Dict[str, Any]:
+    """Response dict for a row returned by process_wallet_transaction_full."""
+    return {
+        "success": True,
+        "transaction_id": row.transaction_id,
+        "wallet_id": row.wallet_id,
+        "transaction_type": row.transaction_type,
+        "amount": row.amount,
+        "previous_balance": row.previous_balance,
+        "current_balance": row.current_balance,
+        "wallet_monthly_balance": row.wallet_monthly_balance,
+        "wallet_fixed_balance": row.wallet_fixed_balance,
+        "wallet_total_balance": row.wallet_monthly_balance + row.wallet_fixed_balance,
+        "source": row.source,
+        "remark": row.remark,
+        "additional_info": row.additional_info,
+        "updated_at": row.updated_at
+    }
 
 
 class WalletService:
-    
+
     @staticmethod
-    def process_transaction(
-        db: Session,
+    async def _write_through(result: Dict[str, Any], sharded_credit: bool) -> None:
+        """Cache the balances returned by process_wallet_transaction_full.
+
+        On the locked path the procedure stamps the ledger row and
+        wallet.updated_at with one clock_timestamp() read under the wallet
+        lock, so the ledger timestamp is the wallet version and versions of a
+        wallet increase in commit order. A sharded credit's balances are its
+        own snapshot, missing credits to other slots, so its entry is dropped
+        instead.
+        """
+        if balance_cache is None:
+            return
+        if sharded_credit:
+            await balance_cache.invalidate(result["wallet_id"])
+        else:
+            await balance_cache.put(result["wallet_id"], _balance_entry(
+                result["wallet_id"],
+                result["wallet_monthly_balance"],
+                result["wallet_fixed_balance"],
+                result["updated_at"]
+            ))
+
+    @staticmethod
+    async def process_transaction(
+        db: DbSession,
         wallet_id: int,
         transaction_type: str,
-        amount: float,
+        amount: int,
         source: str,
         remark: Optional[str] = None,
-        additional_info: Optional[str] = None
+        additional_info: Optional[str] = None,
+        idempotency_key: Optional[IdempotencyKey] = None
     ) -> Dict[str, Any]:
+        """Apply a credit/debit.
 
+        With an idempotency_key the key is claimed and the result stored in the
+        same transaction as the ledger row; a repeat returns the stored result
+        with replayed=True. Raises IdempotencyConflict if the key was used for
+        a different request.
+        """
         try:
             # Validate transaction type
             if transaction_type.lower() not in ['credit', 'debit']:
@@ -26,35 +167,71 @@ class WalletService:
             if amount <= 0:
                 return {"success": False, "error": "Amount must be greater than 0"}
             
+            params = {
+                "wallet_id": wallet_id,
+                "transaction_type": transaction_type.lower(),
+                "amount": amount,
+                "source": source,
+                "remark": remark,
+                "additional_info": additional_info
+            }
+
+            if idempotency_key is not None:
+                replay = await idempotency.claim_or_replay(db, idempotency_key)
+                if replay is not None:
+                    return replay
+
+            # Idempotent requests always take this path: the stored response
+            # has to be written before the commit
+            if WALLET_TXN_SINGLE_ROUND_TRIP or idempotency_key is not None:
+                # One statement: the procedure returns the ledger row and new balances
+                row = (await db.execute(
+                    text("SELECT * FROM process_wallet_transaction_full(:wallet_id, :transaction_type, :amount, :source, :remark, :additional_info)"),
+                    params
+                )).fetchone()
+
+                if row is None:
+                    await db.rollback()
+                    return {"success": False, "error": "Transaction or wallet not found after processing"}
+
+                result = transaction_result(row)
+                if idempotency_key is not None:
+                    await idempotency.store(db, idempotency_key, result)
+                await db.commit()
+                await WalletService._write_through(result, row.sharded_credit)
+                return result
+
             # Call the stored procedure
-            result = db.execute(
+            result = await db.execute(
                 text("SELECT process_wallet_transaction(:wallet_id, :transaction_type, :amount, :source, :remark, :additional_info)"),
-                {
-                    "wallet_id": wallet_id,
-                    "transaction_type": transaction_type.lower(),
-                    "amount": amount,
-                    "source": source,
-                    "remark": remark,
-                    "additional_info": additional_info
-                }
+                params
             )
             
             transaction_id = result.scalar()
             
             # Commit the transaction
-            db.commit()
+            await db.commit()
             
             # Get the created transaction details
-            transaction = db.query(WalletTransaction).filter(
-                WalletTransaction.transaction_id == transaction_id
-            ).first()
+            transaction = (await db.execute(
+                select(WalletTransaction).filter(WalletTransaction.transaction_id == transaction_id)
+            )).scalars().first()
             
             # Get updated wallet details
-            wallet = db.query(Wallet).filter(
-                Wallet.wallet_id == wallet_id
-            ).first()
+            wallet = (await db.execute(
+                select(Wallet).filter(Wallet.wallet_id == wallet_id)
+            )).scalars().first()
             
             if transaction and wallet:
+                if balance_cache is not None:
+                    if wallet.balance_shards:
+                        # wallet.fixed_balance leaves out the slots
+                        await balance_cache.invalidate(wallet_id)
+                    else:
+                        await balance_cache.put(
+                            wallet_id,
+                            _balance_entry(wallet_id, wallet.monthly_balance, wallet.fixed_balance, wallet.updated_at)
+                        )
                 return {
                     "success": True,
                     "transaction_id": transaction_id,
@@ -74,31 +251,412 @@ class WalletService:
             else:
                 return {"success": False, "error": "Transaction or wallet not found after processing"}
                 
+        except IdempotencyConflict:
+            await db.rollback()
+            raise
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             return {"success": False, "error": str(e)}
     
     @staticmethod
-    def get_wallet_balance(db: Session, wallet_id: int) -> Dict[str, Any]:
-        """Get wallet balance details."""
+    async def enqueue_transaction(
+        db: DbSession,
+        wallet_id: int,
+        transaction_type: str,
+        amount: int,
+        source: str,
+        remark: Optional[str] = None,
+        additional_info: Optional[str] = None,
+        idempotency_key: Optional[IdempotencyKey] = None
+    ) -> Dict[str, Any]:
+        """Durably queue a credit/debit for app.jobs.ingest_worker; returns its ticket.
+
+        A repeated idempotency_key returns the original ticket (replayed=True)
+        instead of queueing the transaction again.
+        """
+        if idempotency_key is not None:
+            replay = await idempotency.claim_or_replay(db, idempotency_key)
+            if replay is not None:
+                return replay
+
+        ticket = WalletTransactionQueue(
+            wallet_id=wallet_id,
+            transaction_type=transaction_type.lower(),
+            amount=amount,
+            source=source,
+            remark=remark,
+            additional_info=additional_info,
+            status="pending"
+        )
+        db.add(ticket)
+        await db.flush()
+        queued = {"ticket_id": ticket.ticket_id, "status": "pending"}
+        if idempotency_key is not None:
+            await idempotency.store(db, idempotency_key, queued)
+        await db.commit()
+        return queued
+
+    @staticmethod
+    async def get_ticket(db: DbSession, ticket_id: int) -> Optional[Dict[str, Any]]:
+        ticket = await db.get(WalletTransactionQueue, ticket_id)
+        if ticket is None:
+            return None
+        return {
+            "ticket_id": ticket.ticket_id,
+            "wallet_id": ticket.wallet_id,
+            "transaction_type": ticket.transaction_type,
+            "amount": ticket.amount,
+            "status": ticket.status,
+            "transaction_id": ticket.transaction_id,
+            "error": ticket.error,
+            "created_at": ticket.created_at,
+            "processed_at": ticket.processed_at
+        }
+
+    @staticmethod
+    async def process_batch(
+        db: DbSession,
+        items: List[Dict[str, Any]],
+        chunk_size: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Apply many credits/debits through process_wallet_transaction_batch.
+
+        Each chunk is one database transaction: it either applies completely or
+        not at all. Without chunk_size the whole batch is a single chunk. Results
+        are returned in request order.
+        """
+        chunk_size = chunk_size or len(items)
+        results: List[Dict[str, Any]] = []
+
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            payload = [
+                {**item, "transaction_type": item["transaction_type"].lower()}
+                for item in chunk
+            ]
+            try:
+                rows = (await db.execute(
+                    text("SELECT * FROM process_wallet_transaction_batch(CAST(:items AS JSONB))"),
+                    {"items": json.dumps(payload)}
+                )).fetchall()
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                message = str(getattr(e, "orig", e)).strip().splitlines()[0]
+                match = _BATCH_ERROR.search(message)
+                failed_index = int(match.group(1)) if match else None
+                error = match.group(2) if match else message
+
+                for offset in range(len(chunk)):
+                    if failed_index is None or offset == failed_index:
+                        item_error = error
+                    else:
+                        item_error = f"Not applied: item {start + failed_index} in the same chunk failed"
+                    results.append({"index": start + offset, "success": False, "error": item_error})
+                continue
+
+            for row in sorted(rows, key=lambda r: r.item_index):
+                result = transaction_result(row)
+                await WalletService._write_through(result, row.sharded_credit)
+                results.append({"index": start + row.item_index, **result})
+
+        return results
+
+    @staticmethod
+    def _history_query(wallet_id: int, cursor: Optional[str] = None):
+        """Newest-first ledger query for a wallet, resuming after cursor."""
+        stmt = select(*_HISTORY_COLUMNS).where(WalletTransaction.wallet_id == wallet_id)
+        if cursor:
+            updated_at, transaction_id = decode_cursor(cursor)
+            stmt = stmt.where(
+                # The plain bound lets the planner prune newer partitions;
+                # it cannot prune on the row comparison alone
+                WalletTransaction.updated_at <= updated_at,
+                tuple_(WalletTransaction.updated_at, WalletTransaction.transaction_id) < (updated_at, transaction_id)
+            )
+        return stmt.order_by(WalletTransaction.updated_at.desc(), WalletTransaction.transaction_id.desc())
+
+    @staticmethod
+    async def get_transaction_page(
+        db: DbSession,
+        wallet_id: int,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """One keyset page of transaction history plus the cursor for the next page."""
+        if SINGLE_FLIGHT_ENABLED:
+            return await _history_flight.do(
+                (wallet_id, limit, cursor),
+                lambda: _in_own_session(WalletService._load_transaction_page, wallet_id, limit, cursor)
+            )
+        return await WalletService._load_transaction_page(db, wallet_id, limit, cursor)
+
+    @staticmethod
+    async def _load_transaction_page(
+        db: DbSession,
+        wallet_id: int,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Query one page of history.
+
+        The recent window (current and previous month) is read first so a
+        typical page touches at most two partitions; older partitions are only
+        scanned when the window runs out of rows.
+        """
+        stmt = WalletService._history_query(wallet_id, cursor)
+        window_start = _recent_window_start(decode_cursor(cursor)[0] if cursor else None)
+
+        rows = (await db.execute(
+            stmt.where(WalletTransaction.updated_at >= window_start).limit(limit + 1)
+        )).fetchall()
+        if len(rows) <= limit:
+            rows += (await db.execute(
+                stmt.where(WalletTransaction.updated_at < window_start).limit(limit + 1 - len(rows))
+            )).fetchall()
+        transactions = [dict(row._mapping) for row in rows]
+
+        # Past the hot horizon: continue into cold storage
+        if len(transactions) <= limit:
+            async for row in WalletService._archived_transactions(db, wallet_id, cursor):
+                transactions.append(row)
+                if len(transactions) > limit:
+                    break
+
+        has_more = len(transactions) > limit
+        transactions = transactions[:limit]
+        next_cursor = (
+            encode_cursor(transactions[-1]["updated_at"], transactions[-1]["transaction_id"]) if has_more else None
+        )
+
+        return {
+            "wallet_id": wallet_id,
+            "transactions": transactions,
+            "next_cursor": next_cursor
+        }
+
+    @staticmethod
+    async def _archived_transactions(
+        db: DbSession,
+        wallet_id: int,
+        cursor: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Archived ledger rows for a wallet, newest first, resuming after cursor.
+
+        Every archived row is older than every hot row, so this simply
+        continues where the hot table leaves off. Segment files are read one
+        month at a time, off the event loop.
+        """
+        stmt = select(LedgerArchiveSegment.path).where(
+            LedgerArchiveSegment.table_name == "wallet_transaction",
+            LedgerArchiveSegment.wallet_id_from <= wallet_id,
+            LedgerArchiveSegment.wallet_id_to > wallet_id
+        )
+        position = None
+        if cursor:
+            position = decode_cursor(cursor)
+            stmt = stmt.where(LedgerArchiveSegment.month <= position[0].date())
+        paths = (await db.execute(stmt.order_by(LedgerArchiveSegment.month.desc()))).scalars().all()
+
+        for path in paths:
+            rows = await run_in_threadpool(ledger_archive.read_wallet_rows, "wallet_transaction", path, wallet_id)
+            for row in rows:
+                if position and (row["updated_at"], row["transaction_id"]) >= position:
+                    continue
+                yield {field: row[field] for field in _HISTORY_FIELDS}
+
+    @staticmethod
+    async def get_ledger_head(
+        db: DbSession,
+        wallet_id: int
+    ) -> Optional[Tuple[Optional[int], Optional[datetime], str]]:
+        """(transaction_id, updated_at) of the wallet's newest ledger row, from
+        the index, plus the wallet's version; None if the wallet does not exist.
+
+        Sharded credits commit out of transaction_id order, so the newest row
+        alone can stay the same while an older one appears. Every ledger write
+        also stamps the wallet or one of its slots under its lock, so the
+        version is the wallet's updated_at with every slot's.
+        """
+        head = (
+            select(WalletTransaction.transaction_id, WalletTransaction.updated_at)
+            .where(WalletTransaction.wallet_id == Wallet.wallet_id)
+            .order_by(WalletTransaction.transaction_id.desc())
+            .limit(1)
+            .lateral("head")
+        )
+        shard_versions = (
+            select(func.array_agg(aggregate_order_by(WalletBalanceShard.updated_at, WalletBalanceShard.slot)))
+            .where(WalletBalanceShard.wallet_id == Wallet.wallet_id)
+            .scalar_subquery()
+        )
+        row = (await db.execute(
+            select(
+                head.c.transaction_id,
+                head.c.updated_at,
+                Wallet.updated_at.label("wallet_updated_at"),
+                shard_versions.label("shard_updated_at")
+            )
+            .select_from(Wallet)
+            .outerjoin(head, true())
+            .where(Wallet.wallet_id == wallet_id)
+        )).fetchone()
+        if row is None:
+            return None
+        return row.transaction_id, row.updated_at, f"{row.wallet_updated_at}|{row.shard_updated_at}"
+
+    @staticmethod
+    async def stream_transactions(
+        wallet_id: int,
+        cursor: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the full history newest-first using a server-side cursor,
+        followed by any archived rows.
+
+        Opens its own session: the request-scoped one is closed before a
+        streaming response body is sent.
+        """
+        stmt = WalletService._history_query(wallet_id, cursor).execution_options(
+            yield_per=TRANSACTIONS_STREAM_BATCH_SIZE
+        )
+        async with session_scope() as db:
+            result = await db.stream(stmt)
+            async for row in result:
+                yield dict(row._mapping)
+
+            async for row in WalletService._archived_transactions(db, wallet_id, cursor):
+                yield row
+
+    @staticmethod
+    async def get_wallet_balance(db: DbSession, wallet_id: int) -> Dict[str, Any]:
+        """Get wallet balance details, read through the balance cache."""
+        try:
+            if balance_cache is not None:
+                cached = await balance_cache.get(wallet_id)
+                if cached is not None:
+                    return cached
+
+            if SINGLE_FLIGHT_ENABLED:
+                return await _balance_flight.do(
+                    wallet_id, lambda: _in_own_session(WalletService._load_wallet_balance, wallet_id)
+                )
+            return await WalletService._load_wallet_balance(db, wallet_id)
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    async def _load_wallet_balance(db: DbSession, wallet_id: int) -> Dict[str, Any]:
+        """Read balances from the database and populate the cache.
+
+        Reads the wallet row and its balance shards directly (what
+        get_wallet_balance() returns) so the balances and their version come
+        from the same snapshot. Sharded credits do not touch the wallet row,
+        so the version is the newest of the wallet and its shards.
+        """
+        shard_balance = (
+            select(func.coalesce(cast(func.sum(WalletBalanceShard.fixed_balance), BigInteger), 0))
+            .where(WalletBalanceShard.wallet_id == Wallet.wallet_id)
+            .scalar_subquery()
+        )
+        shard_updated_at = (
+            select(func.max(WalletBalanceShard.updated_at))
+            .where(WalletBalanceShard.wallet_id == Wallet.wallet_id)
+            .scalar_subquery()
+        )
+        balance_info = (await db.execute(
+            select(
+                Wallet.wallet_id,
+                Wallet.monthly_balance,
+                (Wallet.fixed_balance + shard_balance).label("fixed_balance"),
+                func.greatest(Wallet.updated_at, shard_updated_at).label("updated_at")
+            )
+            .where(Wallet.wallet_id == wallet_id)
+        )).fetchone()
+
+        if balance_info is None:
+            return {"success": False, "error": "Wallet not found"}
+
+        entry = _balance_entry(
+            balance_info.wallet_id,
+            balance_info.monthly_balance,
+            balance_info.fixed_balance,
+            balance_info.updated_at
+        )
+        if balance_cache is not None:
+            await balance_cache.put(wallet_id, entry)
+        return entry
+
+    @staticmethod
+    async def set_balance_shards(db: DbSession, wallet_id: int, shards: int) -> Dict[str, Any]:
+        """Opt a wallet into (shards > 0) or out of (0) sharded credits."""
         try:
-            result = db.execute(
-                text("SELECT * FROM get_wallet_balance(:wallet_id)"),
-                {"wallet_id": wallet_id}
+            await db.execute(
+                text("SELECT set_wallet_balance_shards(:wallet_id, :shards)"),
+                {"wallet_id": wallet_id, "shards": shards}
             )
-            
-            balance_info = result.fetchone()
-            
-            if balance_info:
-                return {
-                    "success": True,
-                    "wallet_id": balance_info[0],
-                    "monthly_balance": balance_info[1],
-                    "fixed_balance": balance_info[2],
-                    "total_balance": balance_info[3]
-                }
-            else:
-                return {"success": False, "error": "Wallet not found"}
-                
+            await db.commit()
         except Exception as e:
-            return {"success": False, "error": str(e)}
\ No newline at end of file
+            await db.rollback()
+            return {"success": False, "error": str(getattr(e, "orig", e)).strip().splitlines()[0]}
+
+        if balance_cache is not None:
+            await balance_cache.invalidate(wallet_id)
+        return {"success": True, "wallet_id": wallet_id, "balance_shards": shards}
+
+    @staticmethod
+    async def get_balance_as_of(db: DbSession, wallet_id: int, as_of: datetime) -> Dict[str, Any]:
+        """Wallet balances at as_of: the nearest earlier checkpoint plus the ledger rows after it.
+
+        Plan credits from subscribe/renew are not ledgered, so they are only
+        reflected once a later checkpoint has captured them. Fails when no
+        checkpoint precedes as_of.
+        """
+        if as_of.tzinfo is not None:
+            # Ledger timestamps are stored naive, in UTC
+            as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+
+        wallet_exists = (await db.execute(
+            select(Wallet.wallet_id).where(Wallet.wallet_id == wallet_id)
+        )).scalar()
+        if wallet_exists is None:
+            return {"success": False, "error": "Wallet not found"}
+
+        checkpoint = (await db.execute(
+            select(WalletBalanceCheckpoint)
+            .where(WalletBalanceCheckpoint.wallet_id == wallet_id, WalletBalanceCheckpoint.checkpoint_at <= as_of)
+            .order_by(WalletBalanceCheckpoint.checkpoint_at.desc())
+            .limit(1)
+        )).scalars().first()
+
+        if checkpoint is None:
+            # Replaying from zero would miss opening balances, unledgered plan
+            # credits and rows already moved to cold storage
+            return {"success": False, "error": "No balance checkpoint at or before as_of"}
+
+        monthly, fixed = checkpoint.monthly_balance, checkpoint.fixed_balance
+        last_transaction_id = checkpoint.last_transaction_id or 0
+
+        deltas = (await db.execute(
+            select(WalletTransaction.transaction_type, WalletTransaction.amount)
+            .where(
+                WalletTransaction.wallet_id == wallet_id,
+                WalletTransaction.transaction_id > last_transaction_id,
+                WalletTransaction.updated_at <= as_of
+            )
+            .order_by(WalletTransaction.transaction_id)
+        )).fetchall()
+
+        for row in deltas:
+            monthly, fixed = _apply_ledger_row(monthly, fixed, row.transaction_type, row.amount)
+
+        return {
+            "success": True,
+            "wallet_id": wallet_id,
+            "as_of": as_of,
+            "monthly_balance": monthly,
+            "fixed_balance": fixed,
+            "total_balance": monthly + fixed,
+            "checkpoint_at": checkpoint.checkpoint_at,
+            "replayed_transactions": len(deltas)
+        }
@@ -0,0 +1,320 @@
+# app/stubs/razorpay_stub.py
+"""Local stand-in for the parts of the Razorpay API this service uses.
+
+Usage:
+    python -m app.stubs.razorpay_stub [--port 9010] [--latency uniform:20:200]
+        [--errors 503:0.02,500:0.01] [--timeout-rate 0.0] [--webhook-url URL]
+
+Start the API with RAZORPAY_USE_STUB=true (and matching RAZORPAY_STUB_URL)
+and the gateway client talks to this server with the stub credentials.
+
+Endpoints:
+    POST /v1/orders               create an order (basic auth, amount in paise)
+    GET  /v1/orders/{id}          fetch an order
+    GET  /v1/payments/{id}        fetch a payment
+    POST /v1/orders/{id}/pay      stand-in for Checkout: captures a payment and
+                                  returns razorpay_order_id, razorpay_payment_id
+                                  and razorpay_signature, exactly what the
+                                  Checkout handler passes to verify_and_credit;
+                                  with --webhook-url, also delivers a signed
+                                  payment.captured webhook
+    GET  /v1/checkout.js          minimal checkout.js whose Razorpay(options).open()
+                                  calls the pay endpoint and then options.handler;
+                                  point fixed_checkout.html's script tag at it
+    GET  /_stub/stats             request, order, payment and fault counts
+    PUT  /_stub/faults            change latency/errors/timeout_rate at runtime
+
+Faults apply to the Orders and Payments API only. Latency specs: "fixed:MS",
+"uniform:LO:HI", "normal:MEAN:STDDEV", "lognormal:MEDIAN:SIGMA" and
+"exp:MEAN" (milliseconds). Errors are STATUS:RATE pairs; a timeout holds the
+request for --timeout-seconds before answering 504.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import math
+import random
+import string
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from app.config import RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, RAZORPAY_WEBHOOK_SECRET
+
+_ID_ALPHABET = string.ascii_letters + string.digits
+
+CHECKOUT_JS = """(function () {
+  var base = document.currentScript.src.replace(/\\/checkout\\.js.*$/, "");
+  function Razorpay(options) { this.options = options; }
+  Razorpay.prototype.open = function () {
+    var options = this.options;
+    fetch(base + "/orders/" + options.order_id + "/pay", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: "{}"
+    })
+      .then(function (res) { return res.json(); })
+      .then(function (response) {
+        if (response.error) {
+          if (options.modal && options.modal.ondismiss) { options.modal.ondismiss(); }
+          return;
+        }
+        options.handler(response);
+      });
+  };
+  window.Razorpay = Razorpay;
+})();
+"""
+
+
+def _new_id(prefix: str) -> str:
+    return prefix + "".join(random.choice(_ID_ALPHABET) for _ in range(14))
+
+
+def _error(status_code: int, description: str, code: str = "BAD_REQUEST_ERROR") -> JSONResponse:
+    # Razorpay's error envelope
+    return JSONResponse(status_code=status_code, content={"error": {"code": code, "description": description}})
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Latency spec -> sampler returning seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(":")] if args else []
+    samplers = {
+        "fixed": lambda ms: lambda: ms,
+        "uniform": lambda lo, hi: lambda: random.uniform(lo, hi),
+        "normal": lambda mean, stddev: lambda: random.gauss(mean, stddev),
+        "lognormal": lambda median, sigma: lambda: random.lognormvariate(math.log(median), sigma),
+        "exp": lambda mean: lambda: random.expovariate(1 / mean),
+    }
+    if spec in ("", "0", "none"):
+        return lambda: 0.0
+    if kind not in samplers:
+        raise ValueError(f"unknown latency distribution {kind!r}")
+    sample_ms = samplers[kind](*values)
+    return lambda: max(0.0, sample_ms()) / 1000
+
+
+def parse_errors(spec: str) -> List[Tuple[int, float]]:
+    """"503:0.02,500:0.01" -> [(503, 0.02), (500, 0.01)]"""
+    errors = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        status, rate = part.split(":")
+        errors.append((int(status), float(rate)))
+    if sum(rate for _, rate in errors) > 1:
+        raise ValueError("error rates add up to more than 1")
+    return errors
+
+
+class Faults:
+
+    def __init__(self, latency: str = "0", errors: str = "", timeout_rate: float = 0.0, timeout_seconds: float = 30.0):
+        self.configure(latency, errors, timeout_rate, timeout_seconds)
+
+    def configure(self, latency: str, errors: str, timeout_rate: float, timeout_seconds: float) -> None:
+        self._latency = parse_latency(latency)
+        self._errors = parse_errors(errors)
+        self.spec = {"latency": latency, "errors": errors, "timeout_rate": timeout_rate, "timeout_seconds": timeout_seconds}
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+
+    async def apply(self, stats: Dict[str, int]) -> None:
+        """Sleep for a sampled latency, then maybe fail the call."""
+        if random.random() < self.timeout_rate:
+            stats["timeouts"] += 1
+            await asyncio.sleep(self.timeout_seconds)
+            raise HTTPException(status_code=504, detail="Gateway timeout (injected)")
+
+        await asyncio.sleep(self._latency())
+        roll = random.random()
+        for status, rate in self._errors:
+            if roll < rate:
+                stats["errors"] += 1
+                raise HTTPException(status_code=status, detail=f"Injected {status}")
+            roll -= rate
+
+
+class OrderCreate(BaseModel):
+    amount: int
+    currency: str = "INR"
+    receipt: Optional[str] = None
+    payment_capture: Any = 1
+    notes: Dict[str, Any] = {}
+
+
+class PayRequest(BaseModel):
+    method: str = "card"
+
+
+class FaultsUpdate(BaseModel):
+    latency: Optional[str] = None
+    errors: Optional[str] = None
+    timeout_rate: Optional[float] = None
+    timeout_seconds: Optional[float] = None
+
+
+def create_app(
+    faults: Faults,
+    key_id: str = RAZORPAY_KEY_ID or "rzp_test_stub",
+    key_secret: str = RAZORPAY_KEY_SECRET or "stub_key_secret",
+    webhook_secret: str = RAZORPAY_WEBHOOK_SECRET or "stub_webhook_secret",
+    webhook_url: Optional[str] = None
+) -> FastAPI:
+    app = FastAPI(title="Razorpay stub")
+    # Checkout runs in the browser, on another origin than the stub
+    app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+    orders: Dict[str, Dict[str, Any]] = {}
+    payments: Dict[str, Dict[str, Any]] = {}
+    stats = {"requests": 0, "errors": 0, "timeouts": 0, "webhooks_sent": 0, "webhooks_failed": 0}
+    deliveries: Set[asyncio.Task] = set()
+
+    async def authenticated_with_faults(request: Request) -> None:
+        stats["requests"] += 1
+        expected = "Basic " + base64.b64encode(f"{key_id}:{key_secret}".encode()).decode()
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Authentication failed")
+        await faults.apply(stats)
+
+    @app.exception_handler(HTTPException)
+    async def razorpay_error(request: Request, exc: HTTPException):
+        return _error(exc.status_code, str(exc.detail), "BAD_REQUEST_ERROR" if exc.status_code < 500 else "SERVER_ERROR")
+
+    @app.post("/v1/orders", dependencies=[Depends(authenticated_with_faults)])
+    async def create_order(order: OrderCreate):
+        if order.amount < 100:
+            raise HTTPException(status_code=400, detail="Order amount less than minimum amount allowed")
+        order_id = _new_id("order_")
+        orders[order_id] = {
+            "id": order_id,
+            "entity": "order",
+            "amount": order.amount,
+            "amount_paid": 0,
+            "amount_due": order.amount,
+            "currency": order.currency,
+            "receipt": order.receipt,
+            "status": "created",
+            "attempts": 0,
+            "notes": order.notes,
+            "created_at": int(time.time()),
+        }
+        return orders[order_id]
+
+    @app.get("/v1/orders/{order_id}", dependencies=[Depends(authenticated_with_faults)])
+    async def fetch_order(order_id: str):
+        if order_id not in orders:
+            raise HTTPException(status_code=400, detail="The id provided does not exist")
+        return orders[order_id]
+
+    @app.get("/v1/payments/{payment_id}", dependencies=[Depends(authenticated_with_faults)])
+    async def fetch_payment(payment_id: str):
+        if payment_id not in payments:
+            raise HTTPException(status_code=400, detail="The id provided does not exist")
+        return payments[payment_id]
+
+    async def deliver_webhook(payment: Dict[str, Any]) -> None:
+        event = {
+            "entity": "event",
+            "account_id": "acc_stub",
+            "event": "payment.captured",
+            "contains": ["payment"],
+            "payload": {"payment": {"entity": payment}},
+            "created_at": int(time.time()),
+        }
+        body = json.dumps(event).encode()
+        headers = {
+            "Content-Type": "application/json",
+            "X-Razorpay-Event-Id": _new_id("evt_"),
+            "X-Razorpay-Signature": hmac.new(webhook_secret.encode(), body, hashlib.sha256).hexdigest(),
+        }
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                response = await client.post(webhook_url, content=body, headers=headers)
+            stats["webhooks_sent" if response.status_code < 300 else "webhooks_failed"] += 1
+        except Exception:
+            stats["webhooks_failed"] += 1
+
+    @app.post("/v1/orders/{order_id}/pay")
+    async def pay(order_id: str, request: Optional[PayRequest] = None):
+        order = orders.get(order_id)
+        if order is None:
+            raise HTTPException(status_code=400, detail="The id provided does not exist")
+        if order["status"] == "paid":
+            raise HTTPException(status_code=400, detail="Order is already paid")
+
+        payment_id = _new_id("pay_")
+        payments[payment_id] = {
+            "id": payment_id,
+            "entity": "payment",
+            "amount": order["amount"],
+            "currency": order["currency"],
+            "status": "captured",
+            "order_id": order_id,
+            "method": (request or PayRequest()).method,
+            "captured": True,
+            "notes": order["notes"],
+            "created_at": int(time.time()),
+        }
+        order.update(status="paid", amount_paid=order["amount"], amount_due=0, attempts=order["attempts"] + 1)
+
+        if webhook_url:
+            task = asyncio.create_task(deliver_webhook(payments[payment_id]))
+            deliveries.add(task)
+            task.add_done_callback(deliveries.discard)
+
+        # What Checkout hands to the merchant's handler
+        signature = hmac.new(key_secret.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+        return {"razorpay_order_id": order_id, "razorpay_payment_id": payment_id, "razorpay_signature": signature}
+
+    @app.get("/v1/checkout.js")
+    async def checkout_js():
+        return Response(CHECKOUT_JS, media_type="application/javascript")
+
+    @app.get("/_stub/stats")
+    async def get_stats():
+        return {**stats, "orders": len(orders), "payments": len(payments), "faults": faults.spec}
+
+    @app.put("/_stub/faults")
+    async def set_faults(update: FaultsUpdate):
+        spec = {**faults.spec, **update.dict(exclude_none=True)}
+        try:
+            faults.configure(spec["latency"], spec["errors"], spec["timeout_rate"], spec["timeout_seconds"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return faults.spec
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9010)
+    parser.add_argument("--latency", default="0", help='e.g. "uniform:20:200" (milliseconds)')
+    parser.add_argument("--errors", default="", help='e.g. "503:0.02,500:0.01"')
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of calls that hang")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0, help="how long a hung call hangs")
+    parser.add_argument("--webhook-url", help="deliver payment.captured webhooks here")
+    parser.add_argument("--seed", type=int, help="seed the fault and id generator")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    faults = Faults(args.latency, args.errors, args.timeout_rate, args.timeout_seconds)
+    uvicorn.run(create_app(faults, webhook_url=args.webhook_url), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# benchmarks/subscribe_contention.py
+"""Concurrent subscribe_to_plan calls on a few hot wallets, straight against Postgres.
+
+Usage:
+    python -m benchmarks.subscribe_contention [--wallet-id 1-10] [--plan-id 1]
+        [--requests 5000] [--concurrency 32] [--previous]
+
+Each call is its own transaction: SELECT * FROM subscribe_to_plan(...) and
+COMMIT. --previous runs the same load against the function as it was before
+185e34be7a8e (installed as subscribe_to_plan_previous for the run and dropped
+after), so the two can be compared on the same database. With the unique
+index in place the previous function's unlocked read-then-insert shows up as
+UniqueViolation errors rather than duplicate active subscriptions.
+
+Reports latency percentiles, calls per second, errors by type and how many
+wallets end with more than one active subscription. It subscribes and
+credits real wallets: point DATABASE_URL at a scratch database.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.database import engine
+
+PREVIOUS_NAME = "subscribe_to_plan_previous"
+
+DUPLICATE_ACTIVE = text("""
+    SELECT count(*)
+    FROM (
+        SELECT wallet_id
+        FROM subscription
+        WHERE is_active
+        GROUP BY wallet_id
+        HAVING count(*) > 1
+    ) d
+""")
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def _wallet_ids(spec: str) -> List[int]:
+    lo, _, hi = spec.partition("-")
+    return list(range(int(lo), int(hi or lo) + 1))
+
+
+def _previous_function() -> str:
+    """The b369fdc51172 subscribe_to_plan body, renamed."""
+    path = os.path.join(os.path.dirname(__file__), "..", "alembic", "versions", "b369fdc51172_money_in_paise.py")
+    spec = importlib.util.spec_from_file_location("money_in_paise", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SUBSCRIBE_TO_PLAN.format(money="BIGINT").replace(
+        "FUNCTION subscribe_to_plan(", f"FUNCTION {PREVIOUS_NAME}("
+    )
+
+
+def run(args) -> int:
+    function = PREVIOUS_NAME if args.previous else "subscribe_to_plan"
+    call = text(f"SELECT * FROM {function}(:wallet_id, :plan_id)")
+    wallet_ids = _wallet_ids(args.wallet_id)
+    timings: List[float] = []
+    errors: Counter = Counter()
+    remaining = iter(range(args.requests))
+    lock = threading.Lock()
+
+    def worker() -> None:
+        with engine.connect() as conn:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                started = time.perf_counter()
+                try:
+                    with conn.begin():
+                        conn.execute(call, {"wallet_id": random.choice(wallet_ids), "plan_id": args.plan_id}).fetchone()
+                except Exception as e:
+                    errors[type(getattr(e, "orig", e)).__name__] += 1
+                    continue
+                timings.append(time.perf_counter() - started)
+
+    if args.previous:
+        with engine.begin() as conn:
+            conn.execute(text(_previous_function()))
+
+    try:
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if args.previous:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP FUNCTION IF EXISTS {PREVIOUS_NAME}(INT, INT)"))
+
+    with engine.connect() as conn:
+        duplicates = conn.execute(DUPLICATE_ACTIVE).scalar()
+
+    print(
+        f"{function}: {len(timings)}/{args.requests} calls on {len(wallet_ids)} wallets "
+        f"in {elapsed:.1f}s ({len(timings) / elapsed:.1f}/s), concurrency {args.concurrency}"
+    )
+    print(
+        f"  p50={_percentile(timings, 50) * 1000:7.1f}ms p95={_percentile(timings, 95) * 1000:7.1f}ms "
+        f"p99={_percentile(timings, 99) * 1000:7.1f}ms max={max(timings, default=0) * 1000:7.1f}ms"
+    )
+    for error, count in sorted(errors.items()):
+        print(f"  {error:<28} {count}")
+    print(f"  wallets with more than one active subscription: {duplicates}")
+    return 0 if not errors and not duplicates else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wallet-id", default="1-10", help="wallet id or inclusive range, e.g. 1-10")
+    parser.add_argument("--plan-id", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--previous", action="store_true", help="benchmark the pre-185e34be7a8e function instead")
+    args = parser.parse_args(argv)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
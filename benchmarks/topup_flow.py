@@ -0,0 +1,126 @@
+# benchmarks/topup_flow.py
+"""Drive the fixed_checkout.html top-up flow against the API and the Razorpay stub.
+
+Usage:
+    python -m app.stubs.razorpay_stub --port 9010 &
+    RAZORPAY_USE_STUB=true uvicorn app.main:app --port 8000 &
+    python benchmarks/topup_flow.py [--api http://127.0.0.1:8000] [--stub http://127.0.0.1:9010/v1]
+        [--wallet-id 7] [--amount 50000] [--requests 1000] [--concurrency 50]
+
+Each top-up does what the page does, with the stub's pay endpoint standing
+in for the Checkout popup:
+
+    POST /wallet_transaction/create_order -> POST {stub}/orders/{id}/pay
+    -> POST /wallet_transaction/verify_and_credit
+
+Reports per-step latency percentiles, status codes and top-ups per second.
+Spread --wallet-id over a range (e.g. 1-100) to avoid a single hot wallet.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def _wallet_ids(spec: str) -> List[int]:
+    lo, _, hi = spec.partition("-")
+    return list(range(int(lo), int(hi or lo) + 1))
+
+
+async def _step(client: httpx.AsyncClient, name: str, url: str, body: dict, timings, statuses) -> Optional[dict]:
+    started = time.perf_counter()
+    try:
+        response = await client.post(url, json=body)
+    except httpx.HTTPError as e:
+        statuses[f"{name}:{type(e).__name__}"] += 1
+        return None
+    timings[name].append(time.perf_counter() - started)
+    statuses[f"{name}:{response.status_code}"] += 1
+    return response.json() if response.status_code < 400 else None
+
+
+async def topup(
+    client: httpx.AsyncClient,
+    api: str,
+    stub: str,
+    wallet_id: int,
+    amount: int,
+    timings: Dict[str, List[float]],
+    statuses: Counter
+) -> bool:
+    order = await _step(
+        client, "create_order", f"{api}/wallet_transaction/create_order",
+        {"wallet_id": wallet_id, "amount": amount}, timings, statuses
+    )
+    if order is None:
+        return False
+
+    # The Checkout popup: pay the order and get the handler's response
+    paid = await _step(client, "checkout", f"{stub}/orders/{order['order_id']}/pay", {}, timings, statuses)
+    if paid is None:
+        return False
+
+    credited = await _step(
+        client, "verify_and_credit", f"{api}/wallet_transaction/verify_and_credit",
+        {**paid, "wallet_id": order["wallet_id"], "amount": order["input_amount"]}, timings, statuses
+    )
+    return credited is not None
+
+
+async def run(args) -> int:
+    wallet_ids = _wallet_ids(args.wallet_id)
+    timings: Dict[str, List[float]] = defaultdict(list)
+    statuses: Counter = Counter()
+    succeeded = 0
+    remaining = iter(range(args.requests))
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal succeeded
+        for _ in remaining:
+            if await topup(client, args.api, args.stub, random.choice(wallet_ids), args.amount, timings, statuses):
+                succeeded += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{succeeded}/{args.requests} top-ups in {elapsed:.1f}s ({succeeded / elapsed:.1f}/s)")
+    for name, samples in timings.items():
+        print(
+            f"  {name:<18} n={len(samples):<6} p50={_percentile(samples, 50) * 1000:7.1f}ms "
+            f"p95={_percentile(samples, 95) * 1000:7.1f}ms p99={_percentile(samples, 99) * 1000:7.1f}ms"
+        )
+    for status, count in sorted(statuses.items()):
+        print(f"  {status:<28} {count}")
+    return 0 if succeeded == args.requests else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--stub", default="http://127.0.0.1:9010/v1")
+    parser.add_argument("--wallet-id", default="7", help="wallet id or inclusive range, e.g. 1-100")
+    parser.add_argument("--amount", type=int, default=50000, help="paise per top-up")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())